@@ -28,6 +28,14 @@ setup(
     keywords=['SSDB'],
     license='BSD-2',
     packages=['ssdb'],
+    entry_points={
+        'console_scripts': [
+            'ssdb-benchmark = ssdb.loadgen:main',
+            'ssdb-bulkload = ssdb.bulkload:main',
+            'ssdb-dump = ssdb.dump:main',
+            'ssdb-analyze = ssdb.analyzer:main',
+        ],
+    },
     classifiers=[
         'Development Status :: 5 - Production/Stable',
         'Environment :: Console',
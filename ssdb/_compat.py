@@ -56,6 +56,17 @@ try:
 except ImportError:
     from ssdb.utils import SortedDict as OrderedDict
 
+try:
+    # Python 3.3+
+    from collections.abc import Mapping, Sequence
+except ImportError:
+    from collections import Mapping, Sequence
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
 try:
     # Python 3
     from queue import LifoQueue, Empty, Full
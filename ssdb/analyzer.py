@@ -0,0 +1,384 @@
+#coding=utf-8
+"""
+Find the large keys, hashes, zsets and queues of a server.
+
+    $ ssdb-analyze -p 8888 --rate 2000 --sample 0.1 --top 20
+
+    >>> from ssdb import SSDB
+    >>> from ssdb.analyzer import KeyspaceAnalyzer
+    >>> analyzer = KeyspaceAnalyzer(SSDB(), types=['hash', 'zset'], rate=500)
+    >>> report = analyzer.analyze()
+    >>> report.top['hash'][:2]
+    [(1048576, 'sessions:all'), (20311, 'user:42:friends')]
+    >>> print(report.format())
+
+The names are walked page by page with ``keys``, ``hlist``, ``zlist`` and
+``qlist`` and the sizes of each page looked up by ``workers`` threads with
+one pipelined batch of ``strlen``, ``hsize``, ``zsize`` or ``qsize``.
+With ``sample``, only this fraction of the names, drawn at random, is
+measured. ``rate`` caps the commands sent per second, across all the
+threads, so an analysis can run against a production server.
+
+The size of a key is the length of its value in bytes and the size of a
+hash, zset or queue its number of items. `iter_sizes`_ streams the
+``(type, name, size)`` found as they arrive and `analyze`_ gathers them in a
+`KeyspaceReport`_: the count, total and histogram of sizes of every type and
+key prefix (the name up to its ``depth``-th ``separator``), and the ``top``
+largest structures of every type.
+"""
+from __future__ import with_statement
+import heapq
+import json
+import optparse
+import random
+import sys
+import threading
+import time as mod_time
+from ssdb._compat import (OrderedDict, Queue, Empty, Full, nativestr,
+                          unicode)
+from ssdb.client import StrictSSDB
+from ssdb.utils import get_choice, get_positive_integer, prefix_end
+
+TYPES = ('kv', 'hash', 'zset', 'queue')
+LIST_COMMANDS = {'kv': 'keys', 'hash': 'hlist', 'zset': 'zlist',
+                 'queue': 'qlist'}
+REVERSE_LIST_COMMANDS = {'hash': 'hrlist', 'zset': 'zrlist',
+                         'queue': 'qrlist'}
+SIZE_COMMANDS = {'kv': 'strlen', 'hash': 'hsize', 'zset': 'zsize',
+                 'queue': 'qsize'}
+
+_DONE = object()
+
+
+def _to_bytes(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+def bucket(size):
+    "Return the bucket ``n`` of ``size``, ``2**(n-1) <= size < 2**n``"
+    return int(size).bit_length()
+
+
+def bucket_label(index):
+    if index == 0:
+        return '0'
+    low, high = 1 << (index - 1), (1 << index) - 1
+    return str(low) if low == high else '%d-%d' % (low, high)
+
+
+class KeyspaceReport(object):
+    """
+    Counts, totals and histograms of the sizes per type and prefix and the
+    ``top`` largest structures of every type
+    """
+
+    def __init__(self, top=20, separator=':', depth=1):
+        self.top_size = get_positive_integer('top', top)
+        self.separator = separator
+        self.depth = get_positive_integer('depth', depth)
+        # (type, prefix) -> [count, total, {bucket: count}]
+        self.prefixes = {}
+        self._top = dict((type, []) for type in TYPES)
+
+    def prefix(self, name):
+        "Return the prefix ``name`` is counted under"
+        parts = name.split(self.separator)
+        if len(parts) <= self.depth:
+            return ''
+        return self.separator.join(parts[:self.depth]) + self.separator
+
+    def add(self, type, name, size):
+        name = nativestr(name)
+        key = (type, self.prefix(name))
+        stats = self.prefixes.get(key)
+        if stats is None:
+            stats = self.prefixes[key] = [0, 0, {}]
+        stats[0] += 1
+        stats[1] += size
+        index = bucket(size)
+        stats[2][index] = stats[2].get(index, 0) + 1
+        top = self._top[type]
+        if len(top) < self.top_size:
+            heapq.heappush(top, (size, name))
+        elif size > top[0][0]:
+            heapq.heapreplace(top, (size, name))
+
+    @property
+    def top(self):
+        "The largest structures of every type, ``(size, name)`` largest first"
+        return dict((type, sorted(top, reverse=True))
+                    for type, top in self._top.items())
+
+    def totals(self):
+        "Return ``{type: (count, total size)}``"
+        totals = dict((type, (0, 0)) for type in TYPES)
+        for (type, prefix), (count, total, histogram) in self.prefixes.items():
+            totals[type] = (totals[type][0] + count, totals[type][1] + total)
+        return totals
+
+    def summary(self):
+        "Return the report as a JSON-serializable dict"
+        prefixes = {}
+        for (type, prefix), (count, total, histogram) in sorted(
+                self.prefixes.items()):
+            prefixes.setdefault(type, OrderedDict())[prefix] = {
+                'count': count, 'total': total,
+                'histogram': OrderedDict(
+                    (bucket_label(i), histogram[i])
+                    for i in sorted(histogram)),
+            }
+        return {'totals': self.totals(), 'prefixes': prefixes,
+                'top': self.top}
+
+    def format(self):
+        "Return the report as text"
+        lines = []
+        totals = self.totals()
+        top = self.top
+        for type in TYPES:
+            count, total = totals[type]
+            if not count:
+                continue
+            unit = 'bytes' if type == 'kv' else 'items'
+            lines.append('%s: %d, %d %s' % (type, count, total, unit))
+            for (kind, prefix), (count, total, histogram) in sorted(
+                    self.prefixes.items()):
+                if kind != type:
+                    continue
+                lines.append('  %-30s %10d %14d %s' % (
+                    prefix or '(no prefix)', count, total, unit))
+                lines.append('    ' + '  '.join(
+                    '%s:%d' % (bucket_label(i), histogram[i])
+                    for i in sorted(histogram)))
+            lines.append('  largest:')
+            for size, name in top[type]:
+                lines.append('    %14d  %s' % (size, name))
+        return '\n'.join(lines)
+
+
+class KeyspaceAnalyzer(object):
+    """
+    Measure the keys and structures of ``ssdb`` of the ``types`` whose
+    names start with ``prefix``
+    """
+
+    def __init__(self, ssdb, prefix='', types=TYPES, page_size=1000,
+                 sample=None, rate=None, workers=4, top=20, separator=':',
+                 depth=1, seed=None):
+        self.ssdb = ssdb
+        self.prefix = prefix
+        for type in types:
+            get_choice('types', type, TYPES)
+        self.types = types
+        self.page_size = get_positive_integer('page_size', page_size)
+        if sample is not None and not 0 < sample <= 1:
+            raise ValueError('``sample`` must be in ]0, 1]')
+        self.sample = sample
+        if rate is not None and rate <= 0:
+            raise ValueError('``rate`` must be positive')
+        self.rate = rate
+        self.workers = get_positive_integer('workers', workers)
+        self.report_options = {'top': top, 'separator': separator,
+                               'depth': depth}
+        self.random = random.Random(seed)
+        self._next_time = 0
+        self._rate_lock = threading.Lock()
+        self._time = mod_time.time
+        self._sleep = mod_time.sleep
+
+    def throttle(self, commands):
+        """
+        Wait until ``commands`` more commands can be sent within ``rate``
+        """
+        if self.rate is None:
+            return
+        with self._rate_lock:
+            now = self._time()
+            start = max(self._next_time, now)
+            self._next_time = start + commands / float(self.rate)
+        if start > now:
+            self._sleep(start - now)
+
+    def pages(self):
+        "Yield the ``(type, names)`` pages of names to measure"
+        # the listings skip a name equal to ``prefix``, found on its own
+        # from just above it, and may end with ``end``, which is left out
+        end = prefix_end(self.prefix) if self.prefix else ''
+        for type in self.types:
+            start = self.prefix
+            found = []
+            if start:
+                self.throttle(1)
+                first = _to_bytes(start) + b'\x00'
+                if type == 'kv':
+                    found = list(self.ssdb.execute_command(
+                        'rscan', first, start, 1, result_format='pairs')[0])
+                else:
+                    found = self.ssdb.execute_command(
+                        REVERSE_LIST_COMMANDS[type], first, start, 1)
+            while True:
+                self.throttle(1)
+                names = self.ssdb.execute_command(
+                    LIST_COMMANDS[type], start, end, self.page_size)
+                listed = names
+                if names and end and _to_bytes(names[-1]) == end:
+                    listed = names[:-1]
+                listed, found = found + listed, []
+                if self.sample is not None:
+                    measured = [name for name in listed
+                                if self.random.random() < self.sample]
+                else:
+                    measured = listed
+                if measured:
+                    yield type, measured
+                if len(names) < self.page_size:
+                    break
+                start = names[-1]
+
+    def sizes(self, type, names):
+        "Return the sizes of ``names``, looked up in one batch"
+        self.throttle(len(names))
+        batch = self.ssdb.batch()
+        for name in names:
+            batch.execute_command(SIZE_COMMANDS[type], name)
+        return [size or 0 for size in batch.execute()]
+
+    def iter_sizes(self):
+        """
+        Yield ``(type, name, size)`` for every structure measured, as the
+        workers find them
+        """
+        tasks = Queue(self.workers * 2)
+        results = Queue(self.workers * 2)
+        stop = threading.Event()
+
+        def put(queue, item):
+            while not stop.is_set():
+                try:
+                    queue.put(item, timeout=0.1)
+                    return True
+                except Full:
+                    pass
+            return False
+
+        def produce():
+            try:
+                for page in self.pages():
+                    if not put(tasks, page):
+                        return
+            except Exception:
+                put(results, sys.exc_info()[1])
+            for _ in range(self.workers):
+                put(tasks, _DONE)
+
+        def work():
+            while not stop.is_set():
+                try:
+                    task = tasks.get(timeout=0.1)
+                except Empty:
+                    continue
+                if task is _DONE:
+                    break
+                type, names = task
+                try:
+                    sizes = self.sizes(type, names)
+                except Exception:
+                    put(results, sys.exc_info()[1])
+                    continue
+                put(results, [(type, name, size)
+                              for name, size in zip(names, sizes)])
+            put(results, _DONE)
+
+        threads = [threading.Thread(target=produce)]
+        threads.extend(threading.Thread(target=work)
+                       for _ in range(self.workers))
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        try:
+            done = 0
+            while done < self.workers:
+                result = results.get()
+                if result is _DONE:
+                    done += 1
+                elif isinstance(result, Exception):
+                    raise result
+                else:
+                    for item in result:
+                        yield item
+        finally:
+            stop.set()
+
+    def analyze(self, callback=None):
+        """
+        Measure the keyspace and return a `KeyspaceReport`_, calling
+        ``callback(type, name, size)`` for every structure measured
+        """
+        report = KeyspaceReport(**self.report_options)
+        for type, name, size in self.iter_sizes():
+            report.add(type, name, size)
+            if callback is not None:
+                callback(type, name, size)
+        return report
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage='ssdb-analyze [options]')
+    parser.add_option('-H', '--host', default='127.0.0.1',
+                      help='server host [%default]')
+    parser.add_option('-p', '--port', type='int', default=8888,
+                      help='server port [%default]')
+    parser.add_option('--prefix', default='',
+                      help='only measure the names with this prefix')
+    parser.add_option('-t', '--type', action='append', choices=TYPES,
+                      help='only measure this type, kv, hash, zset or queue')
+    parser.add_option('--sample', type='float',
+                      help='fraction of the names measured [all]')
+    parser.add_option('--rate', type='float',
+                      help='maximum commands per second [no limit]')
+    parser.add_option('--workers', type='int', default=4,
+                      help='threads looking up the sizes [%default]')
+    parser.add_option('--page-size', type='int', default=1000,
+                      help='names per page and per batch [%default]')
+    parser.add_option('--top', type='int', default=20,
+                      help='largest structures listed per type [%default]')
+    parser.add_option('--separator', default=':',
+                      help='separator of the name prefixes [%default]')
+    parser.add_option('--depth', type='int', default=1,
+                      help='separators in the prefixes [%default]')
+    parser.add_option('-o', '--output', metavar='PATH',
+                      help='stream every size found to PATH as JSONL')
+    parser.add_option('--json', action='store_true',
+                      help='print the report as JSON')
+    options, args = parser.parse_args(argv)
+    if args:
+        parser.error('unexpected arguments %s' % ' '.join(args))
+    try:
+        analyzer = KeyspaceAnalyzer(
+            StrictSSDB(host=options.host, port=options.port),
+            prefix=options.prefix, types=options.type or TYPES,
+            page_size=options.page_size, sample=options.sample,
+            rate=options.rate, workers=options.workers, top=options.top,
+            separator=options.separator, depth=options.depth)
+    except ValueError:
+        parser.error(str(sys.exc_info()[1]))
+    output = open(options.output, 'w') if options.output else None
+    try:
+        def stream(type, name, size):
+            output.write(json.dumps({'type': type, 'name': nativestr(name),
+                                     'size': size}) + '\n')
+        report = analyzer.analyze(stream if output else None)
+    finally:
+        if output is not None:
+            output.close()
+    if options.json:
+        print(json.dumps(report.summary(), indent=2))
+    else:
+        print(report.format())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
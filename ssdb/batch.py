@@ -1,6 +1,7 @@
 #coding=utf-8
+import sys
 from itertools import starmap
-from ssdb._compat import b
+from ssdb._compat import b, imap, unicode
 from ssdb.exceptions import (
     ConnectionError,
     DataError,
@@ -15,10 +16,15 @@ SYM_EMPTY = b('')
 
 class BaseBatch(object):
 
-    def __init__(self, connection_pool, response_callbacks):
+    def __init__(self, connection_pool, response_callbacks, codec=None,
+                 result_format='dict', slowlog=None, negative_cache=None):
         self.connection_pool = connection_pool
         self.connection = None
         self.response_callbacks = response_callbacks
+        self.codec = codec
+        self.result_format = result_format
+        self.slowlog = slowlog
+        self.negative_cache = negative_cache
         self.reset()
 
     def __enter__(self):
@@ -43,6 +49,10 @@ class BaseBatch(object):
             self.connection = None
 
     def execute_command(self, *args, **kwargs):
+        if self.slowlog is not None:
+            self.slowlog.check(args)
+        if self.negative_cache is not None:
+            self.negative_cache.write(args)
         return self.pipeline_execute_command(*args, **kwargs)
 
     def pipeline_execute_command(self, *args, **options):
@@ -50,6 +60,10 @@ class BaseBatch(object):
         return self
 
     def _execute_pipeline(self, connection, commands, raise_on_error):
+        slowlog = self.slowlog
+        if slowlog is not None:
+            start = slowlog.timer()
+            sizes = []
         # build up all commands into a single request to increase network perf
         all_cmds = SYM_EMPTY.join(
             starmap(connection.pack_command,
@@ -58,19 +72,29 @@ class BaseBatch(object):
 
         response = []
         for args, options in commands:
+            if slowlog is not None:
+                options = dict(options, reply_sizes=sizes)
             try:
                 response.append(
                     self.parse_response(connection, args[0], **options))
-            except ResponseError:
+            except (ResponseError, DataError):
+                # read the other replies, the connection stays usable
                 response.append(sys.exc_info()[1])
 
+        if slowlog is not None:
+            slowlog.record(
+                ('batch',) + tuple(args[0] for args, options in commands),
+                slowlog.timer() - start,
+                (sum(size[0] for size in sizes),
+                 sum(size[1] for size in sizes)))
+
         if raise_on_error:
             self.raise_first_error(commands, response)
         return response
 
     def raise_first_error(self, commands, response):
         for i, r in enumerate(response):
-            if isinstance(r, ResponseError):
+            if isinstance(r, (ResponseError, DataError)):
                 self.annotate_exception(r, i + 1, commands[i][0])
                 raise r
 
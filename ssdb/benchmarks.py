@@ -0,0 +1,378 @@
+#coding=utf-8
+"""
+Benchmarks of the client hot paths.
+
+    $ python -m ssdb.benchmarks --json baseline.json
+    $ python -m ssdb.benchmarks --compare baseline.json
+
+The ``micro`` benchmarks time the client code alone: packing commands,
+parsing canned replies of several sizes, turning replies into dicts and
+getting connections from a pool shared by several threads. The ``e2e``
+benchmarks time whole commands, batches, ``multi_*`` commands and scans
+against the server at ``--host``:``--port``, or an in-process
+`FakeServer` when no server is given (which measures the client rather than
+SSDB). They only touch keys, hashes and zsets prefixed with ``PREFIX``, and
+delete them when done.
+
+Each benchmark is run in rounds of at least ``min_time`` seconds and the best
+of ``repeat`` rounds is kept. ``ops_per_sec`` counts the keys or values
+handled, so a batch of 100 ``set`` is 100 ops. A run saved with ``--json``
+can be passed to ``--compare`` later: benchmarks slower than the baseline by
+more than ``--threshold`` are reported and make the exit status 1.
+"""
+from __future__ import with_statement
+import json
+import optparse
+import platform
+import sys
+import threading
+import timeit
+from ssdb._compat import OrderedDict, b, xrange
+from ssdb.client import StrictSSDB, list_to_ordereddict, list_to_int_ordereddict
+from ssdb.connection import (BlockingConnectionPool, Connection,
+                             ConnectionPool, PythonParser, SocketBuffer)
+from ssdb.utils import get_positive_integer
+
+PREFIX = '__ssdb_benchmark__:'
+GROUPS = ('micro', 'e2e')
+
+# name -> (group, setup), setup(client) returning ``(run, ops)``
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(name, group='micro'):
+    "Register the decorated setup function as the benchmark ``name``"
+    def register(setup):
+        BENCHMARKS[name] = (group, setup)
+        return setup
+    return register
+
+
+class CannedSocket(object):
+    "A socket receiving the same ``data`` over and over"
+
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def recv(self, size):
+        chunk = self.data[self.pos:self.pos + size]
+        self.pos += len(chunk)
+        if self.pos == len(self.data):
+            self.pos = 0
+        return chunk
+
+    def close(self):
+        pass
+
+
+def canned_parser(values):
+    "Return a `PythonParser` reading the reply ``ok, *values`` forever"
+    from ssdb.fakeserver import pack_reply
+    sock = CannedSocket(pack_reply([b('ok')] + values))
+    parser = PythonParser(socket_read_size=65536)
+    parser._sock = sock
+    parser._buffer = SocketBuffer(sock, 65536)
+    return parser
+
+
+def flat_pairs(count):
+    pairs = []
+    for i in xrange(count):
+        pairs.extend((b('key:%08d' % i), b(str(i))))
+    return pairs
+
+
+#### MICRO ####
+@benchmark('pack_command')
+def pack_command(client):
+    connection = Connection()
+    return lambda: connection.pack_command('set', 'key:1', 'value'), 1
+
+
+@benchmark('pack_command_100_args')
+def pack_command_100_args(client):
+    connection = Connection()
+    args = ['multi_set'] + ['key:%d' % i for i in xrange(100)]
+    return lambda: connection.pack_command(*args), 100
+
+
+def _parse(values):
+    parser = canned_parser(values)
+    return parser.read_response, max(len(values), 1)
+
+
+@benchmark('parse_status')
+def parse_status(client):
+    return _parse([b('1')])
+
+
+@benchmark('parse_100x16B')
+def parse_100(client):
+    return _parse([b('x') * 16] * 100)
+
+
+@benchmark('parse_1000x128B')
+def parse_1000(client):
+    return _parse([b('x') * 128] * 1000)
+
+
+@benchmark('parse_1x1MB')
+def parse_1m(client):
+    return _parse([b('x') * (1 << 20)])
+
+
+@benchmark('list_to_ordereddict_1000')
+def ordereddict(client):
+    pairs = flat_pairs(1000)
+    return lambda: list_to_ordereddict(pairs), 1000
+
+
+@benchmark('list_to_int_ordereddict_1000')
+def int_ordereddict(client):
+    pairs = flat_pairs(1000)
+    return lambda: list_to_int_ordereddict(pairs), 1000
+
+
+def _pool(pool, threads, loops=1000):
+    def work():
+        for _ in xrange(loops):
+            pool.release(pool.get_connection('get'))
+
+    def run():
+        workers = [threading.Thread(target=work) for _ in xrange(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    return run, threads * loops
+
+
+@benchmark('pool_get_release_1_thread')
+def pool_1(client):
+    return _pool(ConnectionPool(), 1)
+
+
+@benchmark('pool_get_release_8_threads')
+def pool_8(client):
+    return _pool(ConnectionPool(), 8)
+
+
+@benchmark('blocking_pool_get_release_8_threads')
+def blocking_pool_8(client):
+    return _pool(BlockingConnectionPool(max_connections=8), 8)
+
+
+#### END TO END ####
+def _keys(count):
+    return ['%skey:%08d' % (PREFIX, i) for i in xrange(count)]
+
+
+@benchmark('set', 'e2e')
+def e2e_set(client):
+    return lambda: client.set(PREFIX + 'key', 'value'), 1
+
+
+@benchmark('get', 'e2e')
+def e2e_get(client):
+    client.set(PREFIX + 'key', 'value')
+    return lambda: client.get(PREFIX + 'key'), 1
+
+
+@benchmark('batch_set_100', 'e2e')
+def e2e_batch(client):
+    keys = _keys(100)
+
+    def run():
+        batch = client.batch()
+        for key in keys:
+            batch.set(key, 'value')
+        batch.execute()
+    return run, 100
+
+
+@benchmark('multi_set_100', 'e2e')
+def e2e_multi_set(client):
+    kvs = dict.fromkeys(_keys(100), 'value')
+    return lambda: client.multi_set(**kvs), 100
+
+
+@benchmark('multi_get_100', 'e2e')
+def e2e_multi_get(client):
+    keys = _keys(100)
+    client.multi_set(**dict.fromkeys(keys, 'value'))
+    return lambda: client.multi_get(*keys), 100
+
+
+@benchmark('scan_1000', 'e2e')
+def e2e_scan(client):
+    client.multi_set(**dict.fromkeys(_keys(1000), 'value'))
+    return lambda: client.scan(PREFIX, PREFIX + '\xff', 1000), 1000
+
+
+@benchmark('hgetall_1000', 'e2e')
+def e2e_hgetall(client):
+    client.multi_hset(PREFIX + 'hash', **dict.fromkeys(_keys(1000), 'value'))
+    return lambda: client.hgetall(PREFIX + 'hash'), 1000
+
+
+@benchmark('zscan_1000', 'e2e')
+def e2e_zscan(client):
+    client.multi_zset(PREFIX + 'zset',
+                      **dict((key, i) for i, key in enumerate(_keys(1000))))
+    return lambda: client.zscan(PREFIX + 'zset', '', '', '', 1000), 1000
+
+
+def cleanup(client):
+    "Delete what the ``e2e`` benchmarks wrote"
+    while True:
+        keys = client.keys(PREFIX, PREFIX + '\xff', 1000)
+        if not keys:
+            break
+        client.multi_del(*keys)
+    client.hclear(PREFIX + 'hash')
+    client.zclear(PREFIX + 'zset')
+
+
+def measure(run, ops, min_time=0.2, repeat=3):
+    """
+    Time ``run`` in rounds of at least ``min_time`` seconds and return the
+    best of ``repeat`` rounds as ``{'ops_per_sec', 'usec_per_op'}``
+    """
+    timer = timeit.default_timer
+    number, best = 1, None
+    rounds = 0
+    while rounds < repeat:
+        start = timer()
+        for _ in xrange(number):
+            run()
+        elapsed = timer() - start
+        if elapsed < min_time and best is None:
+            # still calibrating the number of runs per round
+            number *= 2
+            continue
+        rounds += 1
+        per_op = elapsed / (number * ops)
+        best = per_op if best is None else min(best, per_op)
+    return {'ops_per_sec': 1.0 / best if best else float('inf'),
+            'usec_per_op': best * 1e6}
+
+
+def run(names=None, groups=GROUPS, client=None, min_time=0.2, repeat=3):
+    """
+    Run the benchmarks named ``names`` (all by default) of ``groups`` and
+    return the results as a JSON-serializable dict. The ``e2e`` benchmarks
+    are skipped without a ``client``.
+    """
+    repeat = get_positive_integer('repeat', repeat)
+    results = OrderedDict()
+    try:
+        for name, (group, setup) in BENCHMARKS.items():
+            if group not in groups or (names and name not in names):
+                continue
+            if group == 'e2e' and client is None:
+                continue
+            result = measure(*setup(client), min_time=min_time,
+                             repeat=repeat)
+            result['group'] = group
+            results[name] = result
+    finally:
+        if client is not None and 'e2e' in groups:
+            cleanup(client)
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'results': results,
+    }
+
+
+def compare(results, baseline, threshold=0.1):
+    """
+    Compare ``results`` to the ``baseline`` results of an earlier run, return
+    a list of ``(name, baseline ops/s, ops/s, ratio, regressed)`` for the
+    benchmarks of both, ``regressed`` when slower by more than ``threshold``
+    """
+    rows = []
+    previous = baseline['results']
+    for name, result in results['results'].items():
+        if name not in previous:
+            continue
+        before = previous[name]['ops_per_sec']
+        after = result['ops_per_sec']
+        ratio = after / before
+        rows.append((name, before, after, ratio, ratio < 1 - threshold))
+    return rows
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(
+        usage='python -m ssdb.benchmarks [options] [benchmark ...]')
+    parser.add_option('-H', '--host', help='SSDB host, a fake server is '
+                      'started when neither --host nor --port is given')
+    parser.add_option('-p', '--port', type='int', help='SSDB port')
+    parser.add_option('-g', '--group', action='append', choices=GROUPS,
+                      help='only run this group (micro or e2e)')
+    parser.add_option('--min-time', type='float', default=0.2,
+                      help='minimum seconds per round [%default]')
+    parser.add_option('--repeat', type='int', default=3,
+                      help='rounds per benchmark [%default]')
+    parser.add_option('--json', metavar='PATH',
+                      help='write the results as JSON to PATH')
+    parser.add_option('--compare', metavar='PATH',
+                      help='compare the results to the JSON baseline at PATH')
+    parser.add_option('--threshold', type='float', default=0.1,
+                      help='slowdown reported as a regression [%default]')
+    parser.add_option('-l', '--list', action='store_true',
+                      help='list the benchmarks and exit')
+    options, names = parser.parse_args(argv)
+    if options.list:
+        for name, (group, setup) in BENCHMARKS.items():
+            print('%-40s %s' % (name, group))
+        return 0
+    for name in names:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark %r' % name)
+    groups = options.group or GROUPS
+
+    server = None
+    client = None
+    if 'e2e' in groups:
+        if options.host is None and options.port is None:
+            from ssdb.fakeserver import FakeServer
+            server = FakeServer().start()
+            options.host, options.port = server.address
+        client = StrictSSDB(host=options.host or '127.0.0.1',
+                            port=options.port or 8888)
+    try:
+        results = run(names, groups, client, options.min_time, options.repeat)
+    finally:
+        if server is not None:
+            server.stop()
+    if client is not None:
+        results['server'] = 'fake' if server else '%s:%s' % (
+            options.host or '127.0.0.1', options.port or 8888)
+
+    for name, result in results['results'].items():
+        print('%-40s %14.1f ops/s %10.3f usec/op' % (
+            name, result['ops_per_sec'], result['usec_per_op']))
+    if options.json:
+        with open(options.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    status = 0
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)
+        print('')
+        for name, before, after, ratio, regressed in compare(
+                results, baseline, options.threshold):
+            print('%-40s %14.1f -> %14.1f ops/s  x%.2f%s' % (
+                name, before, after, ratio, '  REGRESSION' if regressed
+                else ''))
+            if regressed:
+                status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,287 @@
+#coding=utf-8
+"""
+Bulk bit operations on SSDB string values.
+
+    >>> from ssdb import SSDB
+    >>> from ssdb.bitmap import Bitmap
+    >>> active = Bitmap(SSDB(), 'active:2016-01-01')
+    >>> active.setbits([3, 17, 1000000])
+    [False, False, False]
+    >>> bits = active.fetch()
+    >>> bits.count(), bits.find(), list(bits.positions())
+    (3, 3, [3, 17, 1000000])
+
+SSDB numbers the bits of a value from the least significant bit of its first
+byte: bit ``offset`` is bit ``offset % 8`` of byte ``offset // 8``.
+
+`setbits`_ and `getbits`_ pipeline any number of offsets in one batch. For
+whole bitmaps `fetch`_ reads the value once and returns a `BitArray`, on
+which population counts, bit searches and AND/OR/XOR run locally (with
+``numpy`` when it's installed) and whose changes `store`_ writes back in
+one batch.
+"""
+import binascii
+from ssdb._compat import b
+from ssdb.exceptions import DataError
+from ssdb.utils import get_nonnegative_integer
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def _to_int(data):
+    return int(binascii.hexlify(data) or b('0'), 16)
+
+
+def _from_int(value, size):
+    if not size:
+        return b('')
+    return binascii.unhexlify(b('%0*x' % (size * 2, value)))
+
+
+def _padded(values):
+    size = max(len(value) for value in values)
+    return [bytes(value) + b('\x00') * (size - len(value))
+            for value in values], size
+
+
+def _bitop(op, values):
+    """
+    Combine byte strings with ``op`` (``and``, ``or`` or ``xor``), shorter
+    values being padded with zero bytes like SSDB does
+    """
+    if not values:
+        return b('')
+    values, size = _padded(values)
+    if numpy is not None:
+        func = {'and': numpy.bitwise_and, 'or': numpy.bitwise_or,
+                'xor': numpy.bitwise_xor}.get(op)
+        if func is None:
+            raise DataError("Unknown bit operation %r" % op)
+        return func.reduce([numpy.frombuffer(value, numpy.uint8)
+                            for value in values]).tobytes()
+    if op == 'and':
+        result = -1
+        for value in values:
+            result &= _to_int(value)
+    elif op == 'or':
+        result = 0
+        for value in values:
+            result |= _to_int(value)
+    elif op == 'xor':
+        result = 0
+        for value in values:
+            result ^= _to_int(value)
+    else:
+        raise DataError("Unknown bit operation %r" % op)
+    return _from_int(result & ((1 << size * 8) - 1), size)
+
+
+def _popcount(data):
+    if numpy is not None:
+        return int(numpy.unpackbits(numpy.frombuffer(data, numpy.uint8)).sum())
+    return bin(_to_int(data)).count('1')
+
+
+def _lowest_bit(byte):
+    return (byte & -byte).bit_length() - 1
+
+
+class BitArray(object):
+    """
+    A bitmap value held locally, with the bit numbering of SSDB. It remembers
+    the value it was created from so `changes`_ can tell what to write back,
+    and with ``offset`` that it's the slice of a bitmap starting at this
+    byte: its bit ``n`` is the bit ``offset * 8 + n`` of the bitmap.
+    """
+
+    def __init__(self, data=b(''), offset=None):
+        self.data = bytearray(data)
+        self.original = bytes(data)
+        self.offset = offset
+
+    def __len__(self):
+        "Number of bits, a multiple of 8"
+        return len(self.data) * 8
+
+    def __eq__(self, other):
+        if isinstance(other, BitArray):
+            return self.data == other.data
+        return NotImplemented
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __getitem__(self, offset):
+        index = offset >> 3
+        if index >= len(self.data):
+            return False
+        return bool(self.data[index] & (1 << (offset & 7)))
+
+    def __setitem__(self, offset, value):
+        offset = get_nonnegative_integer('offset', offset)
+        index = offset >> 3
+        if index >= len(self.data):
+            if not value:
+                return
+            self.data.extend(b('\x00') * (index + 1 - len(self.data)))
+        if value:
+            self.data[index] |= 1 << (offset & 7)
+        else:
+            self.data[index] &= ~(1 << (offset & 7)) & 0xff
+
+    def __and__(self, other):
+        return BitArray(_bitop('and', [self.data, other.data]))
+
+    def __or__(self, other):
+        return BitArray(_bitop('or', [self.data, other.data]))
+
+    def __xor__(self, other):
+        return BitArray(_bitop('xor', [self.data, other.data]))
+
+    def tobytes(self):
+        return bytes(self.data)
+
+    def count(self):
+        """
+        Return the number of bits set
+        """
+        return _popcount(bytes(self.data))
+
+    def find(self, bit=1, start=0):
+        """
+        Return the offset of the first bit equal to ``bit`` at or after
+        ``start``, or -1. Like Redis ``BITPOS`` the value is considered
+        padded with zero bits on the right when looking for a clear bit.
+        """
+        start = get_nonnegative_integer('start', start)
+        for offset in range(start, min((start | 7) + 1, len(self))):
+            if self[offset] == bool(bit):
+                return offset
+        index = (start >> 3) + 1
+        skip = b('\xff') if not bit else b('\x00')
+        rest = bytes(self.data[index:])
+        index += len(rest) - len(rest.lstrip(skip))
+        if index >= len(self.data):
+            return -1 if bit else max(len(self), start)
+        byte = self.data[index]
+        return index * 8 + _lowest_bit(byte if bit else ~byte & 0xff)
+
+    def positions(self):
+        """
+        Iterate over the offsets of the bits set, in order
+        """
+        if numpy is not None:
+            bits = numpy.unpackbits(numpy.frombuffer(bytes(self.data),
+                                                     numpy.uint8))
+            # unpackbits is big endian within each byte
+            bits = bits.reshape(-1, 8)[:, ::-1].ravel()
+            for offset in numpy.flatnonzero(bits):
+                yield int(offset)
+            return
+        for index, byte in enumerate(self.data):
+            while byte:
+                lowest = byte & -byte
+                yield index * 8 + lowest.bit_length() - 1
+                byte ^= lowest
+
+    def changes(self):
+        """
+        Return the ``(offset, bit)`` pairs that differ from the value the
+        array was created from
+        """
+        changed = BitArray(_bitop('xor', [self.original, bytes(self.data)]))
+        return [(offset, self[offset]) for offset in changed.positions()]
+
+
+class Bitmap(object):
+    """
+    A bitmap stored in the SSDB key ``name``.
+    """
+
+    def __init__(self, ssdb, name):
+        self.ssdb = ssdb
+        self.name = name
+
+    def getbits(self, offsets):
+        """
+        Return the bits at ``offsets`` as a list of booleans, read in one
+        batch
+        """
+        offsets = list(offsets)
+        if not offsets:
+            return []
+        batch = self.ssdb.batch()
+        for offset in offsets:
+            batch.getbit(self.name, offset)
+        return batch.execute()
+
+    def setbits(self, offsets, value=True):
+        """
+        Set the bits at ``offsets`` to ``value`` in one batch and return their
+        previous values
+        """
+        offsets = list(offsets)
+        if not offsets:
+            return []
+        batch = self.ssdb.batch()
+        for offset in offsets:
+            batch.setbit(self.name, offset, value)
+        return batch.execute()
+
+    def count(self):
+        """
+        Return the number of bits set, counted by the server
+        """
+        return self.ssdb.countbit(self.name)
+
+    def fetch(self, start=None, size=None):
+        """
+        Read the bitmap, or ``size`` bytes of it from byte ``start`` with
+        ``substr``, into a `BitArray`
+        """
+        if start is None and size is None:
+            data = self.ssdb.execute_command('get', self.name)
+            return BitArray(data or b(''))
+        start = get_nonnegative_integer('start', start or 0)
+        data = self.ssdb.substr(self.name, start, size)
+        return BitArray(data or b(''), offset=start)
+
+    def store(self, bits, max_setbits=None):
+        """
+        Write the changes made to ``bits`` since it was fetched. Up to
+        ``max_setbits`` changed bits (by default one per byte of the value)
+        are sent as a batch of ``setbit``, keeping the bits written
+        concurrently by other clients; beyond that the whole value is
+        replaced with ``set``, unless ``bits`` is a slice of the bitmap.
+        Return the number of bits changed.
+        """
+        changes = bits.changes()
+        if not changes:
+            return 0
+        if max_setbits is None:
+            max_setbits = len(bits.data)
+        if len(changes) > max_setbits and bits.offset is None:
+            self.ssdb.execute_command('set', self.name, bits.tobytes())
+        else:
+            base = (bits.offset or 0) * 8
+            batch = self.ssdb.batch()
+            for offset, value in changes:
+                batch.setbit(self.name, base + offset, value)
+            batch.execute()
+        bits.original = bits.tobytes()
+        return len(changes)
+
+
+def bitop(ssdb, op, dest, *names):
+    """
+    Store in ``dest`` the ``op`` (``and``, ``or`` or ``xor``) of the bitmaps
+    ``names``, read with one ``multi_get`` and combined locally, like Redis
+    ``BITOP``. Return the size in bytes of the result.
+    """
+    values = ssdb.execute_command('multi_get', *names)
+    data = _bitop(op, [values.get(name) or b('') for name in names])
+    ssdb.execute_command('set', dest, data)
+    return len(data)
@@ -0,0 +1,319 @@
+#coding=utf-8
+"""
+Bloom filters stored in SSDB bitmaps.
+
+    >>> from ssdb import SSDB
+    >>> from ssdb.bloom import BloomFilter
+    >>> seen = BloomFilter(SSDB(), 'events:seen', capacity=1000000,
+    ...                    error_rate=0.001)
+    >>> seen.add('event-1')
+    True
+    >>> 'event-1' in seen, 'event-2' in seen
+    (True, False)
+
+The bit positions of an item are computed locally, by double hashing of its
+MD5 digest, so an add is one batch of ``setbit`` and a lookup one batch of
+``getbit``. `add_many`_ and `contains_many`_ put the bits of ``batch_size``
+items in each batch.
+
+`LocalBloomFilter`_ is the same filter held in the memory of the process.
+"""
+import hashlib
+import math
+import struct
+from ssdb._compat import bytes, unicode
+from ssdb.utils import get_positive_integer
+
+
+def _to_bytes(item):
+    if isinstance(item, bytes):
+        return item
+    return unicode(item).encode('utf-8')
+
+
+def _size(capacity, error_rate):
+    "Return the number of bits and of hashes of a filter"
+    if not 0 < error_rate < 1:
+        raise ValueError('``error_rate`` must be between 0 and 1')
+    num_bits = int(math.ceil(
+        -capacity * math.log(error_rate) / math.log(2) ** 2))
+    num_hashes = max(1, int(round(num_bits / float(capacity) * math.log(2))))
+    return num_bits, num_hashes
+
+
+def _positions(item, num_bits, num_hashes):
+    digest = hashlib.md5(_to_bytes(item)).digest()
+    h1, h2 = struct.unpack('<QQ', digest)
+    return [(h1 + i * h2) % num_bits for i in range(num_hashes)]
+
+
+def _chunks(items, size):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class BloomFilter(object):
+    """
+    A Bloom filter sized for ``capacity`` items with a false positive rate of
+    ``error_rate``, held in the bitmap ``name``.
+    """
+
+    def __init__(self, ssdb, name, capacity, error_rate=0.001,
+                 batch_size=1000):
+        self.ssdb = ssdb
+        self.name = name
+        self.capacity = get_positive_integer('capacity', capacity)
+        self.num_bits, self.num_hashes = _size(capacity, error_rate)
+        self.error_rate = error_rate
+        self.batch_size = get_positive_integer('batch_size', batch_size)
+
+    def __contains__(self, item):
+        return self.contains(item)
+
+    def positions(self, item):
+        """
+        Return the offsets of the bits of ``item``
+        """
+        return _positions(item, self.num_bits, self.num_hashes)
+
+    def add(self, item):
+        """
+        Add ``item`` and return ``True`` if it was not in the filter yet
+        """
+        return self.add_many([item])[0]
+
+    def contains(self, item):
+        """
+        Return whether ``item`` is probably in the filter
+        """
+        return self.contains_many([item])[0]
+
+    def add_many(self, items):
+        """
+        Add ``items`` and return for each whether it was new, i.e. whether it
+        changed at least one bit
+        """
+        result = []
+        for chunk in _chunks(items, self.batch_size):
+            batch = self.ssdb.batch()
+            for item in chunk:
+                for offset in self.positions(item):
+                    batch.setbit(self.name, offset, 1)
+            result.extend(not all(bits)
+                          for bits in self._group(batch.execute()))
+        return result
+
+    def contains_many(self, items):
+        """
+        Return for each of ``items`` whether it's probably in the filter
+        """
+        result = []
+        for chunk in _chunks(items, self.batch_size):
+            batch = self.ssdb.batch()
+            for item in chunk:
+                for offset in self.positions(item):
+                    batch.getbit(self.name, offset)
+            result.extend(all(bits) for bits in self._group(batch.execute()))
+        return result
+
+    def _group(self, bits):
+        "Split the replies of a batch into the bits of each item"
+        k = self.num_hashes
+        return [bits[i:i + k] for i in range(0, len(bits), k)]
+
+
+class LocalBloomFilter(object):
+    """
+    A Bloom filter sized for ``capacity`` items with a false positive rate of
+    ``error_rate``, held in memory. It sets the same bit offsets as a
+    `BloomFilter`_ of the same size.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = get_positive_integer('capacity', capacity)
+        self.num_bits, self.num_hashes = _size(capacity, error_rate)
+        self.error_rate = error_rate
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def __contains__(self, item):
+        return self.contains(item)
+
+    def __len__(self):
+        return self.count
+
+    def positions(self, item):
+        """
+        Return the offsets of the bits of ``item``
+        """
+        return _positions(item, self.num_bits, self.num_hashes)
+
+    def add(self, item):
+        """
+        Add ``item`` and return ``True`` if it was not in the filter yet
+        """
+        bits = self.bits
+        new = False
+        for offset in self.positions(item):
+            mask = 1 << (offset & 7)
+            if not bits[offset >> 3] & mask:
+                bits[offset >> 3] |= mask
+                new = True
+        if new:
+            self.count += 1
+        return new
+
+    def contains(self, item):
+        """
+        Return whether ``item`` is probably in the filter
+        """
+        bits = self.bits
+        for offset in self.positions(item):
+            if not bits[offset >> 3] & (1 << (offset & 7)):
+                return False
+        return True
+
+
+class ScalableBloomFilter(object):
+    """
+    A chain of Bloom filters growing as items are added, so the number of
+    items doesn't need to be known in advance.
+
+    The first filter holds ``initial_capacity`` items, each following one
+    ``growth`` times more, with error rates tightened by ``ratio`` so the
+    compound false positive rate stays below ``error_rate``. The filters are
+    the bitmaps ``name:0``, ``name:1``... and the hash ``name`` counts the
+    items of each: a filter is full once its count reaches its capacity,
+    whichever client filled it.
+    """
+
+    def __init__(self, ssdb, name, initial_capacity=100000, error_rate=0.001,
+                 growth=2, ratio=0.9, batch_size=1000):
+        self.ssdb = ssdb
+        self.name = name
+        self.initial_capacity = get_positive_integer('initial_capacity',
+                                                     initial_capacity)
+        self.error_rate = error_rate
+        self.growth = growth
+        self.ratio = ratio
+        self.batch_size = get_positive_integer('batch_size', batch_size)
+        self.filters = []
+        self.counts = []
+        self._update(self.ssdb.execute_command('hgetall', self.name))
+
+    def __contains__(self, item):
+        return self.contains(item)
+
+    def __len__(self):
+        "Approximate number of items added"
+        return sum(self.counts)
+
+    def _filter(self, index):
+        return BloomFilter(
+            self.ssdb, '%s:%d' % (self.name, index),
+            capacity=int(self.initial_capacity * self.growth ** index),
+            error_rate=self.error_rate * (1 - self.ratio) * self.ratio ** index,
+            batch_size=self.batch_size)
+
+    def _update(self, counts):
+        counts = dict((int(index), int(count))
+                      for index, count in counts.items())
+        while len(self.filters) <= max(counts or [0]):
+            self.filters.append(self._filter(len(self.filters)))
+        self.counts = [max(counts.get(i, 0), 0)
+                       for i in range(len(self.filters))]
+
+    def _current(self):
+        "Index of the filter taking new items"
+        index = len(self.filters) - 1
+        if self.counts[index] >= self.filters[index].capacity:
+            self.filters.append(self._filter(index + 1))
+            self.counts.append(0)
+            index += 1
+        return index
+
+    def _lookup(self, items, filters):
+        """
+        Return which of ``items`` are in one of ``filters``, with the item
+        counts read in the same batch
+        """
+        positions = [[bloom.positions(item) for bloom in filters]
+                     for item in items]
+        batch = self.ssdb.batch()
+        for offsets in positions:
+            for bloom, bits in zip(filters, offsets):
+                for offset in bits:
+                    batch.getbit(bloom.name, offset)
+        batch.execute_command('hgetall', self.name)
+        response = batch.execute()
+        found, i = [], 0
+        for offsets in positions:
+            present = False
+            for bits in offsets:
+                present = present or all(response[i:i + len(bits)])
+                i += len(bits)
+            found.append(present)
+        return found, response[-1]
+
+    def contains_many(self, items):
+        """
+        Return for each of ``items`` whether it's probably in one of the
+        filters
+        """
+        result = []
+        for chunk in _chunks(items, self.batch_size):
+            known = self.filters[:]
+            found, counts = self._lookup(chunk, known)
+            self._update(counts)
+            if len(self.filters) > len(known):
+                # another client started new filters meanwhile
+                missing = [i for i, present in enumerate(found)
+                           if not present]
+                extra = self._lookup([chunk[i] for i in missing],
+                                     self.filters[len(known):])[0]
+                for i, present in zip(missing, extra):
+                    found[i] = present
+            result.extend(found)
+        return result
+
+    def contains(self, item):
+        """
+        Return whether ``item`` is probably in one of the filters
+        """
+        return self.contains_many([item])[0]
+
+    def add_many(self, items):
+        """
+        Add the ``items`` not found in any filter to the current one and
+        return for each whether it was new
+        """
+        result = []
+        for chunk in _chunks(items, self.batch_size):
+            found = self.contains_many(chunk)
+            new, seen = [], set()
+            for item, present in zip(chunk, found):
+                key = _to_bytes(item)
+                is_new = not present and key not in seen
+                seen.add(key)
+                result.append(is_new)
+                if is_new:
+                    new.append(item)
+            while new:
+                index = self._current()
+                bloom = self.filters[index]
+                room = max(bloom.capacity - self.counts[index], 1)
+                added, new = new[:room], new[room:]
+                batch = self.ssdb.batch()
+                for item in added:
+                    for offset in bloom.positions(item):
+                        batch.setbit(bloom.name, offset, 1)
+                batch.hincr(self.name, str(index), len(added))
+                self.counts[index] = batch.execute()[-1]
+        return result
+
+    def add(self, item):
+        """
+        Add ``item`` and return ``True`` if it was not in the filters yet
+        """
+        return self.add_many([item])[0]
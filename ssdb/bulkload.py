@@ -0,0 +1,391 @@
+#coding=utf-8
+"""
+Bulk import of large JSONL, CSV and TSV files.
+
+    $ ssdb-bulkload users.jsonl --key id --value profile --processes 8 \\
+          --checkpoint users.checkpoint
+    $ ssdb-bulkload scores.csv --type zset --name-field board --key player \\
+          --score points
+
+    >>> from ssdb.bulkload import BulkLoader
+    >>> loader = BulkLoader(kind='hash', name='users', key='id',
+    ...                     value='email', processes=4)
+    >>> loader.load_file('users.csv')
+    {'records': 200000000, 'chunks': 20000, 'seconds': 812.5, ...}
+
+The file is read as a stream and cut in chunks of ``chunk_size`` records
+which a `multiprocessing` pool writes in parallel. Every worker process has
+its own client, and so its own `ConnectionPool`, and writes a chunk as one
+pipelined batch of ``multi_set``, ``multi_hset``, ``multi_zset`` or
+``qpush_back`` commands of ``batch_size`` items. At most two chunks per
+process are read ahead, so memory stays bounded whatever the file size.
+
+The records map to:
+
+* ``kv``: the key ``record[key]`` set to ``record[value]``,
+* ``hash``: the key ``record[key]`` of the hash ``name`` (or
+  ``record[name_field]``) set to ``record[value]``,
+* ``zset``: the key ``record[key]`` of the zset ``name`` (or
+  ``record[name_field]``) scored ``record[score]``,
+* ``queue``: ``record[value]`` pushed to the queue ``name`` (or
+  ``record[name_field]``).
+
+Values which are not strings are stored as JSON unless a ``codec`` is
+given.
+
+With a ``checkpoint`` file, the chunks written are saved every
+``checkpoint_interval`` seconds and when the load stops, and a new load of
+the same file with the same ``chunk_size`` skips them. The chunks being
+written when a load failed are written again, which only matters for queues
+where their items may be pushed twice.
+"""
+from __future__ import with_statement
+import csv
+import json
+import multiprocessing
+import optparse
+import os
+import sys
+import threading
+import time as mod_time
+from ssdb._compat import OrderedDict, basestring
+from ssdb.client import StrictSSDB
+from ssdb.exceptions import DataError
+from ssdb.utils import get_choice, get_positive_integer
+
+KINDS = ('kv', 'hash', 'zset', 'queue')
+FORMATS = ('jsonl', 'csv', 'tsv')
+EXTENSIONS = {'.jsonl': 'jsonl', '.json': 'jsonl', '.ndjson': 'jsonl',
+              '.csv': 'csv', '.tsv': 'tsv', '.tab': 'tsv'}
+
+
+def guess_format(path):
+    "Return the format of ``path`` from its extension"
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in EXTENSIONS:
+        raise ValueError('Cannot guess the format of %r, expected one of %s'
+                         % (path, ', '.join(sorted(EXTENSIONS))))
+    return EXTENSIONS[extension]
+
+
+def read_records(path, format=None):
+    """
+    Yield the records of the file at ``path``, dicts read from a JSON object
+    per line or from the rows of a CSV or TSV file with a header
+    """
+    format = get_choice('format', format or guess_format(path), FORMATS)
+    mode = 'rb' if format == 'jsonl' or sys.version_info[0] < 3 else 'r'
+    with open(path, mode) as f:
+        if format == 'jsonl':
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line.decode('utf-8'))
+        else:
+            delimiter = '\t' if format == 'tsv' else ','
+            for row in csv.DictReader(f, delimiter=delimiter):
+                yield row
+
+
+def chunks(records, size, skip=()):
+    """
+    Yield ``(index, records)`` for the successive chunks of ``size``
+    ``records``, but for the chunks whose index is in ``skip``
+    """
+    index, chunk = 0, []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == size:
+            if index not in skip:
+                yield index, chunk
+            index, chunk = index + 1, []
+    if chunk and index not in skip:
+        yield index, chunk
+
+
+class Writer(object):
+    "Write chunks of records with a client of its own"
+
+    def __init__(self, config):
+        self.config = config
+        self.client = StrictSSDB(codec=config['codec'],
+                                 **config['connection'])
+
+    def __call__(self, task):
+        """
+        Write the chunk ``task``, an ``(index, records)`` pair, and return
+        ``(index, records written, error message or None)``
+        """
+        index, records = task
+        try:
+            self.write(records)
+        except Exception:
+            error = sys.exc_info()[1]
+            return index, 0, '%s: %s' % (type(error).__name__, error)
+        return index, len(records), None
+
+    def _key(self, key):
+        return key if isinstance(key, basestring) else str(key)
+
+    def _value(self, value):
+        if self.config['codec'] is None and not isinstance(value,
+                                                           basestring):
+            return json.dumps(value)
+        return value
+
+    def write(self, records):
+        config = self.config
+        kind, size = config['kind'], config['batch_size']
+        key, value, score = config['key'], config['value'], config['score']
+        encode = self.client.encode_value
+        groups = OrderedDict()
+        for record in records:
+            if kind == 'kv':
+                name = None
+            elif config['name_field'] is not None:
+                name = record[config['name_field']]
+            else:
+                name = config['name']
+            if kind == 'queue':
+                item = self._value(record[value])
+            elif kind == 'zset':
+                item = (self._key(record[key]), int(record[score]))
+            else:
+                item = (self._key(record[key]),
+                        encode(self._value(record[value])))
+            groups.setdefault(name, []).append(item)
+
+        batch = self.client.batch()
+        for name, items in groups.items():
+            for i in range(0, len(items), size):
+                part = items[i:i + size]
+                if kind == 'queue':
+                    batch.qpush_back(name, *part)
+                    continue
+                # flat arguments, record keys can't be keyword arguments
+                args = [arg for item in part for arg in item]
+                if kind == 'kv':
+                    batch.execute_command('multi_set', *args)
+                elif kind == 'hash':
+                    batch.execute_command('multi_hset', name, *args)
+                else:
+                    batch.execute_command('multi_zset', name, *args)
+        batch.execute()
+
+
+_writer = None
+
+
+def _init_worker(config):
+    global _writer
+    _writer = Writer(config)
+
+
+def _write_chunk(task):
+    return _writer(task)
+
+
+class BulkLoader(object):
+    """
+    Load records into SSDB with a pool of ``processes`` worker processes
+    (one per CPU by default, none with ``0`` or ``1``)
+    """
+
+    def __init__(self, kind='kv', key='key', value='value', score='score',
+                 name=None, name_field=None, host='127.0.0.1', port=8888,
+                 socket_timeout=None, codec=None, processes=None,
+                 chunk_size=10000, batch_size=1000, checkpoint=None,
+                 checkpoint_interval=5.0, progress=None):
+        kind = get_choice('kind', kind, KINDS)
+        if kind != 'kv' and name is None and name_field is None:
+            raise ValueError('``name`` or ``name_field`` must be given for '
+                             'a %s' % kind)
+        self.config = {
+            'kind': kind, 'key': key, 'value': value, 'score': score,
+            'name': name, 'name_field': name_field, 'codec': codec,
+            'batch_size': get_positive_integer('batch_size', batch_size),
+            'connection': {'host': host, 'port': port,
+                           'socket_timeout': socket_timeout},
+        }
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        self.processes = processes
+        self.chunk_size = get_positive_integer('chunk_size', chunk_size)
+        self.checkpoint = checkpoint
+        self.checkpoint_interval = checkpoint_interval
+        self.progress = progress
+
+    def read_checkpoint(self):
+        """
+        Return ``(chunks written, records written)`` saved in the checkpoint
+        """
+        if self.checkpoint is None or not os.path.exists(self.checkpoint):
+            return set(), 0
+        with open(self.checkpoint) as f:
+            state = json.load(f)
+        if state['chunk_size'] != self.chunk_size:
+            raise DataError('The checkpoint %s was made with chunks of %d '
+                            'records, not %d' % (self.checkpoint,
+                                                 state['chunk_size'],
+                                                 self.chunk_size))
+        done = set(range(state['watermark']))
+        done.update(state['done'])
+        return done, state['records']
+
+    def write_checkpoint(self, done, records):
+        "Save the chunks written, ``done``, atomically"
+        watermark = 0
+        while watermark in done:
+            watermark += 1
+        state = {'chunk_size': self.chunk_size, 'watermark': watermark,
+                 'done': sorted(i for i in done if i > watermark),
+                 'records': records}
+        path = self.checkpoint + '.tmp'
+        with open(path, 'w') as f:
+            json.dump(state, f)
+        os.rename(path, self.checkpoint)
+
+    def load_file(self, path, format=None):
+        "Load the records of the file at ``path``, see `read_records`_"
+        return self.load(read_records(path, format))
+
+    def load(self, records):
+        """
+        Load the ``records`` and return a dict of statistics: ``records``
+        and ``chunks`` written, ``seconds`` and ``records_per_sec``
+        """
+        done, previous = self.read_checkpoint()
+        state = {'records': 0, 'chunks': 0, 'error': None, 'saved': 0}
+        lock = threading.Lock()
+        start = mod_time.time()
+
+        def finished(result):
+            index, count, error = result
+            with lock:
+                if error is not None:
+                    if state['error'] is None:
+                        state['error'] = 'chunk %d: %s' % (index, error)
+                    return
+                done.add(index)
+                state['records'] += count
+                state['chunks'] += 1
+                now = mod_time.time()
+                if (self.checkpoint is not None and
+                        now - state['saved'] >= self.checkpoint_interval):
+                    self.write_checkpoint(done, previous + state['records'])
+                    state['saved'] = now
+                if self.progress is not None:
+                    self.progress(previous + state['records'], now - start)
+
+        tasks = chunks(records, self.chunk_size, frozenset(done))
+        try:
+            if self.processes <= 1:
+                writer = Writer(self.config)
+                for task in tasks:
+                    finished(writer(task))
+                    if state['error'] is not None:
+                        break
+            else:
+                self._load_parallel(tasks, finished, state)
+        finally:
+            if self.checkpoint is not None:
+                with lock:
+                    self.write_checkpoint(done, previous + state['records'])
+        if state['error'] is not None:
+            raise DataError('Loading failed at %s' % state['error'])
+        seconds = mod_time.time() - start
+        return {'records': state['records'], 'chunks': state['chunks'],
+                'seconds': seconds,
+                'records_per_sec': state['records'] / seconds if seconds
+                else 0.0}
+
+    def _load_parallel(self, tasks, finished, state):
+        # bound the chunks read ahead of the workers
+        pending = threading.Semaphore(self.processes * 2)
+
+        def callback(result):
+            try:
+                finished(result)
+            finally:
+                pending.release()
+        pool = multiprocessing.Pool(self.processes, _init_worker,
+                                    (self.config,))
+        try:
+            for task in tasks:
+                pending.acquire()
+                if state['error'] is not None:
+                    break
+                pool.apply_async(_write_chunk, (task,), callback=callback)
+            pool.close()
+            pool.join()
+        except:
+            pool.terminate()
+            raise
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage='ssdb-bulkload [options] FILE')
+    parser.add_option('-H', '--host', default='127.0.0.1',
+                      help='server host [%default]')
+    parser.add_option('-p', '--port', type='int', default=8888,
+                      help='server port [%default]')
+    parser.add_option('-f', '--format', choices=FORMATS,
+                      help='jsonl, csv or tsv [from the file extension]')
+    parser.add_option('-t', '--type', dest='kind', choices=KINDS,
+                      default='kv', help='kv, hash, zset or queue '
+                      '[%default]')
+    parser.add_option('--key', default='key',
+                      help='field of the keys [%default]')
+    parser.add_option('--value', default='value',
+                      help='field of the values [%default]')
+    parser.add_option('--score', default='score',
+                      help='field of the zset scores [%default]')
+    parser.add_option('--name', help='hash, zset or queue to load')
+    parser.add_option('--name-field',
+                      help='field of the hash, zset or queue names')
+    parser.add_option('--processes', type='int',
+                      help='worker processes [one per CPU]')
+    parser.add_option('--chunk-size', type='int', default=10000,
+                      help='records per chunk [%default]')
+    parser.add_option('--batch-size', type='int', default=1000,
+                      help='items per command [%default]')
+    parser.add_option('--checkpoint', metavar='PATH',
+                      help='save the progress to PATH and resume from it')
+    parser.add_option('-q', '--quiet', action='store_true',
+                      help='do not report the progress')
+    options, args = parser.parse_args(argv)
+    if len(args) != 1:
+        parser.error('expected one file to load')
+
+    def progress(records, seconds):
+        if progress.last is None or seconds - progress.last >= 1:
+            progress.last = seconds
+            sys.stderr.write('\r%d records, %.0f records/s' % (
+                records, records / seconds if seconds else 0))
+            sys.stderr.flush()
+    progress.last = None
+
+    try:
+        loader = BulkLoader(
+            kind=options.kind, key=options.key, value=options.value,
+            score=options.score, name=options.name,
+            name_field=options.name_field, host=options.host,
+            port=options.port, processes=options.processes,
+            chunk_size=options.chunk_size, batch_size=options.batch_size,
+            checkpoint=options.checkpoint,
+            progress=None if options.quiet else progress)
+        stats = loader.load_file(args[0], options.format)
+    except (ValueError, DataError):
+        if not options.quiet:
+            sys.stderr.write('\n')
+        sys.stderr.write('%s\n' % sys.exc_info()[1])
+        return 1
+    if not options.quiet:
+        sys.stderr.write('\n')
+    print('%(records)d records in %(seconds).1f seconds, '
+          '%(records_per_sec).0f records/s' % stats)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -10,13 +10,19 @@ from ssdb._compat import (b, basestring, bytes, imap, iteritems, iterkeys,
                           OrderedDict)
 from ssdb.connection import ConnectionPool
 from ssdb.batch import BaseBatch
+from ssdb.codecs import get_codec, decode_value, decode_list, decode_dict
+from ssdb.lock import Lock
+from ssdb.negativecache import ABSENT, ABSENT_RESULTS
+from ssdb.slowlog import reply_size
 from ssdb.utils import (
     get_integer,
     get_integer_or_emptystring,
     get_nonnegative_integer,
     get_positive_integer,
     get_negative_integer,
-    get_boolean
+    get_boolean,
+    get_choice,
+    ResponseView,
     )
 from ssdb.exceptions import (
     RES_STATUS_MSG,
@@ -30,8 +36,17 @@ from ssdb.exceptions import (
     ExecAbortError,
     )
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 SYM_EMPTY = b('')
 
+# ``scan`` like replies can be returned as an OrderedDict, a ``(keys,
+# values)`` pair of parallel lists or a lazy mapping over the raw reply.
+RESULT_FORMATS = ('dict', 'pairs', 'view')
+
 def list_or_arg(keys, args):
     #returns a single list combining keys and args
     try:
@@ -79,11 +94,23 @@ def list_to_int_ordereddict(lst):
         dst[k] = int(v)
     return dst
 
-def dict_to_list(dct):
+def list_to_array(lst, dtype):
+    """
+    Split a flat key/value reply into a list of keys and a ``dtype`` ndarray
+    of values, parsing the values in numpy rather than one by one in Python.
+    """
+    if numpy is None:
+        raise DataError("Array results require the numpy package")
+    values = lst[1::2]
+    if not values:
+        return [], numpy.empty(0, dtype)
+    return lst[0::2], numpy.array(values).astype(dtype)
+
+def dict_to_list(dct, encode=None):
     lst = []
     for key, value in dct.iteritems():
         lst.append(key)
-        lst.append(value)
+        lst.append(encode(value) if encode else value)
     return lst
 
 def dict_merge(*dicts):
@@ -91,6 +118,39 @@ def dict_merge(*dicts):
     [merged.update(d) for d in dicts]
     return merged
 
+def parse_value(response, codec=None, **options):
+    return decode_value(response[0], codec)
+
+def parse_value_list(response, codec=None, **options):
+    return decode_list(response, codec)
+
+def parse_value_dict(response, codec=None, dtype=None, **options):
+    if dtype is not None:
+        return list_to_array(response, dtype)
+    return decode_dict(list_to_dict(response), codec)
+
+def parse_value_ordereddict(response, codec=None, result_format=None,
+                            **options):
+    if result_format == 'pairs':
+        return response[0::2], decode_list(response[1::2], codec)
+    if result_format == 'view':
+        return ResponseView(response, codec.decode if codec else None)
+    return decode_dict(list_to_ordereddict(response), codec)
+
+def parse_scores(response, dtype=None, result_format=None, **options):
+    if dtype is not None:
+        return list_to_array(response, dtype)
+    if result_format == 'pairs':
+        return response[0::2], list(imap(int, response[1::2]))
+    if result_format == 'view':
+        return ResponseView(response, int)
+    return list_to_int_ordereddict(response)
+
+def parse_score_dict(response, dtype=None, **options):
+    if dtype is not None:
+        return list_to_array(response, dtype)
+    return list_to_int_dict(response)
+
 def parse_debug_object(response):
     """
     Parse the results of ssdb's DEBUG OBJECT command into a Python dict
@@ -138,10 +198,14 @@ class StrictSSDB(object):
             lambda r: bool(int(r[0]))
         ),
         string_keys_to_dict(
-            'get hget getset substr '
-            'qfront qback qget',
+            'substr',
             lambda r: r[0]
         ),
+        string_keys_to_dict(
+            'get hget getset '
+            'qfront qback qget',
+            parse_value
+        ),
         string_keys_to_dict(
             'incr decr multi_set multi_del ttl countbit strlen '
             'hincr hdecr hsize hclear multi_hset multi_hdel '
@@ -155,26 +219,33 @@ class StrictSSDB(object):
             lambda r: float(r[0])
         ),        
         string_keys_to_dict(
-            'multi_get multi_hget hgetall '
             'multi_zget zscan zrscan',            
             list_to_dict
         ),
+        string_keys_to_dict(
+            'multi_get multi_hget hgetall',
+            parse_value_dict
+        ),
         string_keys_to_dict(
             'scan rscan hscan hrscan',
-            list_to_ordereddict
+            parse_value_ordereddict
         ),
         string_keys_to_dict(
             'zscan zrscan zrange zrrange',
-            list_to_int_ordereddict
+            parse_scores
         ),        
         string_keys_to_dict(
             'multi_zget',
-            list_to_int_dict
+            parse_score_dict
         ),        
         string_keys_to_dict(
             'keys hkeys hlist hrlist zkeys zlist zrlist '
-            'qlist qrlist qrange qslice qpop_back qpop_front',
+            'qlist qrlist',
             lambda r: r
+        ),
+        string_keys_to_dict(
+            'qrange qslice qpop_back qpop_front',
+            parse_value_list
         ),        
         {
             'qset': lambda r: True,
@@ -183,7 +254,8 @@ class StrictSSDB(object):
 
     def __init__(self, host='localhost', port=8888, socket_timeout=None,
                  connection_pool=None, charset='utf-8', errors='strict',
-                 decode_responses=False):
+                 decode_responses=False, codec=None, result_format='dict',
+                 slowlog=None, negative_cache=None):
         if not connection_pool:
             kwargs = {
                 'host': host,
@@ -196,6 +268,11 @@ class StrictSSDB(object):
             connection_pool = ConnectionPool(**kwargs)
         self.connection_pool = connection_pool
         self.response_callbacks = self.__class__.RESPONSE_CALLBACKS.copy()
+        self.codec = get_codec(codec)
+        self.result_format = get_choice('result_format', result_format,
+                                        RESULT_FORMATS)
+        self.slowlog = slowlog
+        self.negative_cache = negative_cache
 
     def __repr__(self):
         return "%s<%s>" % (type(self).__name__, repr(self.connection_pool))
@@ -206,6 +283,19 @@ class StrictSSDB(object):
         """
         self.response_callbacks[command] = callback    
 
+    def encode_value(self, value):
+        """
+        Serialize ``value`` with the client codec, if any
+        """
+        if self.codec is None:
+            return value
+        return self.codec.encode(value)
+
+    def _result_format(self, result_format):
+        if result_format is None:
+            return self.result_format
+        return get_choice('result_format', result_format, RESULT_FORMATS)
+
     #### COMMAND EXECUTION AND PROTOCOL PARSING ####
     def execute_command(self, *args, **options):
         """
@@ -213,22 +303,47 @@ class StrictSSDB(object):
         """
         pool = self.connection_pool
         command_name = args[0]
+        negative_cache = self.negative_cache
+        if negative_cache is not None:
+            generation = negative_cache.lookup(args)
+            if generation is ABSENT:
+                return ABSENT_RESULTS[command_name]
+            negative_cache.write(args)
+        slowlog = self.slowlog
+        if slowlog is not None:
+            slowlog.check(args)
+            start = slowlog.timer()
         connection = pool.get_connection(command_name, **options)
+        if slowlog is not None:
+            options['reply_sizes'] = sizes = []
         try:
-            connection.send_command(*args)
-            return self.parse_response(connection, command_name, **options)
-        except ConnectionError:
-            connection.disconnect()
-            connection.send_command(*args)
-            return self.parse_response(connection, command_name, **options)
+            try:
+                connection.send_command(*args)
+                result = self.parse_response(connection, command_name,
+                                             **options)
+            except ConnectionError:
+                connection.disconnect()
+                connection.send_command(*args)
+                result = self.parse_response(connection, command_name,
+                                             **options)
+            if slowlog is not None:
+                slowlog.record(args, slowlog.timer() - start, sizes[-1])
+            if negative_cache is not None:
+                negative_cache.record(args, result, generation)
+            return result
         finally:
             pool.release(connection)
 
     def parse_response(self, connection, command_name, **options):
         """
-        Parses a response from the ssdb server
+        Parses a response from the ssdb server. The ``(bytes, elements)``
+        size of the raw reply is appended to the ``reply_sizes`` list option
+        when there is one.
         """
         response = connection.read_response()
+        sizes = options.pop('reply_sizes', None)
+        if sizes is not None:
+            sizes.append(reply_size(response))
         if command_name in self.response_callbacks and len(response):
             status = nativestr(response[0])
             if status == RES_STATUS.OK:
@@ -262,7 +377,7 @@ class StrictSSDB(object):
         >>> ssdb.get("not_exists_abc")
         >>> 
         """        
-        return self.execute_command('get', name)
+        return self.execute_command('get', name, codec=self.codec)
     
     def set(self, name, value):
         """
@@ -282,7 +397,7 @@ class StrictSSDB(object):
         >>> ssdb.set("hundred", 100)
         True
         """
-        return self.execute_command('set', name, value)    
+        return self.execute_command('set', name, self.encode_value(value))    
     add = set
 
     def setnx(self, name, value):
@@ -302,7 +417,7 @@ class StrictSSDB(object):
         >>> ssdb.setnx("setnx_test", 'cde')
         False        
         """
-        return self.execute_command('setnx', name, value)
+        return self.execute_command('setnx', name, self.encode_value(value))
 
     def getset(self, name, value):
         """
@@ -325,7 +440,8 @@ class StrictSSDB(object):
         >>> ssdb.getset("getset_a", 123)
         'ABC'
         """
-        return self.execute_command('getset', name, value)    
+        return self.execute_command('getset', name, self.encode_value(value),
+                                    codec=self.codec)    
 
     def delete(self, name):
         """
@@ -373,8 +489,8 @@ class StrictSSDB(object):
         >>> ssdb.expire('not_exist')
         False
         """
-        if isinstance(time, datetime.timedelta):
-            time = time.seconds + time.days * 24 * 3600        
+        if isinstance(ttl, datetime.timedelta):
+            ttl = ttl.seconds + ttl.days * 24 * 3600        
         return self.execute_command('expire', name, ttl)
 
     def ttl(self, name):
@@ -395,9 +511,7 @@ class StrictSSDB(object):
         >>> ssdb.ttl('not_exist')
         -1
         """
-        if isinstance(time, datetime.timedelta):
-            time = time.seconds + time.days * 24 * 3600        
-        return self.execute_command('expire', name, ttl)    
+        return self.execute_command('ttl', name)    
 
     def exists(self, name):
         """
@@ -489,7 +603,7 @@ class StrictSSDB(object):
         >>> ssdb.getbit('bit_test', 1)
         False
         """                        
-        offset = get_positive_integer('offset', offset)
+        offset = get_nonnegative_integer('offset', offset)
         return self.execute_command('getbit', name, offset)
 
     def setbit(self, name, offset, val):
@@ -517,7 +631,7 @@ class StrictSSDB(object):
         7        
         """                        
         val = int(get_boolean('val', val))
-        offset = get_positive_integer('offset', offset)
+        offset = get_nonnegative_integer('offset', offset)
         return self.execute_command('setbit', name, offset, val)
 
     def countbit(self, name, start=None, size=None):
@@ -622,7 +736,8 @@ class StrictSSDB(object):
         >>> ssdb.multi_set(set_abc='abc',set_count=10)
         2
         """        
-        return self.execute_command('multi_set', *dict_to_list(kvs))
+        return self.execute_command('multi_set',
+                                    *dict_to_list(kvs, self.encode_value))
     mset = multi_set
 
     def multi_get(self, *names):
@@ -640,9 +755,26 @@ class StrictSSDB(object):
         >>> ssdb.multi_get('set_abc','set_count')
         {'set_abc': 'set_abc', 'set_count': '10'}
         """                
-        return self.execute_command('multi_get', *names)
+        return self.execute_command('multi_get', *names, codec=self.codec)
     mget = multi_get
 
+    def multi_get_array(self, *names, **kwargs):
+        """
+        Like `multi_get`_ but return the keys found as a list and their values
+        parsed as a ``numpy.ndarray`` of ``dtype`` (default ``int64``), without
+        building an intermediate dict. Needs ``numpy``.
+
+        :param list names: a list of keys
+        :param dtype: keyword only, the dtype of the values array
+        :return: the keys found and the array of their values
+        :rtype: tuple
+
+        >>> ssdb.multi_get_array('count_a', 'count_b', 'not_exist')
+        (['count_a', 'count_b'], array([42, 7]))
+        """
+        dtype = kwargs.pop('dtype', 'int64')
+        return self.execute_command('multi_get', *names, dtype=dtype)
+
     def multi_del(self, *names):
         """
         Delete one or more keys specified by ``names``
@@ -691,7 +823,7 @@ class StrictSSDB(object):
         limit = get_positive_integer('limit', limit)
         return self.execute_command('keys', name_start, name_end, limit)
 
-    def scan(self, name_start, name_end, limit=10):
+    def scan(self, name_start, name_end, limit=10, result_format=None):
         """
         Scan and return a dict mapping key/value in the top ``limit`` keys between
         ``name_start`` and ``name_end`` in ascending order
@@ -706,6 +838,8 @@ class StrictSSDB(object):
         :param string name_end: The upper bound(included) of keys to be
          returned, empty string ``''`` means +inf
         :param int limit: number of elements will be returned.
+        :param string result_format: Optional, ``'dict'``, ``'pairs'`` or
+         ``'view'``, overrides the client ``result_format``
         :return: a dict mapping key/value in ascending order
         :rtype: OrderedDict
         
@@ -719,9 +853,12 @@ class StrictSSDB(object):
         {}
         """        
         limit = get_positive_integer('limit', limit)        
-        return self.execute_command('scan', name_start, name_end, limit)
+        result_format = self._result_format(result_format)
+        return self.execute_command('scan', name_start, name_end, limit,
+                                    codec=self.codec,
+                                    result_format=result_format)
 
-    def rscan(self, name_start, name_end, limit=10):
+    def rscan(self, name_start, name_end, limit=10, result_format=None):
         """
         Scan and return a dict mapping key/value in the top ``limit`` keys between
         ``name_start`` and ``name_end`` in descending order
@@ -734,6 +871,8 @@ class StrictSSDB(object):
         :param string name_end: The lower bound(included) of keys to be
          returned, empty string ``''`` means -inf
         :param int limit: number of elements will be returned.
+        :param string result_format: Optional, ``'dict'``, ``'pairs'`` or
+         ``'view'``, overrides the client ``result_format``
         :return: a dict mapping key/value in descending order
         :rtype: OrderedDict
         
@@ -747,7 +886,10 @@ class StrictSSDB(object):
         {}
         """                
         limit = get_positive_integer('limit', limit)        
-        return self.execute_command('rscan', name_start, name_end, limit)
+        result_format = self._result_format(result_format)
+        return self.execute_command('rscan', name_start, name_end, limit,
+                                    codec=self.codec,
+                                    result_format=result_format)
 
     #### HASH OPERATION ####
     def hget(self, name, key):
@@ -771,7 +913,7 @@ class StrictSSDB(object):
         >>> ssdb.hget("hash_2", 'key1')
         '42'
         """                
-        return self.execute_command('hget', name, key)
+        return self.execute_command('hget', name, key, codec=self.codec)
 
     def hset(self, name, key, value):
         """
@@ -794,7 +936,8 @@ class StrictSSDB(object):
         >>> ssdb.hset("hash_3", 'yellow', '#FFFF00')
         False
         """        
-        return self.execute_command('hset', name, key, value)
+        return self.execute_command('hset', name, key,
+                                    self.encode_value(value))
     hadd = hset
 
     def hdel(self, name, key):
@@ -953,7 +1096,8 @@ class StrictSSDB(object):
         >>> ssdb.multi_hset('hash_4', a='AA', b='BB', c='CC', d='DD', e='EE')
         1        
         """                                
-        return self.execute_command('multi_hset', name, *dict_to_list(kvs))
+        return self.execute_command('multi_hset', name,
+                                    *dict_to_list(kvs, self.encode_value))
     hmset = multi_hset
 
     def multi_hget(self, name, *keys):
@@ -972,7 +1116,8 @@ class StrictSSDB(object):
         >>> ssdb.multi_hget('hash_2', 'key2', 'key5')
         {'key2': '3.1415926', 'key5': 'e'}
         """
-        return self.execute_command('multi_hget', name, *keys)
+        return self.execute_command('multi_hget', name, *keys,
+                                    codec=self.codec)
     hmget = multi_hget
 
     def multi_hdel(self, name, *keys):
@@ -1040,7 +1185,7 @@ class StrictSSDB(object):
         >>> ssdb.hgetall('hash_1')
         {"a":'aa',"b":'bb',"c":'cc'}
         """        
-        return self.execute_command('hgetall', name)    
+        return self.execute_command('hgetall', name, codec=self.codec)    
 
     def hlist(self, name_start, name_end, limit=10):
         """
@@ -1094,7 +1239,8 @@ class StrictSSDB(object):
         limit = get_positive_integer('limit', limit)
         return self.execute_command('hrlist', name_start, name_end, limit)        
 
-    def hscan(self, name, key_start, key_end, limit=10):
+    def hscan(self, name, key_start, key_end, limit=10,
+              result_format=None):
         """
         Return a dict mapping key/value in the top ``limit`` keys between
         ``key_start`` and ``key_end`` within hash ``name`` in ascending order
@@ -1110,6 +1256,8 @@ class StrictSSDB(object):
         :param string key_end: The upper bound(included) of keys to be
          returned, empty string ``''`` means +inf
         :param int limit: number of elements will be returned.
+        :param string result_format: Optional, ``'dict'``, ``'pairs'`` or
+         ``'view'``, overrides the client ``result_format``
         :return: a dict mapping key/value in ascending order
         :rtype: OrderedDict
         
@@ -1123,10 +1271,14 @@ class StrictSSDB(object):
         {}
         """                
         limit = get_positive_integer('limit', limit)        
-        return self.execute_command('hscan', name, key_start, key_end, limit)
+        result_format = self._result_format(result_format)
+        return self.execute_command('hscan', name, key_start, key_end, limit,
+                                    codec=self.codec,
+                                    result_format=result_format)
 
     
-    def hrscan(self, name, key_start, key_end, limit=10):
+    def hrscan(self, name, key_start, key_end, limit=10,
+               result_format=None):
         """
         Return a dict mapping key/value in the top ``limit`` keys between
         ``key_start`` and ``key_end`` within hash ``name`` in descending order
@@ -1140,6 +1292,8 @@ class StrictSSDB(object):
         :param string key_end: The lower bound(included) of keys to be
          returned, empty string ``''`` means -inf
         :param int limit: number of elements will be returned.
+        :param string result_format: Optional, ``'dict'``, ``'pairs'`` or
+         ``'view'``, overrides the client ``result_format``
         :return: a dict mapping key/value in descending order
         :rtype: OrderedDict
         
@@ -1153,7 +1307,10 @@ class StrictSSDB(object):
         {}        
         """
         limit = get_positive_integer('limit', limit)        
-        return self.execute_command('hrscan', name, key_start, key_end, limit)
+        result_format = self._result_format(result_format)
+        return self.execute_command('hrscan', name, key_start, key_end, limit,
+                                    codec=self.codec,
+                                    result_format=result_format)
 
     #### ZSET OPERATION ####
     def zset(self, name, key, score=1):
@@ -1379,6 +1536,21 @@ class StrictSSDB(object):
         return self.execute_command('multi_zget', name, *keys)
     zmget = multi_zget
 
+    def multi_zget_array(self, name, *keys):
+        """
+        Like `multi_zget`_ but return the keys found as a list and their scores
+        as an ``int64`` ``numpy.ndarray``. Needs ``numpy``.
+
+        :param string name: the zset name
+        :param list keys: a list of keys
+        :return: the keys found and the array of their scores
+        :rtype: tuple
+
+        >>> ssdb.multi_zget_array('zset_1', 'a', 'b', 'z')
+        (['a', 'b'], array([30, 20]))
+        """
+        return self.execute_command('multi_zget', name, *keys, dtype='int64')
+
     def multi_zdel(self, name, *keys):
         """
         Remove ``keys`` from zset ``name``
@@ -1483,7 +1655,8 @@ class StrictSSDB(object):
         return self.execute_command('zkeys', name, key_start, score_start,
                                     score_end, limit)    
 
-    def zscan(self, name, key_start, score_start, score_end, limit=10):
+    def zscan(self, name, key_start, score_start, score_end, limit=10,
+              result_format=None):
         """
         Return a dict mapping key/score of the top ``limit`` keys after
         ``key_start`` with scores between ``score_start`` and ``score_end`` in
@@ -1503,6 +1676,8 @@ class StrictSSDB(object):
         :param int score_end: The maximum score(included) related to keys,
          empty string ``''`` means +inf
         :param int limit: number of elements will be returned.
+        :param string result_format: Optional, ``'dict'``, ``'pairs'`` or
+         ``'view'``, overrides the client ``result_format``
         :return: a dict mapping key/score in ascending order
         :rtype: OrderedDict
         
@@ -1518,10 +1693,13 @@ class StrictSSDB(object):
         score_start = get_integer_or_emptystring('score_start', score_start)
         score_end = get_integer_or_emptystring('score_end', score_end)
         limit = get_positive_integer('limit', limit)        
+        result_format = self._result_format(result_format)
         return self.execute_command('zscan', name, key_start, score_start,
-                                    score_end, limit)
+                                    score_end, limit,
+                                    result_format=result_format)
 
-    def zrscan(self, name, key_start, score_start, score_end, limit=10):
+    def zrscan(self, name, key_start, score_start, score_end, limit=10,
+               result_format=None):
         """
         Return a dict mapping key/score of the top ``limit`` keys after
         ``key_start`` with scores between ``score_start`` and ``score_end`` in
@@ -1539,6 +1717,8 @@ class StrictSSDB(object):
         :param int score_end: The minimum score(included) related to keys,
          empty string ``''`` means -inf        
         :param int limit: number of elements will be returned.
+        :param string result_format: Optional, ``'dict'``, ``'pairs'`` or
+         ``'view'``, overrides the client ``result_format``
         :return: a dict mapping key/score in descending order
         :rtype: OrderedDict
         
@@ -1554,8 +1734,10 @@ class StrictSSDB(object):
         score_start = get_integer_or_emptystring('score_start', score_start)
         score_end = get_integer_or_emptystring('score_end', score_end)                
         limit = get_positive_integer('limit', limit)        
+        result_format = self._result_format(result_format)
         return self.execute_command('zrscan', name, key_start, score_start,
-                                    score_end, limit)
+                                    score_end, limit,
+                                    result_format=result_format)
 
     def zrank(self, name, key):
         """
@@ -1604,7 +1786,7 @@ class StrictSSDB(object):
         """                
         return self.execute_command('zrrank', name, key)
 
-    def zrange(self, name, offset, limit):
+    def zrange(self, name, offset, limit, result_format=None):
         """
         Return a dict mapping key/score in a range of score from zset ``name``
         between ``offset`` and ``offset+limit`` sorted in ascending order.
@@ -1617,6 +1799,8 @@ class StrictSSDB(object):
         :param int offset: zero or positive,the returned pairs will start at
          this offset
         :param int limit: number of elements will be returned
+        :param string result_format: Optional, ``'dict'``, ``'pairs'`` or
+         ``'view'``, overrides the client ``result_format``
         :return: a dict mapping key/score in ascending order
         :rtype: OrderedDict
 
@@ -1629,9 +1813,11 @@ class StrictSSDB(object):
         """
         offset = get_nonnegative_integer('offset', offset)        
         limit = get_positive_integer('limit', limit)        
-        return self.execute_command('zrange', name, offset, limit)
+        result_format = self._result_format(result_format)
+        return self.execute_command('zrange', name, offset, limit,
+                                    result_format=result_format)
 
-    def zrrange(self, name, offset, limit):
+    def zrrange(self, name, offset, limit, result_format=None):
         """
         Return a dict mapping key/score in a range of score from zset ``name``
         between ``offset`` and ``offset+limit`` sorted in descending order.        
@@ -1642,6 +1828,8 @@ class StrictSSDB(object):
         :param int offset: zero or positive,the returned pairs will start at
          this offset
         :param int limit: number of elements will be returned
+        :param string result_format: Optional, ``'dict'``, ``'pairs'`` or
+         ``'view'``, overrides the client ``result_format``
         :return: a dict mapping key/score in ascending order
         :rtype: OrderedDict
 
@@ -1654,7 +1842,75 @@ class StrictSSDB(object):
         """        
         offset = get_nonnegative_integer('offset', offset)        
         limit = get_positive_integer('limit', limit)        
-        return self.execute_command('zrrange', name, offset, limit)
+        result_format = self._result_format(result_format)
+        return self.execute_command('zrrange', name, offset, limit,
+                                    result_format=result_format)
+
+    def zscan_array(self, name, key_start, score_start, score_end, limit=10):
+        """
+        Like `zscan`_ but return the keys as a list and the scores as an
+        ``int64`` ``numpy.ndarray`` instead of an OrderedDict. Needs ``numpy``.
+
+        :return: the keys and the array of their scores in ascending order
+        :rtype: tuple
+
+        >>> ssdb.zscan_array('zset_1', '', 0, 200, 3)
+        (['g', 'd', 'b'], array([ 0,  1, 20]))
+        """
+        score_start = get_integer_or_emptystring('score_start', score_start)
+        score_end = get_integer_or_emptystring('score_end', score_end)
+        limit = get_positive_integer('limit', limit)
+        return self.execute_command('zscan', name, key_start, score_start,
+                                    score_end, limit, dtype='int64')
+
+    def zrscan_array(self, name, key_start, score_start, score_end, limit=10):
+        """
+        Like `zrscan`_ but return the keys as a list and the scores as an
+        ``int64`` ``numpy.ndarray`` instead of an OrderedDict. Needs ``numpy``.
+
+        :return: the keys and the array of their scores in descending order
+        :rtype: tuple
+
+        >>> ssdb.zrscan_array('zset_1', '', 1000, -1000, 3)
+        (['c', 'e', 'a'], array([100,  64,  30]))
+        """
+        score_start = get_integer_or_emptystring('score_start', score_start)
+        score_end = get_integer_or_emptystring('score_end', score_end)
+        limit = get_positive_integer('limit', limit)
+        return self.execute_command('zrscan', name, key_start, score_start,
+                                    score_end, limit, dtype='int64')
+
+    def zrange_array(self, name, offset, limit):
+        """
+        Like `zrange`_ but return the keys as a list and the scores as an
+        ``int64`` ``numpy.ndarray`` instead of an OrderedDict. Needs ``numpy``.
+
+        :return: the keys and the array of their scores in ascending order
+        :rtype: tuple
+
+        >>> ssdb.zrange_array('zset_1', 0, 2)
+        (['f', 'g'], array([-3,  0]))
+        """
+        offset = get_nonnegative_integer('offset', offset)
+        limit = get_positive_integer('limit', limit)
+        return self.execute_command('zrange', name, offset, limit,
+                                    dtype='int64')
+
+    def zrrange_array(self, name, offset, limit):
+        """
+        Like `zrrange`_ but return the keys as a list and the scores as an
+        ``int64`` ``numpy.ndarray`` instead of an OrderedDict. Needs ``numpy``.
+
+        :return: the keys and the array of their scores in descending order
+        :rtype: tuple
+
+        >>> ssdb.zrrange_array('zset_1', 0, 2)
+        (['c', 'e'], array([100,  64]))
+        """
+        offset = get_nonnegative_integer('offset', offset)
+        limit = get_positive_integer('limit', limit)
+        return self.execute_command('zrrange', name, offset, limit,
+                                    dtype='int64')
 
 
     def zcount(self, name, score_start, score_end):
@@ -1802,7 +2058,7 @@ class StrictSSDB(object):
 
         """
         index = get_integer('index', index)
-        return self.execute_command('qget', name, index)
+        return self.execute_command('qget', name, index, codec=self.codec)
     
     def qset(self, name, index, value):
         """
@@ -1816,7 +2072,8 @@ class StrictSSDB(object):
         
         """
         index = get_integer('index', index)        
-        return self.execute_command('qset', name, index, value)
+        return self.execute_command('qset', name, index,
+                                    self.encode_value(value))
 
     def qpush_back(self, name, *items):
         """
@@ -1830,7 +2087,8 @@ class StrictSSDB(object):
         :rtype: int
         
         """
-        return self.execute_command('qpush_back', name, *items)
+        return self.execute_command('qpush_back', name,
+                                    *imap(self.encode_value, items))
     qpush=qpush_back
 
     def qpush_front(self, name, *items):
@@ -1846,7 +2104,8 @@ class StrictSSDB(object):
         :rtype: int
         
         """
-        return self.execute_command('qpush_front', name, *items)
+        return self.execute_command('qpush_front', name,
+                                    *imap(self.encode_value, items))
 
     def qpop_front(self, name, size=1):
         """
@@ -1861,7 +2120,8 @@ class StrictSSDB(object):
         
         """
         size = get_positive_integer("size", size)
-        return self.execute_command('qpop_front', name, size)
+        return self.execute_command('qpop_front', name, size,
+                                    codec=self.codec)
     qpop = qpop_front
 
     def qpop_back(self, name, size=1):
@@ -1877,7 +2137,8 @@ class StrictSSDB(object):
         
         """
         size = get_positive_integer("size", size)
-        return self.execute_command('qpop_back', name, size)
+        return self.execute_command('qpop_back', name, size,
+                                    codec=self.codec)
 
     def qsize(self, name):
         """
@@ -1972,7 +2233,7 @@ class StrictSSDB(object):
         :rtype: string
         
         """
-        return self.execute_command('qfront', name)
+        return self.execute_command('qfront', name, codec=self.codec)
 
     def qback(self, name):
         """
@@ -1983,7 +2244,7 @@ class StrictSSDB(object):
         :rtype: string
         
         """
-        return self.execute_command('qback', name)
+        return self.execute_command('qback', name, codec=self.codec)
 
     def qrange(self, name, offset, limit):
         """
@@ -2002,7 +2263,8 @@ class StrictSSDB(object):
         """
         offset = get_integer('offset', offset)        
         limit = get_positive_integer('limit', limit)                
-        return self.execute_command('qrange', name, offset, limit)
+        return self.execute_command('qrange', name, offset, limit,
+                                    codec=self.codec)
 
     def qslice(self, name, start, end):
         """
@@ -2022,7 +2284,8 @@ class StrictSSDB(object):
         """
         start = get_integer('start', start)
         end = get_integer('end', end)
-        return self.execute_command('qslice', name, start, end)
+        return self.execute_command('qslice', name, start, end,
+                                    codec=self.codec)
 
     def qtrim_front(self, name, size=1):
         """
@@ -2057,11 +2320,43 @@ class StrictSSDB(object):
     def batch(self):
         return StrictBatch(
             self.connection_pool,
-            self.response_callbacks
+            self.response_callbacks,
+            self.codec,
+            self.result_format,
+            self.slowlog,
+            self.negative_cache
         )
 
     pipeline = batch
 
+    def lock(self, name, timeout=None, sleep=0.1, blocking_timeout=None,
+             lock_class=None, **kwargs):
+        """
+        Return a new Lock object using key ``name`` that mimics the behavior
+        of threading.Lock.
+
+        If specified, ``timeout`` indicates a maximum life for the lock in
+        seconds. By default, it will remain locked until release() is called.
+
+        ``sleep`` indicates the amount of time to sleep per loop iteration
+        when the lock is in blocking mode and another client is currently
+        holding the lock.
+
+        ``blocking_timeout`` indicates the maximum amount of time in seconds to
+        spend trying to acquire the lock. A value of ``None`` indicates
+        continue trying forever.
+
+        ``lock_class`` forces the specified lock implementation, the other
+        keyword arguments are passed to it.
+
+        >>> with ssdb.lock('lock_test', timeout=10):
+        ...     pass
+        """
+        if lock_class is None:
+            lock_class = Lock
+        return lock_class(self, name, timeout=timeout, sleep=sleep,
+                          blocking_timeout=blocking_timeout, **kwargs)
+
     ## def contains(self, name):
     ##     p = self.pipeline()
     ##     p.exists(name)
@@ -2146,7 +2441,11 @@ class SSDB(StrictSSDB):
     def batch(self):
         return Batch(
             self.connection_pool,
-            self.response_callbacks
+            self.response_callbacks,
+            self.codec,
+            self.result_format,
+            self.slowlog,
+            self.negative_cache
         )
     pipeline = batch
 
@@ -2176,7 +2475,8 @@ class SSDB(StrictSSDB):
         if isinstance(ttl, datetime.timedelta):
             ttl = ttl.seconds + ttl.days * 24 * 3600
         ttl = get_positive_integer('ttl', ttl)
-        return self.execute_command('setx', name, value, ttl)
+        return self.execute_command('setx', name, self.encode_value(value),
+                                    ttl)
 
     
 class StrictBatch(BaseBatch, StrictSSDB):
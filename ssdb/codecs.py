@@ -0,0 +1,492 @@
+#coding=utf-8
+"""
+Value codecs.
+
+A codec turns Python objects into bytestrings on the way into SSDB and turns
+the bytestrings read back into Python objects. Only *values* go through the
+codec, key, hash and zset names are always sent as they are.
+
+    >>> from ssdb import SSDB
+    >>> ssdb = SSDB(codec='json')
+    >>> ssdb.set('user_1', {'name': 'ssdb', 'tags': [1, 2]})
+    True
+    >>> ssdb.get('user_1')
+    {u'name': u'ssdb', u'tags': [1, 2]}
+"""
+import array
+import json
+import struct
+import zlib
+from ssdb._compat import (b, bytes, basestring, unicode, pickle, Mapping,
+                          Sequence, xrange)
+from ssdb.exceptions import DataError
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import bz2
+except ImportError:
+    bz2 = None
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+# ``array.array.tostring`` was renamed to ``tobytes`` in python3.2 and
+# ``tostring`` removed in python3.9.
+_array_tobytes = getattr(array.array, 'tobytes', None) or \
+    getattr(array.array, 'tostring')
+_array_frombytes = getattr(array.array, 'frombytes', None) or \
+    getattr(array.array, 'fromstring')
+
+
+class BaseCodec(object):
+    """
+    Base class of the value codecs.
+
+    If ``lazy`` is ``True`` the values of multi-value replies (``multi_get``,
+    ``hgetall``, ``scan``, ``qrange`` ...) are only decoded when they are
+    accessed.
+    """
+
+    def __init__(self, lazy=True):
+        self.lazy = lazy
+
+    def encode(self, value):
+        "Return a bytestring representation of ``value``"
+        raise NotImplementedError
+
+    def decode(self, value):
+        "Return the Python object represented by the bytestring ``value``"
+        raise NotImplementedError
+
+    def __repr__(self):
+        return "%s<lazy=%s>" % (type(self).__name__, self.lazy)
+
+
+class RawCodec(BaseCodec):
+    """
+    Identity codec, values are stored and returned untouched.
+    """
+
+    def encode(self, value):
+        return value
+
+    def decode(self, value):
+        return value
+
+
+class JSONCodec(BaseCodec):
+    """
+    Store values as compact JSON documents.
+    """
+
+    def __init__(self, encoding='utf-8', lazy=True, **dumps_kwargs):
+        super(JSONCodec, self).__init__(lazy=lazy)
+        self.encoding = encoding
+        dumps_kwargs.setdefault('separators', (',', ':'))
+        # ``json.dumps``/``json.loads`` build a new encoder/decoder on every
+        # call with non default arguments, keep our own instances around.
+        self._dumps = json.JSONEncoder(**dumps_kwargs).encode
+        self._loads = json.JSONDecoder().decode
+
+    def encode(self, value):
+        value = self._dumps(value)
+        if isinstance(value, unicode):
+            value = value.encode(self.encoding)
+        return value
+
+    def decode(self, value):
+        if isinstance(value, bytes):
+            value = value.decode(self.encoding)
+        return self._loads(value)
+
+
+class PickleCodec(BaseCodec):
+    """
+    Store values pickled with ``protocol`` (the highest available by
+    default).
+
+    .. note:: Pickled values are binary, don't combine this codec with
+       ``decode_responses=True``.
+    """
+
+    def __init__(self, protocol=pickle.HIGHEST_PROTOCOL, lazy=True):
+        super(PickleCodec, self).__init__(lazy=lazy)
+        self.protocol = protocol
+
+    def encode(self, value):
+        return pickle.dumps(value, self.protocol)
+
+    def decode(self, value):
+        return pickle.loads(value)
+
+
+class StructCodec(BaseCodec):
+    """
+    Store fixed layout records packed with the :mod:`struct` format ``fmt``,
+    by default a little endian signed 64 bits integer.
+
+    A tuple is returned on decoding, or the single field itself when ``fmt``
+    describes only one field.
+
+        >>> codec = StructCodec('<qd')
+        >>> codec.decode(codec.encode((42, 0.5)))
+        (42, 0.5)
+    """
+
+    def __init__(self, fmt='<q', lazy=True):
+        super(StructCodec, self).__init__(lazy=lazy)
+        self._struct = struct.Struct(fmt)
+        self.fmt = fmt
+
+    def encode(self, value):
+        if isinstance(value, (tuple, list)):
+            return self._struct.pack(*value)
+        return self._struct.pack(value)
+
+    def decode(self, value):
+        result = self._struct.unpack(value)
+        if len(result) == 1:
+            return result[0]
+        return result
+
+
+class ArrayCodec(BaseCodec):
+    """
+    Store homogeneous numeric sequences as the raw machine representation of
+    an :class:`array.array` of ``typecode``.
+
+        >>> codec = ArrayCodec('l')
+        >>> codec.decode(codec.encode([1, 2, 3]))
+        array('l', [1, 2, 3])
+    """
+
+    def __init__(self, typecode='d', lazy=True):
+        super(ArrayCodec, self).__init__(lazy=lazy)
+        self.typecode = typecode
+
+    def encode(self, value):
+        if not isinstance(value, array.array) or \
+           value.typecode != self.typecode:
+            value = array.array(self.typecode, value)
+        return _array_tobytes(value)
+
+    def decode(self, value):
+        result = array.array(self.typecode)
+        _array_frombytes(result, value)
+        return result
+
+
+class MsgpackCodec(BaseCodec):
+    """
+    Store values packed with `msgpack <https://msgpack.org>`_. Only
+    registered when the ``msgpack`` package is installed.
+    """
+
+    def __init__(self, lazy=True):
+        if msgpack is None:
+            raise DataError("The msgpack codec requires the msgpack package")
+        super(MsgpackCodec, self).__init__(lazy=lazy)
+
+    def encode(self, value):
+        return msgpack.packb(value, use_bin_type=True)
+
+    def decode(self, value):
+        return msgpack.unpackb(value, raw=False)
+
+
+class NumpyCodec(BaseCodec):
+    """
+    Store :class:`numpy.ndarray` values as their raw buffer behind a small
+    dtype and shape header. Only registered when ``numpy`` is installed.
+
+    Decoded arrays are read-only views over the bytes read from the socket,
+    ``copy()`` them before writing in place.
+
+        >>> codec = NumpyCodec()
+        >>> codec.decode(codec.encode(numpy.arange(6).reshape(2, 3)))
+        array([[0, 1, 2],
+               [3, 4, 5]])
+    """
+
+    def __init__(self, lazy=True):
+        if numpy is None:
+            raise DataError("The numpy codec requires the numpy package")
+        super(NumpyCodec, self).__init__(lazy=lazy)
+
+    def encode(self, value):
+        value = numpy.ascontiguousarray(value)
+        if value.dtype.hasobject:
+            raise DataError("Arrays of Python objects can't be stored raw")
+        dtype = b(value.dtype.str)
+        header = struct.pack('<B%dsB%dQ' % (len(dtype), value.ndim),
+                             len(dtype), dtype, value.ndim, *value.shape)
+        return header + _array_to_bytes(value)
+
+    def decode(self, value):
+        offset = 1 + struct.unpack_from('<B', value)[0]
+        dtype = numpy.dtype(value[1:offset].decode('ascii'))
+        ndim = struct.unpack_from('<B', value, offset)[0]
+        shape = struct.unpack_from('<%dQ' % ndim, value, offset + 1)
+        offset += 1 + 8 * ndim
+        count = 1
+        for size in shape:
+            count *= size
+        if len(value) - offset != count * dtype.itemsize:
+            raise DataError("The array value doesn't match its %s%r header"
+                            % (dtype, shape))
+        if not count:
+            return numpy.zeros(shape, dtype)
+        return numpy.frombuffer(value, dtype, offset=offset).reshape(shape)
+
+
+def _array_to_bytes(value):
+    # ``ndarray.tostring`` is deprecated in favour of ``tobytes`` since
+    # numpy 1.9
+    if hasattr(value, 'tobytes'):
+        return value.tobytes()
+    return value.tostring()
+
+
+class CompressedCodec(BaseCodec):
+    """
+    Compress the values encoded by ``codec`` (stored untouched if ``None``)
+    once they reach ``threshold`` bytes.
+
+    Compressed values are prefixed with a four bytes header, the ``MAGIC``
+    followed by the id of the compressor, so compressed and uncompressed
+    values can live side by side and any registered compressor can be read
+    back whatever ``compressor`` the codec writes with. Values smaller than
+    ``threshold``, or that don't shrink, are stored as they are, unless they
+    start with the ``MAGIC``: those get a header with the ``RAW`` id.
+
+        >>> codec = CompressedCodec('json', threshold=4096)
+        >>> ssdb = SSDB(codec=codec)
+
+    .. note:: Compressed values are binary, don't combine this codec with
+       ``decode_responses=True``.
+    """
+    MAGIC = b('\x00ZC')
+    # id of the values stored uncompressed behind a header
+    RAW = b('\x00')
+
+    def __init__(self, codec=None, compressor='zlib', threshold=1024,
+                 encoding='utf-8', lazy=True):
+        super(CompressedCodec, self).__init__(lazy=lazy)
+        try:
+            ident, compress, decompress = COMPRESSORS[compressor]
+        except KeyError:
+            raise DataError("Unknown compressor: %s" % compressor)
+        self.codec = get_codec(codec)
+        self.compressor = compressor
+        self.threshold = threshold
+        self.encoding = encoding
+        self._header = self.MAGIC + ident
+        self._compress = compress
+
+    def encode(self, value):
+        if self.codec is not None:
+            value = self.codec.encode(value)
+        if isinstance(value, unicode):
+            value = value.encode(self.encoding)
+        elif not isinstance(value, bytes):
+            value = b(repr(value) if isinstance(value, float) else str(value))
+        if len(value) >= self.threshold:
+            compressed = self._header + self._compress(value)
+            if len(compressed) < len(value):
+                return compressed
+        if value[:3] == self.MAGIC:
+            return self.MAGIC + self.RAW + value
+        return value
+
+    def decode(self, value):
+        if value[:3] == self.MAGIC:
+            if value[3:4] == self.RAW:
+                value = value[4:]
+            else:
+                try:
+                    decompress = DECOMPRESSORS[value[3:4]]
+                except KeyError:
+                    raise DataError("Unknown compressor id: %r" % value[3:4])
+                value = decompress(value[4:])
+        if self.codec is not None:
+            value = self.codec.decode(value)
+        return value
+
+
+COMPRESSORS = {}
+DECOMPRESSORS = {}
+
+
+def register_compressor(name, ident, compress, decompress):
+    """
+    Register a compressor for :class:`CompressedCodec`. ``ident`` is the
+    single byte written in the header of the values it compresses,
+    ``compress`` and ``decompress`` take and return bytestrings.
+    """
+    ident = b(ident)
+    if len(ident) != 1:
+        raise DataError("The compressor id must be a single byte")
+    if ident == CompressedCodec.RAW:
+        raise DataError("The compressor id %r is reserved" % ident)
+    COMPRESSORS[name] = (ident, compress, decompress)
+    DECOMPRESSORS[ident] = decompress
+
+
+register_compressor('zlib', 'z', zlib.compress, zlib.decompress)
+if bz2 is not None:
+    register_compressor('bz2', 'b', bz2.compress, bz2.decompress)
+if lzma is not None:
+    register_compressor('lzma', 'x', lzma.compress, lzma.decompress)
+
+
+CODECS = {}
+
+
+def register_codec(name, factory):
+    """
+    Register ``factory`` (usually a codec class) under ``name`` so clients
+    can be created with ``codec=name``.
+
+        >>> register_codec('floats', lambda: ArrayCodec('d'))
+        >>> ssdb = SSDB(codec='floats')
+    """
+    CODECS[name] = factory
+
+
+def get_codec(codec, **kwargs):
+    """
+    Return a codec instance. ``codec`` can be ``None``, a codec instance or
+    the name of a registered codec, in which case ``kwargs`` are passed to
+    its factory.
+    """
+    if codec is None or not isinstance(codec, basestring):
+        return codec
+    try:
+        factory = CODECS[codec]
+    except KeyError:
+        raise DataError("Unknown codec: %s" % codec)
+    return factory(**kwargs)
+
+
+register_codec('raw', RawCodec)
+register_codec('json', JSONCodec)
+register_codec('pickle', PickleCodec)
+register_codec('struct', StructCodec)
+register_codec('array', ArrayCodec)
+register_codec('compressed', CompressedCodec)
+if msgpack is not None:
+    register_codec('msgpack', MsgpackCodec)
+if numpy is not None:
+    register_codec('numpy', NumpyCodec)
+
+
+class LazyDecodedDict(Mapping):
+    """
+    Read-only mapping over a raw ``{key: bytestring}`` reply whose values are
+    decoded on first access. Iteration follows the order of the raw mapping.
+    """
+
+    def __init__(self, raw, decode):
+        self._raw = raw
+        self._decode = decode
+        self._decoded = {}
+
+    def __getitem__(self, key):
+        try:
+            return self._decoded[key]
+        except KeyError:
+            value = self._decode(self._raw[key])
+            self._decoded[key] = value
+            return value
+
+    def __iter__(self):
+        return iter(self._raw)
+
+    def __len__(self):
+        return len(self._raw)
+
+    def __contains__(self, key):
+        return key in self._raw
+
+    def __repr__(self):
+        return '{%s}' % ', '.join('%r: %r' % (k, self[k]) for k in self)
+
+
+class LazyDecodedList(Sequence):
+    """
+    Read-only sequence over a raw list of bytestrings whose items are decoded
+    on first access.
+    """
+
+    def __init__(self, raw, decode):
+        self._raw = raw
+        self._decode = decode
+        self._decoded = {}
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in xrange(*index.indices(len(self._raw)))]
+        if index < 0:
+            index += len(self._raw)
+        try:
+            return self._decoded[index]
+        except KeyError:
+            value = self._decode(self._raw[index])
+            self._decoded[index] = value
+            return value
+
+    def __len__(self):
+        return len(self._raw)
+
+    def __eq__(self, other):
+        if not isinstance(other, (list, tuple, Sequence)):
+            return NotImplemented
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+def decode_value(value, codec):
+    "Decode the bytestring ``value`` with ``codec``, if any"
+    if codec is None or value is None:
+        return value
+    return codec.decode(value)
+
+
+def decode_dict(dct, codec):
+    "Decode the values of ``dct`` with ``codec``, lazily if it asks to"
+    if codec is None:
+        return dct
+    if codec.lazy:
+        return LazyDecodedDict(dct, codec.decode)
+    decode = codec.decode
+    for key in dct:
+        dct[key] = decode(dct[key])
+    return dct
+
+
+def decode_list(lst, codec):
+    "Decode the items of ``lst`` with ``codec``, lazily if it asks to"
+    if codec is None:
+        return lst
+    if codec.lazy:
+        return LazyDecodedList(lst, codec.decode)
+    return [codec.decode(item) for item in lst]
@@ -0,0 +1,202 @@
+#coding=utf-8
+"""
+Write-behind aggregation of ``incr``, ``hincr`` and ``zincr``.
+
+    >>> from ssdb import SSDB
+    >>> from ssdb.counter import CounterBuffer
+    >>> counters = CounterBuffer(SSDB(), interval=0.5, max_ops=10000)
+    >>> counters.incr('page_views')
+    >>> counters.hincr('views_by_page', '/index', 3)
+    >>> counters.flush()
+    2
+"""
+from __future__ import with_statement
+import atexit
+import sys
+import threading
+import weakref
+from ssdb._compat import iteritems
+from ssdb.utils import get_integer
+
+
+class CounterBuffer(object):
+    """
+    Sum the deltas of ``incr``/``hincr``/``zincr`` per counter in memory and
+    send them as one batch of commands:
+
+    * every ``interval`` seconds from a background thread, so no delta is
+      more than ``interval`` seconds stale (``None`` disables the thread),
+    * synchronously once ``max_ops`` increments have been buffered,
+    * on `flush`_, `close`_, when leaving the ``with`` block and, if
+      ``flush_on_exit`` is set, when the interpreter exits.
+
+    Deltas of a batch that couldn't reach the server, unable to connect,
+    are merged back into the buffer and sent with the next flush. Once
+    sent, a batch is not sent again by the buffer: a batch whose reply is
+    lost (a timeout, a dropped connection) may have been applied, so its
+    deltas are dropped rather than risk counting them twice.
+    """
+
+    def __init__(self, ssdb, interval=0.1, max_ops=1000, flush_on_exit=True):
+        self.ssdb = ssdb
+        self.interval = interval
+        self.max_ops = max_ops
+        self.last_error = None
+        self._pending = {}
+        self._ops = 0
+        self._lock = threading.Lock()
+        # only one batch in flight at a time, so the increments of a
+        # counter reach the server in order
+        self._flush_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._thread = None
+        if interval is not None:
+            # the thread only holds a weak reference, so the buffer can
+            # still be collected
+            self._thread = threading.Thread(
+                target=_run, args=(weakref.ref(self), interval, self._closed),
+                name='ssdb-counter-buffer')
+            self._thread.daemon = True
+            self._thread.start()
+        if flush_on_exit:
+            atexit.register(_flush_on_exit, weakref.ref(self))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        "Number of counters waiting to be flushed"
+        return len(self._pending)
+
+    def _add(self, counter, amount):
+        with self._lock:
+            self._pending[counter] = self._pending.get(counter, 0) + amount
+            self._ops += 1
+            full = self.max_ops is not None and self._ops >= self.max_ops
+        if full:
+            self.flush()
+
+    def incr(self, name, amount=1):
+        """
+        Buffer an increment of the key ``name`` by ``amount``
+        """
+        self._add(('incr', name), get_integer('amount', amount))
+
+    def decr(self, name, amount=1):
+        """
+        Buffer a decrement of the key ``name`` by ``amount``
+        """
+        self._add(('incr', name), -get_integer('amount', amount))
+
+    def hincr(self, name, key, amount=1):
+        """
+        Buffer an increment of ``key`` in hash ``name`` by ``amount``
+        """
+        self._add(('hincr', name, key), get_integer('amount', amount))
+
+    def hdecr(self, name, key, amount=1):
+        """
+        Buffer a decrement of ``key`` in hash ``name`` by ``amount``
+        """
+        self._add(('hincr', name, key), -get_integer('amount', amount))
+
+    def zincr(self, name, key, amount=1):
+        """
+        Buffer an increment of the score of ``key`` in zset ``name`` by
+        ``amount``
+        """
+        self._add(('zincr', name, key), get_integer('amount', amount))
+
+    def zdecr(self, name, key, amount=1):
+        """
+        Buffer a decrement of the score of ``key`` in zset ``name`` by
+        ``amount``
+        """
+        self._add(('zincr', name, key), -get_integer('amount', amount))
+
+    def pending(self, name, key=None, command=None):
+        """
+        Return the buffered delta of a counter not flushed yet. ``command``
+        defaults to ``incr`` for keys and ``hincr`` for hash fields.
+        """
+        if key is None:
+            counter = (command or 'incr', name)
+        else:
+            counter = (command or 'hincr', name, key)
+        return self._pending.get(counter, 0)
+
+    def flush(self):
+        """
+        Send the buffered deltas as one batch and return the number of
+        commands sent.
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._ops = 0
+            batch = self.ssdb.batch()
+            count = 0
+            for counter, amount in iteritems(pending):
+                if amount == 0:
+                    continue
+                getattr(batch, counter[0])(*(counter[1:] + (amount,)))
+                count += 1
+            if not count:
+                return 0
+            try:
+                # connect first: nothing is sent if it fails
+                connection = batch.connection = \
+                    batch.connection_pool.get_connection('batch')
+                connection.connect()
+            except Exception:
+                batch.reset()
+                self._restore(pending)
+                raise
+            try:
+                # not `execute`, which sends the commands again after a
+                # ConnectionError, possibly counting them twice
+                batch._execute_pipeline(connection, batch.command_stack,
+                                        True)
+            except Exception:
+                connection.disconnect()
+                raise
+            finally:
+                batch.reset()
+            return count
+
+    def _restore(self, pending):
+        with self._lock:
+            for counter, amount in iteritems(pending):
+                self._pending[counter] = self._pending.get(counter, 0) + amount
+
+    def close(self):
+        """
+        Stop the background thread and flush what's left
+        """
+        self._closed.set()
+        if self._thread is not None and \
+           self._thread is not threading.current_thread():
+            self._thread.join()
+        self.flush()
+
+
+def _run(ref, interval, closed):
+    while not closed.wait(interval):
+        buffer = ref()
+        if buffer is None:
+            return
+        try:
+            buffer.flush()
+        except Exception:
+            # kept for inspection
+            buffer.last_error = sys.exc_info()[1]
+        del buffer
+
+
+def _flush_on_exit(ref):
+    buffer = ref()
+    if buffer is not None and not buffer._closed.is_set():
+        buffer.close()
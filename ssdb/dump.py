@@ -0,0 +1,491 @@
+#coding=utf-8
+"""
+Streaming dump and restore of SSDB data.
+
+    $ ssdb-dump dump backup.dump.gz -p 8888 --partitions 4
+    $ ssdb-dump restore backup.part*.dump.gz -p 8889
+
+    >>> from ssdb import SSDB
+    >>> from ssdb.dump import dump, restore
+    >>> dump(SSDB(), 'users.jsonl.gz', prefix='user:')
+    {'records': 12, 'items': 10045, 'files': ['users.jsonl.gz']}
+    >>> restore(SSDB(port=8889), ['users.jsonl.gz'])
+    {'records': 12, 'items': 10045}
+
+The keys are walked page by page with ``scan``, the hashes with ``hlist``
+and ``hscan``, the zsets with ``zlist`` and ``zscan`` and the queues with
+``qlist`` and ``qrange``, so memory use is bounded by ``page_size`` whatever
+the size of the data. Every page is written as a record: the type, the name
+of the hash, zset or queue (empty for keys) and the items of the page. TTLs
+are not kept.
+
+Two formats are available:
+
+* ``jsonl``: a JSON object per record, ``{"type": "hash", "name": "h",
+  "items": [["key", "value"], ...]}``, with the strings which are not UTF-8
+  written as ``{"b64": "..."}``,
+* ``binary``: after a ``SSDBDUMP1`` header, a type byte (``K``, ``H``,
+  ``Z`` or ``Q``), the name and the item count then the items, strings
+  prefixed by their length as 4 bytes big endian and scores as 8 bytes.
+
+Files are compressed with ``gzip`` or ``bz2`` if asked, or if their name
+ends with ``.gz`` or ``.bz2``. The format is guessed from the name when not
+given (``jsonl`` for ``.jsonl`` and ``.json`` files, ``binary``
+otherwise); `restore`_ recognizes both the format and the compression from
+the content.
+
+With ``partitions``, threads dump the keys and the hashes, zsets and queues
+to as many files in parallel, each container in a single file, and
+`restore`_ loads several files in parallel too, writing every record with
+one ``multi_set``, ``multi_hset``, ``multi_zset`` or ``qpush_back`` in
+batches of ``batch_size`` records.
+"""
+from __future__ import with_statement
+import base64
+import bz2
+import gzip
+import json
+import optparse
+import os
+import struct
+import sys
+import threading
+from ssdb._compat import b, unicode
+from ssdb.client import StrictSSDB
+from ssdb.exceptions import DataError
+from ssdb.utils import get_choice, get_positive_integer, prefix_end
+
+TYPES = ('kv', 'hash', 'zset', 'queue')
+LIST_COMMANDS = {'hash': 'hlist', 'zset': 'zlist', 'queue': 'qlist'}
+REVERSE_LIST_COMMANDS = {'hash': 'hrlist', 'zset': 'zrlist',
+                         'queue': 'qrlist'}
+FORMATS = ('jsonl', 'binary')
+COMPRESSIONS = ('gzip', 'bz2')
+MAGIC = b('SSDBDUMP1\n')
+
+_TYPE_CODES = {'kv': b('K'), 'hash': b('H'), 'zset': b('Z'),
+               'queue': b('Q')}
+_CODE_TYPES = dict((code, name) for name, code in _TYPE_CODES.items())
+_LENGTH = struct.Struct('>I')
+_SCORE = struct.Struct('>q')
+
+
+def _to_bytes(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+def _to_text(value):
+    "Return ``value`` as JSON friendly text, or base64 if not UTF-8"
+    if isinstance(value, unicode):
+        return value
+    try:
+        return value.decode('utf-8')
+    except UnicodeDecodeError:
+        return {'b64': base64.b64encode(value).decode('ascii')}
+
+
+def _from_text(value):
+    if isinstance(value, dict):
+        return base64.b64decode(value['b64'].encode('ascii'))
+    return value.encode('utf-8')
+
+
+class JsonWriter(object):
+
+    def __init__(self, f):
+        self.f = f
+
+    def write(self, type, name, items):
+        if type == 'zset':
+            items = [[_to_text(key), score] for key, score in items]
+        elif type == 'queue':
+            items = [_to_text(item) for item in items]
+        else:
+            items = [[_to_text(key), _to_text(value)]
+                     for key, value in items]
+        record = {'type': type, 'name': _to_text(name or b('')),
+                  'items': items}
+        self.f.write(b(json.dumps(record, separators=(',', ':'))) +
+                     b('\n'))
+
+
+class BinaryWriter(object):
+
+    def __init__(self, f):
+        self.f = f
+        f.write(MAGIC)
+
+    def _string(self, parts, value):
+        value = _to_bytes(value)
+        parts.append(_LENGTH.pack(len(value)))
+        parts.append(value)
+
+    def write(self, type, name, items):
+        parts = [_TYPE_CODES[type]]
+        self._string(parts, name or b(''))
+        parts.append(_LENGTH.pack(len(items)))
+        if type == 'zset':
+            for key, score in items:
+                self._string(parts, key)
+                parts.append(_SCORE.pack(score))
+        elif type == 'queue':
+            for item in items:
+                self._string(parts, item)
+        else:
+            for key, value in items:
+                self._string(parts, key)
+                self._string(parts, value)
+        self.f.write(b('').join(parts))
+
+
+def _read_json(f):
+    for line in f:
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line.decode('utf-8'))
+        type, items = record['type'], record['items']
+        if type == 'zset':
+            items = [(_from_text(key), score) for key, score in items]
+        elif type == 'queue':
+            items = [_from_text(item) for item in items]
+        else:
+            items = [(_from_text(key), _from_text(value))
+                     for key, value in items]
+        yield type, _from_text(record['name']), items
+
+
+def _read_exactly(f, size):
+    data = f.read(size)
+    if len(data) != size:
+        raise DataError('Truncated dump file')
+    return data
+
+
+def _read_binary(f):
+    _read_exactly(f, len(MAGIC))
+    length, score = _LENGTH.size, _SCORE.size
+
+    def string():
+        return _read_exactly(f, _LENGTH.unpack(_read_exactly(f, length))[0])
+    while True:
+        code = f.read(1)
+        if not code:
+            return
+        if code not in _CODE_TYPES:
+            raise DataError('Corrupted dump file')
+        type = _CODE_TYPES[code]
+        name = string()
+        count = _LENGTH.unpack(_read_exactly(f, length))[0]
+        if type == 'zset':
+            items = [(string(), _SCORE.unpack(_read_exactly(f, score))[0])
+                     for _ in range(count)]
+        elif type == 'queue':
+            items = [string() for _ in range(count)]
+        else:
+            items = [(string(), string()) for _ in range(count)]
+        yield type, name, items
+
+
+def open_file(path, mode, compression=None):
+    """
+    Open ``path`` in binary ``mode``, ``'r'`` or ``'w'``, compressed with
+    ``compression``; when reading, the compression is found from the content
+    """
+    if mode == 'r':
+        with open(path, 'rb') as f:
+            head = f.read(3)
+        if head[:2] == b('\x1f\x8b'):
+            compression = 'gzip'
+        elif head == b('BZh'):
+            compression = 'bz2'
+        else:
+            compression = None
+    if compression == 'gzip':
+        return gzip.open(path, mode + 'b')
+    if compression == 'bz2':
+        return bz2.BZ2File(path, mode + 'b')
+    return open(path, mode + 'b')
+
+
+def read_dump(path):
+    "Yield the records ``(type, name, items)`` of the dump file at ``path``"
+    with open_file(path, 'r') as f:
+        head = f.read(len(MAGIC))
+    with open_file(path, 'r') as f:
+        if head == MAGIC:
+            for record in _read_binary(f):
+                yield record
+        else:
+            for record in _read_json(f):
+                yield record
+
+
+def guess(path):
+    "Return the ``(format, compression)`` of ``path`` from its name"
+    root, extension = os.path.splitext(path)
+    compression = {'.gz': 'gzip', '.bz2': 'bz2'}.get(extension.lower())
+    if compression is not None:
+        extension = os.path.splitext(root)[1]
+    format = 'jsonl' if extension.lower() in ('.jsonl', '.json') else 'binary'
+    return format, compression
+
+
+def part_path(path, index):
+    "Return the name of the part ``index`` of the dump ``path``"
+    directory, name = os.path.split(path)
+    base, dot, extensions = name.partition('.')
+    return os.path.join(directory, '%s.part%d%s%s' % (base, index, dot,
+                                                      extensions))
+
+
+class Dumper(object):
+    """
+    Walk the data of ``ssdb`` of the ``types`` whose keys or names start with
+    ``prefix``, ``page_size`` items at a time
+    """
+
+    def __init__(self, ssdb, prefix='', types=TYPES, page_size=1000):
+        self.ssdb = ssdb
+        self.prefix = prefix
+        for type in types:
+            get_choice('types', type, TYPES)
+        self.types = types
+        self.page_size = get_positive_integer('page_size', page_size)
+        # ranges exclude their start and include their end: ``prefix``
+        # itself is looked up alone and ``end`` dropped from the replies
+        self.end = prefix_end(prefix) if prefix else ''
+
+    def _clip(self, names):
+        "Return the number of ``names`` which start with the prefix"
+        if names and self.end and _to_bytes(names[-1]) == self.end:
+            return len(names) - 1
+        return len(names)
+
+    def names(self, type):
+        "Yield the names of the hashes, zsets or queues to dump"
+        execute = self.ssdb.execute_command
+        start = self.prefix
+        if start:
+            for name in execute(REVERSE_LIST_COMMANDS[type],
+                                _to_bytes(start) + b('\x00'), start, 1):
+                yield name
+        while True:
+            names = execute(LIST_COMMANDS[type], start, self.end,
+                            self.page_size)
+            for name in names[:self._clip(names)]:
+                yield name
+            if len(names) < self.page_size:
+                return
+            start = names[-1]
+
+    def units(self):
+        """
+        Yield the units of work, ``(type, name)``, ``name`` being ``None``
+        for the keys
+        """
+        for type in self.types:
+            if type == 'kv':
+                yield type, None
+            else:
+                for name in self.names(type):
+                    yield type, name
+
+    def pages(self, type, name=None):
+        "Yield the pages of items of the keys or of a container"
+        execute = self.ssdb.execute_command
+        size = self.page_size
+        if type == 'queue':
+            offset = 0
+            while True:
+                items = execute('qrange', name, offset, size)
+                if items:
+                    yield items
+                if len(items) < size:
+                    return
+                offset += size
+        start, score = self.prefix if type == 'kv' else '', ''
+        if type == 'kv' and start:
+            keys, values = execute('rscan', _to_bytes(start) + b('\x00'),
+                                   start, 1, result_format='pairs')
+            if keys:
+                yield list(zip(keys, values))
+        while True:
+            if type == 'kv':
+                keys, values = execute('scan', start, self.end, size,
+                                       result_format='pairs')
+            elif type == 'hash':
+                keys, values = execute('hscan', name, start, '', size,
+                                       result_format='pairs')
+            else:
+                keys, values = execute('zscan', name, start, score, '', size,
+                                       result_format='pairs')
+            count = self._clip(keys) if type == 'kv' else len(keys)
+            if count:
+                yield list(zip(keys[:count], values[:count]))
+            if len(keys) < size:
+                return
+            start = keys[-1]
+            if type == 'zset':
+                score = values[-1]
+
+
+def dump(ssdb, path, format=None, compression=None, partitions=1,
+         prefix='', types=TYPES, page_size=1000):
+    """
+    Dump the data of ``ssdb`` to the file at ``path``, or to ``partitions``
+    files named after it, and return the ``records`` and ``items`` written
+    and the ``files``
+    """
+    guessed_format, guessed_compression = guess(path)
+    format = get_choice('format', format or guessed_format, FORMATS)
+    compression = compression or guessed_compression
+    if compression is not None:
+        get_choice('compression', compression, COMPRESSIONS)
+    partitions = get_positive_integer('partitions', partitions)
+    dumper = Dumper(ssdb, prefix, types, page_size)
+    writer_class = JsonWriter if format == 'jsonl' else BinaryWriter
+    files = [path] if partitions == 1 else [part_path(path, i)
+                                            for i in range(partitions)]
+    units = dumper.units()
+    lock = threading.Lock()
+    stats = {'records': 0, 'items': 0, 'files': files}
+    errors = []
+
+    def work(path):
+        records = items = 0
+        try:
+            with open_file(path, 'w', compression) as f:
+                writer = writer_class(f)
+                while not errors:
+                    with lock:
+                        unit = next(units, None)
+                    if unit is None:
+                        break
+                    type, name = unit
+                    for page in dumper.pages(type, name):
+                        writer.write(type, name, page)
+                        records += 1
+                        items += len(page)
+        except Exception:
+            errors.append(sys.exc_info()[1])
+        with lock:
+            stats['records'] += records
+            stats['items'] += items
+
+    _run_parallel(work, files)
+    if errors:
+        raise errors[0]
+    return stats
+
+
+def restore(ssdb, paths, batch_size=100):
+    """
+    Write the records of the dump files at ``paths``, in parallel, to
+    ``ssdb`` and return the ``records`` and ``items`` restored
+    """
+    batch_size = get_positive_integer('batch_size', batch_size)
+    lock = threading.Lock()
+    stats = {'records': 0, 'items': 0}
+    errors = []
+
+    def work(path):
+        records = items = 0
+        try:
+            batch = ssdb.batch()
+            for type, name, page in read_dump(path):
+                args = []
+                if type == 'queue':
+                    args.extend(page)
+                else:
+                    for key, value in page:
+                        args.append(key)
+                        args.append(value)
+                if type == 'kv':
+                    batch.execute_command('multi_set', *args)
+                elif type == 'hash':
+                    batch.execute_command('multi_hset', name, *args)
+                elif type == 'zset':
+                    batch.execute_command('multi_zset', name, *args)
+                else:
+                    batch.execute_command('qpush_back', name, *args)
+                records += 1
+                items += len(page)
+                if len(batch) >= batch_size:
+                    batch.execute()
+                if errors:
+                    return
+            batch.execute()
+        except Exception:
+            errors.append(sys.exc_info()[1])
+        finally:
+            with lock:
+                stats['records'] += records
+                stats['items'] += items
+
+    _run_parallel(work, paths)
+    if errors:
+        raise errors[0]
+    return stats
+
+
+def _run_parallel(target, args):
+    if len(args) == 1:
+        target(args[0])
+        return
+    threads = [threading.Thread(target=target, args=(arg,)) for arg in args]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(
+        usage='ssdb-dump dump [options] FILE\n'
+              '       ssdb-dump restore [options] FILE ...')
+    parser.add_option('-H', '--host', default='127.0.0.1',
+                      help='server host [%default]')
+    parser.add_option('-p', '--port', type='int', default=8888,
+                      help='server port [%default]')
+    parser.add_option('-f', '--format', choices=FORMATS,
+                      help='jsonl or binary [from the file name]')
+    parser.add_option('-z', '--compression', choices=COMPRESSIONS,
+                      help='gzip or bz2 [from the file name]')
+    parser.add_option('--prefix', default='',
+                      help='only dump the keys and names with this prefix')
+    parser.add_option('-t', '--type', action='append', choices=TYPES,
+                      help='only dump this type, kv, hash, zset or queue')
+    parser.add_option('--partitions', type='int', default=1,
+                      help='files dumped in parallel [%default]')
+    parser.add_option('--page-size', type='int', default=1000,
+                      help='items per page and per record [%default]')
+    parser.add_option('--batch-size', type='int', default=100,
+                      help='records restored per batch [%default]')
+    options, args = parser.parse_args(argv)
+    if len(args) < 2 or args[0] not in ('dump', 'restore'):
+        parser.error('expected dump FILE or restore FILE ...')
+    if args[0] == 'dump' and len(args) != 2:
+        parser.error('expected a single file to dump to')
+    client = StrictSSDB(host=options.host, port=options.port)
+    try:
+        if args[0] == 'dump':
+            stats = dump(client, args[1], options.format,
+                         options.compression, options.partitions,
+                         options.prefix, options.type or TYPES,
+                         options.page_size)
+            print('%d items in %d records dumped to %s' % (
+                stats['items'], stats['records'], ', '.join(stats['files'])))
+        else:
+            stats = restore(client, args[1:], options.batch_size)
+            print('%(items)d items in %(records)d records restored' % stats)
+    except (ValueError, DataError, IOError):
+        sys.stderr.write('%s\n' % sys.exc_info()[1])
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
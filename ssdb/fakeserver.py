@@ -0,0 +1,987 @@
+#coding=utf-8
+"""
+An in-process fake SSDB server for tests and benchmarks.
+
+    >>> from ssdb.fakeserver import FakeServer
+    >>> with FakeServer(latency=0.001) as server:
+    ...     client = server.client()
+    ...     client.set('foo', 'bar')
+    ...     client.get('foo')
+    True
+    'bar'
+
+The server speaks the SSDB block protocol over TCP on a port of its own
+(random by default), with a thread per connection, and implements the KV,
+hash, zset and queue commands wrapped by `StrictSSDB` with SSDB semantics:
+keys, hash keys and zset entries are kept sorted so scans and ranges return
+them in the server's order. All data lives in memory.
+
+Network conditions can be simulated:
+
+* ``latency`` seconds are added to every round trip, once per burst of
+  pipelined requests like a real network,
+* ``bandwidth`` caps the bytes per second sent to each client,
+* `inject`_ makes the next commands slow, fail with an error or lose their
+  connection before or in the middle of the response.
+
+``stats`` counts the connections, requests and round trips served and
+``commands`` the requests of each command.
+"""
+from __future__ import with_statement
+import bisect
+import collections
+import inspect
+import socket
+import sys
+import threading
+import time as mod_time
+from ssdb._compat import b, bytes, nativestr
+from ssdb.client import SSDB
+from ssdb.exceptions import DataError
+
+SYM_LF = b('\n')
+SYM_EMPTY = b('')
+
+FAULTS = ('slow', 'error', 'close', 'disconnect')
+
+
+class CommandError(Exception):
+    "A command the fake server rejects with ``status``"
+
+    def __init__(self, message, status='client_error'):
+        super(CommandError, self).__init__(message)
+        self.status = status
+
+
+class NotFound(list):
+    "The values of a ``not_found`` reply that has some"
+    pass
+
+
+def _arity(func):
+    "Return the least and most arguments the method ``func`` takes"
+    try:
+        spec = inspect.getfullargspec(func)
+    except AttributeError:
+        spec = inspect.getargspec(func)
+    most = len(spec.args) - 1
+    least = most - len(spec.defaults or ())
+    return least, None if spec.varargs else most
+
+
+def _int(value, name='value'):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise CommandError('%s is not an integer or out of range' % name)
+
+
+def _score(value, default):
+    "Parse a score bound, ``''`` meaning infinity"
+    if value == SYM_EMPTY:
+        return default
+    return _int(value, 'score')
+
+
+def _substr(value, start, size):
+    "Apply the ``substr`` slicing of SSDB"
+    length = len(value)
+    if start < 0:
+        start = max(length + start, 0)
+    if size is None:
+        end = length
+    elif size < 0:
+        end = length + size
+    else:
+        end = start + size
+    return value[start:max(end, start)]
+
+
+class SortedMap(object):
+    """
+    A dict keeping its keys sorted, for the key ranges of SSDB.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.keys = []
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def set(self, key, value):
+        "Set ``key`` and return whether it's new"
+        if key not in self.data:
+            bisect.insort(self.keys, key)
+            self.data[key] = value
+            return True
+        self.data[key] = value
+        return False
+
+    def delete(self, key):
+        "Delete ``key`` and return whether it existed"
+        if key not in self.data:
+            return False
+        del self.data[key]
+        del self.keys[bisect.bisect_left(self.keys, key)]
+        return True
+
+    def range(self, start, end, limit, reverse=False):
+        """
+        Return the keys in (``start``, ``end``] in ascending order, or the
+        keys in [``end``, ``start``) in descending order with ``reverse``.
+        ``''`` bounds are infinite.
+        """
+        keys = self.keys
+        if not reverse:
+            lo = bisect.bisect_right(keys, start) if start else 0
+            hi = bisect.bisect_right(keys, end) if end else len(keys)
+            return keys[lo:min(hi, lo + max(limit, 0))]
+        hi = bisect.bisect_left(keys, start) if start else len(keys)
+        lo = bisect.bisect_left(keys, end) if end else 0
+        result = keys[max(lo, hi - max(limit, 0)):hi]
+        result.reverse()
+        return result
+
+
+class SortedSet(object):
+    """
+    The entries of a zset, sorted by score then key.
+    """
+
+    def __init__(self):
+        self.scores = {}
+        self.entries = []
+
+    def __len__(self):
+        return len(self.scores)
+
+    def set(self, key, score):
+        new = key not in self.scores
+        if not new:
+            self.delete(key)
+        self.scores[key] = score
+        bisect.insort(self.entries, (score, key))
+        return new
+
+    def delete(self, key):
+        if key not in self.scores:
+            return False
+        score = self.scores.pop(key)
+        del self.entries[bisect.bisect_left(self.entries, (score, key))]
+        return True
+
+    def rank(self, key):
+        if key not in self.scores:
+            return -1
+        return bisect.bisect_left(self.entries, (self.scores[key], key))
+
+    def between(self, score_start, score_end):
+        "Entries with ``score_start <= score <= score_end``"
+        lo = bisect.bisect_left(self.entries, (score_start,))
+        hi = bisect.bisect_left(self.entries, (score_end + 1,))
+        return self.entries[lo:hi]
+
+    def scan(self, key_start, score_start, score_end, limit, reverse=False):
+        """
+        Return the entries after ``key_start``/``score_start`` up to
+        ``score_end``, like ``zscan`` (``zrscan`` with ``reverse``)
+        """
+        entries = self.entries
+        if not reverse:
+            if score_start is None:
+                lo = 0
+            elif key_start:
+                lo = bisect.bisect_right(entries, (score_start, key_start))
+            else:
+                lo = bisect.bisect_left(entries, (score_start,))
+            hi = len(entries) if score_end is None else \
+                bisect.bisect_left(entries, (score_end + 1,))
+            return entries[lo:min(hi, lo + max(limit, 0))]
+        if score_start is None:
+            hi = len(entries)
+        elif key_start:
+            hi = bisect.bisect_left(entries, (score_start, key_start))
+        else:
+            hi = bisect.bisect_left(entries, (score_start + 1,))
+        lo = 0 if score_end is None else \
+            bisect.bisect_left(entries, (score_end,))
+        result = entries[max(lo, hi - max(limit, 0)):hi]
+        result.reverse()
+        return result
+
+
+class FakeStore(object):
+    """
+    The data of a `FakeServer`_ and the implementation of its commands:
+    ``cmd_<name>`` methods take the arguments of the command as byte strings
+    and return the values of the reply (``ok`` is implied), raise
+    `CommandError`_, or return ``None`` (or a `NotFound`_ list of values)
+    for ``not_found``.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self._time = mod_time.time
+        # command -> (least, most) arguments
+        self._arities = {}
+        self._reset()
+
+    def _reset(self):
+        self.kv = SortedMap()
+        self.expires = {}
+        self.hashes = {}
+        self.zsets = {}
+        self.queues = {}
+
+    def execute(self, args):
+        """
+        Run the command ``args`` and return the reply as a list of byte
+        strings, the status first
+        """
+        command = nativestr(args[0])
+        func = getattr(self, 'cmd_' + command, None)
+        if func is None:
+            return [b('client_error'), b('Unknown Command: %s' % command)]
+        arity = self._arities.get(command)
+        if arity is None:
+            arity = self._arities[command] = _arity(func)
+        least, most = arity
+        if len(args) - 1 < least or most is not None and len(args) - 1 > most:
+            return [b('client_error'), b('wrong number of arguments')]
+        with self.lock:
+            try:
+                result = func(*args[1:])
+            except CommandError:
+                e = sys.exc_info()[1]
+                return [b(e.status), b(str(e))]
+        if result is None:
+            return [b('not_found')]
+        if isinstance(result, NotFound):
+            return [b('not_found')] + [_encode(value) for value in result]
+        return [b('ok')] + [_encode(value) for value in result]
+
+    def flush(self):
+        "Remove all the data"
+        with self.lock:
+            self._reset()
+
+    # helpers
+
+    def _expired(self, name):
+        deadline = self.expires.get(name)
+        if deadline is not None and deadline <= self._time():
+            self.kv.delete(name)
+            del self.expires[name]
+            return True
+        return False
+
+    def _get(self, name):
+        self._expired(name)
+        return self.kv.get(name)
+
+    def _set(self, name, value):
+        self.expires.pop(name, None)
+        self.kv.set(name, value)
+
+    def _keys(self, start, end, limit, reverse=False):
+        keys = self.kv.range(start, end, _int(limit, 'limit'), reverse)
+        live = [key for key in keys if not self._expired(key)]
+        if len(live) < len(keys):
+            # expired keys were purged, the range may now go further
+            return self._keys(start, end, limit, reverse)
+        return live
+
+    def _incr(self, mapping, key, amount):
+        value = _int(mapping.get(key, b('0')))
+        return value + _int(amount, 'amount')
+
+    def _names(self, collection, start, end, limit, reverse=False):
+        names = sorted(name for name, value in collection.items() if value)
+        index = SortedMap()
+        index.keys = names
+        return index.range(start, end, _int(limit, 'limit'), reverse)
+
+    def _hash(self, name, create=False):
+        if create:
+            return self.hashes.setdefault(name, SortedMap())
+        return self.hashes.get(name) or SortedMap()
+
+    def _zset(self, name, create=False):
+        if create:
+            return self.zsets.setdefault(name, SortedSet())
+        return self.zsets.get(name) or SortedSet()
+
+    def _queue(self, name, create=False):
+        if create:
+            return self.queues.setdefault(name, [])
+        return self.queues.get(name) or []
+
+    def _bits(self, name, offset):
+        offset = _int(offset, 'offset')
+        if offset < 0:
+            raise CommandError('offset is out of range')
+        return bytearray(self._get(name) or SYM_EMPTY), offset >> 3, \
+            1 << (offset & 7)
+
+    # KV
+
+    def cmd_get(self, name):
+        value = self._get(name)
+        return None if value is None else [value]
+
+    def cmd_set(self, name, value):
+        self._set(name, value)
+        return [1]
+
+    def cmd_setx(self, name, value, ttl):
+        self._set(name, value)
+        self.expires[name] = self._time() + _int(ttl, 'ttl')
+        return [1]
+
+    def cmd_setnx(self, name, value):
+        if self._get(name) is not None:
+            return [0]
+        self._set(name, value)
+        return [1]
+
+    def cmd_getset(self, name, value):
+        previous = self._get(name)
+        self._set(name, value)
+        # SSDB sends an empty value along
+        return NotFound([SYM_EMPTY]) if previous is None else [previous]
+
+    def cmd_del(self, name):
+        self.expires.pop(name, None)
+        self.kv.delete(name)
+        return [1]
+
+    def cmd_exists(self, name):
+        return [int(self._get(name) is not None)]
+
+    def cmd_expire(self, name, ttl):
+        if self._get(name) is None:
+            return [0]
+        self.expires[name] = self._time() + _int(ttl, 'ttl')
+        return [1]
+
+    def cmd_ttl(self, name):
+        deadline = self.expires.get(name)
+        if self._get(name) is None or deadline is None:
+            return [-1]
+        return [int(round(deadline - self._time()))]
+
+    def cmd_incr(self, name, amount=b('1')):
+        value = self._incr(self.kv, name, amount) if \
+            self._get(name) is not None else _int(amount, 'amount')
+        self.kv.set(name, _encode(value))
+        return [value]
+
+    def cmd_decr(self, name, amount=b('1')):
+        return self.cmd_incr(name, _encode(-_int(amount, 'amount')))
+
+    def cmd_multi_set(self, *kvs):
+        for i in range(0, len(kvs) - 1, 2):
+            self._set(kvs[i], kvs[i + 1])
+        return [len(kvs) // 2]
+
+    def cmd_multi_get(self, *names):
+        result = []
+        for name in names:
+            value = self._get(name)
+            if value is not None:
+                result.extend((name, value))
+        return result
+
+    def cmd_multi_del(self, *names):
+        for name in names:
+            self.cmd_del(name)
+        return [len(names)]
+
+    def cmd_keys(self, start, end, limit):
+        return self._keys(start, end, limit)
+
+    def cmd_rkeys(self, start, end, limit):
+        return self._keys(start, end, limit, reverse=True)
+
+    def cmd_scan(self, start, end, limit):
+        result = []
+        for key in self._keys(start, end, limit):
+            result.extend((key, self.kv.get(key)))
+        return result
+
+    def cmd_rscan(self, start, end, limit):
+        result = []
+        for key in self._keys(start, end, limit, reverse=True):
+            result.extend((key, self.kv.get(key)))
+        return result
+
+    def cmd_strlen(self, name):
+        return [len(self._get(name) or SYM_EMPTY)]
+
+    def cmd_substr(self, name, start=b('0'), size=None):
+        value = self._get(name) or SYM_EMPTY
+        size = None if size is None else _int(size, 'size')
+        return [_substr(value, _int(start, 'start'), size)]
+
+    def cmd_getbit(self, name, offset):
+        value, index, mask = self._bits(name, offset)
+        return [int(index < len(value) and bool(value[index] & mask))]
+
+    def cmd_setbit(self, name, offset, val):
+        value, index, mask = self._bits(name, offset)
+        if index >= len(value):
+            value.extend(bytearray(index + 1 - len(value)))
+        previous = int(bool(value[index] & mask))
+        if _int(val, 'val'):
+            value[index] |= mask
+        else:
+            value[index] &= ~mask & 0xff
+        self.kv.set(name, bytes(value))
+        return [previous]
+
+    def cmd_countbit(self, name, start=b('0'), size=None):
+        value = self.cmd_substr(name, start, size)[0]
+        return [sum(bin(byte).count('1') for byte in bytearray(value))]
+
+    # hashes
+
+    def cmd_hset(self, name, key, value):
+        return [int(self._hash(name, True).set(key, value))]
+
+    def cmd_hget(self, name, key):
+        value = self._hash(name).get(key)
+        return None if value is None else [value]
+
+    def cmd_hdel(self, name, key):
+        return [int(self._hash(name).delete(key))]
+
+    def cmd_hexists(self, name, key):
+        return [int(key in self._hash(name))]
+
+    def cmd_hincr(self, name, key, amount=b('1')):
+        value = self._incr(self._hash(name), key, amount)
+        self._hash(name, True).set(key, _encode(value))
+        return [value]
+
+    def cmd_hdecr(self, name, key, amount=b('1')):
+        return self.cmd_hincr(name, key, _encode(-_int(amount, 'amount')))
+
+    def cmd_hsize(self, name):
+        return [len(self._hash(name))]
+
+    def cmd_hclear(self, name):
+        return [len(self.hashes.pop(name, ()))]
+
+    def cmd_hgetall(self, name):
+        hash_ = self._hash(name)
+        result = []
+        for key in hash_.keys:
+            result.extend((key, hash_.get(key)))
+        return result
+
+    def cmd_hkeys(self, name, start, end, limit):
+        return self._hash(name).range(start, end, _int(limit, 'limit'))
+
+    def cmd_hscan(self, name, start, end, limit, reverse=False):
+        hash_ = self._hash(name)
+        result = []
+        for key in hash_.range(start, end, _int(limit, 'limit'), reverse):
+            result.extend((key, hash_.get(key)))
+        return result
+
+    def cmd_hrscan(self, name, start, end, limit):
+        return self.cmd_hscan(name, start, end, limit, True)
+
+    def cmd_hlist(self, start, end, limit):
+        return self._names(self.hashes, start, end, limit)
+
+    def cmd_hrlist(self, start, end, limit):
+        return self._names(self.hashes, start, end, limit, True)
+
+    def cmd_multi_hset(self, name, *kvs):
+        hash_ = self._hash(name, True)
+        for i in range(0, len(kvs) - 1, 2):
+            hash_.set(kvs[i], kvs[i + 1])
+        return [len(kvs) // 2]
+
+    def cmd_multi_hget(self, name, *keys):
+        hash_ = self._hash(name)
+        result = []
+        for key in keys:
+            if key in hash_:
+                result.extend((key, hash_.get(key)))
+        return result
+
+    def cmd_multi_hdel(self, name, *keys):
+        hash_ = self._hash(name)
+        return [sum(hash_.delete(key) for key in keys)]
+
+    # zsets
+
+    def cmd_zset(self, name, key, score):
+        return [int(self._zset(name, True).set(key, _int(score, 'score')))]
+
+    def cmd_zget(self, name, key):
+        score = self._zset(name).scores.get(key)
+        return None if score is None else [score]
+
+    def cmd_zdel(self, name, key):
+        return [int(self._zset(name).delete(key))]
+
+    def cmd_zexists(self, name, key):
+        return [int(key in self._zset(name).scores)]
+
+    def cmd_zincr(self, name, key, amount=b('1')):
+        zset = self._zset(name, True)
+        score = zset.scores.get(key, 0) + _int(amount, 'amount')
+        zset.set(key, score)
+        return [score]
+
+    def cmd_zdecr(self, name, key, amount=b('1')):
+        return self.cmd_zincr(name, key, _encode(-_int(amount, 'amount')))
+
+    def cmd_zsize(self, name):
+        return [len(self._zset(name))]
+
+    def cmd_zclear(self, name):
+        return [len(self.zsets.pop(name, ()))]
+
+    def cmd_zlist(self, start, end, limit):
+        return self._names(self.zsets, start, end, limit)
+
+    def cmd_zrlist(self, start, end, limit):
+        return self._names(self.zsets, start, end, limit, True)
+
+    def cmd_multi_zset(self, name, *kvs):
+        zset = self._zset(name, True)
+        for i in range(0, len(kvs) - 1, 2):
+            zset.set(kvs[i], _int(kvs[i + 1], 'score'))
+        return [len(kvs) // 2]
+
+    def cmd_multi_zget(self, name, *keys):
+        scores = self._zset(name).scores
+        result = []
+        for key in keys:
+            if key in scores:
+                result.extend((key, scores[key]))
+        return result
+
+    def cmd_multi_zdel(self, name, *keys):
+        zset = self._zset(name)
+        return [sum(zset.delete(key) for key in keys)]
+
+    def _zscan(self, name, key_start, score_start, score_end, limit,
+               reverse=False):
+        start = None if score_start == SYM_EMPTY else \
+            _int(score_start, 'score')
+        end = None if score_end == SYM_EMPTY else _int(score_end, 'score')
+        return self._zset(name).scan(key_start, start, end,
+                                     _int(limit, 'limit'), reverse)
+
+    def cmd_zkeys(self, name, key_start, score_start, score_end, limit):
+        return [key for score, key in
+                self._zscan(name, key_start, score_start, score_end, limit)]
+
+    def cmd_zscan(self, name, key_start, score_start, score_end, limit):
+        result = []
+        for score, key in self._zscan(name, key_start, score_start,
+                                      score_end, limit):
+            result.extend((key, score))
+        return result
+
+    def cmd_zrscan(self, name, key_start, score_start, score_end, limit):
+        result = []
+        for score, key in self._zscan(name, key_start, score_start,
+                                      score_end, limit, True):
+            result.extend((key, score))
+        return result
+
+    def cmd_zrank(self, name, key):
+        return [self._zset(name).rank(key)]
+
+    def cmd_zrrank(self, name, key):
+        zset = self._zset(name)
+        rank = zset.rank(key)
+        return [-1 if rank < 0 else len(zset) - rank - 1]
+
+    def cmd_zrange(self, name, offset, limit, reverse=False):
+        entries = self._zset(name).entries
+        if reverse:
+            entries = entries[::-1]
+        offset = _int(offset, 'offset')
+        result = []
+        for score, key in entries[offset:offset + _int(limit, 'limit')]:
+            result.extend((key, score))
+        return result
+
+    def cmd_zrrange(self, name, offset, limit):
+        return self.cmd_zrange(name, offset, limit, True)
+
+    def _between(self, name, score_start, score_end):
+        return self._zset(name).between(_score(score_start, -sys.maxsize),
+                                        _score(score_end, sys.maxsize))
+
+    def cmd_zcount(self, name, score_start, score_end):
+        return [len(self._between(name, score_start, score_end))]
+
+    def cmd_zsum(self, name, score_start, score_end):
+        return [sum(score for score, key in
+                    self._between(name, score_start, score_end))]
+
+    def cmd_zavg(self, name, score_start, score_end):
+        scores = [score for score, key in
+                  self._between(name, score_start, score_end)]
+        return [float(sum(scores)) / len(scores) if scores else 0]
+
+    def cmd_zremrangebyrank(self, name, rank_start, rank_end):
+        zset = self._zset(name)
+        entries = zset.entries[_int(rank_start, 'start'):
+                               _int(rank_end, 'end') + 1]
+        for score, key in entries:
+            zset.delete(key)
+        return [len(entries)]
+
+    def cmd_zremrangebyscore(self, name, score_start, score_end):
+        zset = self._zset(name)
+        entries = self._between(name, score_start, score_end)
+        for score, key in entries:
+            zset.delete(key)
+        return [len(entries)]
+
+    # queues
+
+    def cmd_qpush_back(self, name, *items):
+        queue = self._queue(name, True)
+        queue.extend(items)
+        return [len(queue)]
+
+    def cmd_qpush_front(self, name, *items):
+        queue = self._queue(name, True)
+        queue[:0] = reversed(items)
+        return [len(queue)]
+
+    def cmd_qpop_front(self, name, size=b('1')):
+        queue = self._queue(name)
+        size = _int(size, 'size')
+        items = queue[:size]
+        del queue[:size]
+        return items
+
+    def cmd_qpop_back(self, name, size=b('1')):
+        queue = self._queue(name)
+        items = queue[-_int(size, 'size'):][::-1]
+        del queue[len(queue) - len(items):]
+        return items
+
+    def cmd_qfront(self, name):
+        queue = self._queue(name)
+        return [queue[0]] if queue else None
+
+    def cmd_qback(self, name):
+        queue = self._queue(name)
+        return [queue[-1]] if queue else None
+
+    def cmd_qsize(self, name):
+        return [len(self._queue(name))]
+
+    def cmd_qclear(self, name):
+        return [len(self.queues.pop(name, ()))]
+
+    def cmd_qget(self, name, index):
+        queue = self._queue(name)
+        index = _int(index, 'index')
+        if not -len(queue) <= index < len(queue):
+            return None
+        return [queue[index]]
+
+    def cmd_qset(self, name, index, value):
+        queue = self._queue(name)
+        index = _int(index, 'index')
+        if not -len(queue) <= index < len(queue):
+            raise CommandError('index out of range', 'error')
+        queue[index] = value
+        return []
+
+    def cmd_qrange(self, name, offset, limit):
+        queue = self._queue(name)
+        offset = _int(offset, 'offset')
+        if offset < 0:
+            offset = max(len(queue) + offset, 0)
+        return queue[offset:offset + _int(limit, 'limit')]
+
+    def cmd_qslice(self, name, start, end):
+        queue = self._queue(name)
+        start, end = _int(start, 'start'), _int(end, 'end')
+        if start < 0:
+            start = max(len(queue) + start, 0)
+        if end < 0:
+            end = len(queue) + end
+        return queue[start:end + 1]
+
+    def cmd_qtrim_front(self, name, size=b('1')):
+        return [len(self.cmd_qpop_front(name, size))]
+
+    def cmd_qtrim_back(self, name, size=b('1')):
+        return [len(self.cmd_qpop_back(name, size))]
+
+    def cmd_qlist(self, start, end, limit):
+        return self._names(self.queues, start, end, limit)
+
+    def cmd_qrlist(self, start, end, limit):
+        return self._names(self.queues, start, end, limit, True)
+
+    # server
+
+    def cmd_dbsize(self):
+        return [len(self.kv) + len(self.hashes) + len(self.zsets) +
+                len(self.queues)]
+
+    def cmd_flushdb(self):
+        self._reset()
+        return []
+
+    def cmd_ping(self):
+        return []
+
+
+def _encode(value):
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, float):
+        return b(repr(value))
+    return b(str(value))
+
+
+def pack_reply(values):
+    "Pack a reply (or a request) in the SSDB block protocol"
+    return SYM_EMPTY.join(
+        SYM_EMPTY.join((b(str(len(value))), SYM_LF, value, SYM_LF))
+        for value in values) + SYM_LF
+
+
+def parse_requests(buf):
+    """
+    Split the complete requests at the start of the bytearray ``buf`` off it
+    and return them as lists of byte strings
+    """
+    requests, args, pos = [], [], 0
+    start = 0
+    while True:
+        lf = buf.find(SYM_LF, pos)
+        if lf < 0:
+            break
+        line = bytes(buf[pos:lf]).strip()
+        if not line:
+            # an empty line ends the request
+            pos = lf + 1
+            if args:
+                requests.append(args)
+            args = []
+            start = pos
+            continue
+        try:
+            size = int(line)
+        except ValueError:
+            raise CommandError('bad request')
+        if len(buf) < lf + 2 + size:
+            break
+        args.append(bytes(buf[lf + 1:lf + 1 + size]))
+        pos = lf + 2 + size
+    del buf[:start]
+    return requests
+
+
+class FakeServer(object):
+    """
+    A fake SSDB server listening on ``host``:``port`` (a free port by
+    default) in background threads, started by `start`_ or by entering the
+    ``with`` block. ``store`` shares the data of another server.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0, bandwidth=None,
+                 store=None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.store = store if store is not None else FakeStore()
+        self.stats = collections.defaultdict(int)
+        self.commands = collections.defaultdict(int)
+        self._faults = []
+        self._lock = threading.Lock()
+        self._sock = None
+        self._thread = None
+        self._connections = set()
+        self._running = threading.Event()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    @property
+    def address(self):
+        return self.host, self.port
+
+    def client(self, **kwargs):
+        "Return an `SSDB` client of this server"
+        return SSDB(host=self.host, port=self.port, **kwargs)
+
+    def start(self):
+        """
+        Start listening and serving connections
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(128)
+        sock.settimeout(0.1)
+        self._sock = sock
+        self.port = sock.getsockname()[1]
+        self._running.set()
+        self._thread = threading.Thread(target=self._accept,
+                                        name='ssdb-fake-server')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop serving and close all the connections
+        """
+        self._running.clear()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        with self._lock:
+            connections, self._connections = self._connections, set()
+        for conn in connections:
+            _close(conn)
+
+    def inject(self, fault, count=1, command=None, delay=1.0):
+        """
+        Make the next ``count`` commands (named ``command``, or any command)
+        misbehave:
+
+        * ``slow``: answer after ``delay`` more seconds,
+        * ``error``: answer with an ``error`` status,
+        * ``close``: close the connection instead of answering,
+        * ``disconnect``: close the connection in the middle of the answer.
+        """
+        if fault not in FAULTS:
+            raise DataError("Unknown fault %r" % fault)
+        with self._lock:
+            self._faults.append([fault, count, command, delay])
+
+    def clear_faults(self):
+        with self._lock:
+            self._faults = []
+
+    def _fault(self, command):
+        "Count a request of ``command`` and return its fault, if any"
+        with self._lock:
+            self.stats['requests'] += 1
+            self.commands[command] += 1
+            for fault in self._faults:
+                if fault[2] is None or fault[2] == command:
+                    fault[1] -= 1
+                    if not fault[1]:
+                        self._faults.remove(fault)
+                    return fault
+        return None
+
+    def _accept(self):
+        while self._running.is_set():
+            try:
+                conn, _ = self._sock.accept()
+            except socket.timeout:
+                continue
+            except socket.error:
+                return
+            conn.settimeout(None)
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self._lock:
+                self._connections.add(conn)
+                self.stats['connections'] += 1
+            thread = threading.Thread(target=self._serve, args=(conn,),
+                                      name='ssdb-fake-connection')
+            thread.daemon = True
+            thread.start()
+
+    def _serve(self, conn):
+        buf = bytearray()
+        try:
+            while self._running.is_set():
+                data = conn.recv(65536)
+                if not data:
+                    return
+                buf.extend(data)
+                requests = parse_requests(buf)
+                if requests and not self._answer(conn, requests):
+                    return
+        except (socket.error, CommandError):
+            return
+        finally:
+            with self._lock:
+                self._connections.discard(conn)
+            _close(conn)
+
+    def _answer(self, conn, requests):
+        """
+        Run ``requests`` and send their replies as one burst, return whether
+        the connection is still open
+        """
+        with self._lock:
+            self.stats['round_trips'] += 1
+        replies = []
+        for args in requests:
+            command = nativestr(args[0])
+            fault = self._fault(command)
+            if fault is None:
+                replies.append(pack_reply(self.store.execute(args)))
+                continue
+            kind, delay = fault[0], fault[3]
+            if kind == 'slow':
+                mod_time.sleep(delay)
+                replies.append(pack_reply(self.store.execute(args)))
+            elif kind == 'error':
+                replies.append(pack_reply([b('error'),
+                                           b('injected error')]))
+            else:
+                reply = pack_reply(self.store.execute(args))
+                if kind == 'disconnect':
+                    replies.append(reply[:len(reply) // 2])
+                self._send(conn, SYM_EMPTY.join(replies))
+                return False
+        self._send(conn, SYM_EMPTY.join(replies))
+        return True
+
+    def _send(self, conn, data):
+        if self.latency:
+            mod_time.sleep(self.latency)
+        if not self.bandwidth:
+            conn.sendall(data)
+            return
+        chunk = max(int(self.bandwidth / 100), 1)
+        for i in range(0, len(data), chunk):
+            conn.sendall(data[i:i + chunk])
+            mod_time.sleep(len(data[i:i + chunk]) / float(self.bandwidth))
+
+
+def _close(conn):
+    try:
+        conn.shutdown(socket.SHUT_RDWR)
+    except socket.error:
+        pass
+    conn.close()
@@ -0,0 +1,205 @@
+#coding=utf-8
+"""
+HyperLogLog cardinality estimation with the registers kept in an SSDB
+string value, one byte per register: ``2 ** precision`` bytes per counter
+(16KB by default) however many items are counted.
+
+    >>> from ssdb import SSDB
+    >>> from ssdb.hyperloglog import HyperLogLog, pfcount
+    >>> visitors = HyperLogLog(SSDB(), 'visitors:2016-01-01')
+    >>> visitors.add_many(user_ids)
+    >>> visitors.count()
+    1000339
+    >>> pfcount(SSDB(), 'visitors:2016-01-01', 'visitors:2016-01-02')
+    1843311
+
+Items are hashed and their registers updated locally; a flush merges them
+into the stored value in one read-modify-write. SSDB has no check-and-set,
+so the write is a ``getset`` and whatever it replaced that the new value
+doesn't cover (a concurrent flush) is merged in and written again. As
+registers only ever grow this converges and no update is lost.
+"""
+from __future__ import with_statement
+import hashlib
+import math
+import struct
+import threading
+from ssdb._compat import b, bytes, unicode
+from ssdb.exceptions import DataError
+
+
+def _to_bytes(item):
+    if isinstance(item, bytes):
+        return item
+    return unicode(item).encode('utf-8')
+
+
+def _merge(registers, values):
+    "Merge the register strings ``values`` into the bytearray ``registers``"
+    for value in values:
+        if not value:
+            continue
+        if len(value) != len(registers):
+            raise DataError("HyperLogLog registers of %d bytes expected, "
+                            "got %d" % (len(registers), len(value)))
+        registers[:] = bytearray(map(max, registers, bytearray(value)))
+    return registers
+
+
+def _covers(registers, value):
+    "Whether ``registers`` are all at least those of ``value``"
+    return not value or all(mine >= theirs for mine, theirs in
+                            zip(registers, bytearray(value)))
+
+
+def estimate(registers):
+    """
+    Return the cardinality estimated from the bytearray ``registers``
+    """
+    m = len(registers)
+    if m == 16:
+        alpha = 0.673
+    elif m == 32:
+        alpha = 0.697
+    elif m == 64:
+        alpha = 0.709
+    else:
+        alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / sum(_INVERSE_POWERS[r] for r in registers)
+    zeros = bytes(registers).count(b('\x00'))
+    if raw <= 2.5 * m and zeros:
+        # small range correction: linear counting
+        return int(round(m * math.log(float(m) / zeros)))
+    return int(round(raw))
+
+
+_INVERSE_POWERS = [2.0 ** -i for i in range(256)]
+
+
+class HyperLogLog(object):
+    """
+    A HyperLogLog counter of ``2 ** precision`` registers stored in the key
+    ``name``, with a standard error of about ``1.04 / sqrt(2 ** precision)``
+    (0.8% for the default precision of 14).
+
+    `add`_ only updates local registers, sent by `flush`_ (or when leaving
+    the ``with`` block). `add_many`_ adds and flushes.
+    """
+
+    def __init__(self, ssdb, name, precision=14):
+        if not isinstance(precision, int) or not 4 <= precision <= 16:
+            raise ValueError('``precision`` must be an integer between 4 '
+                             'and 16')
+        self.ssdb = ssdb
+        self.name = name
+        self.precision = precision
+        self.size = 1 << precision
+        self._pending = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+    def register(self, item):
+        """
+        Return the ``(index, rank)`` register update of ``item``
+        """
+        h = struct.unpack('>Q', hashlib.md5(_to_bytes(item)).digest()[:8])[0]
+        bits = 64 - self.precision
+        rest = h & ((1 << bits) - 1)
+        return h >> bits, bits - rest.bit_length() + 1
+
+    def add(self, *items):
+        """
+        Add ``items`` to the local registers
+        """
+        updates = [self.register(item) for item in items]
+        with self._lock:
+            if self._pending is None:
+                self._pending = bytearray(self.size)
+            pending = self._pending
+            for index, rank in updates:
+                if rank > pending[index]:
+                    pending[index] = rank
+
+    def add_many(self, items):
+        """
+        Add ``items`` and flush them in one read-modify-write
+        """
+        self.add(*items)
+        self.flush()
+
+    def flush(self):
+        """
+        Merge the local registers into the stored ones. Return whether
+        anything was written.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, None
+        if pending is None:
+            return False
+        try:
+            self._write(pending, self.ssdb.execute_command('get', self.name))
+        except Exception:
+            self.add_registers(pending)
+            raise
+        return True
+
+    def add_registers(self, registers):
+        "Merge ``registers`` into the local ones"
+        with self._lock:
+            if self._pending is None:
+                self._pending = bytearray(self.size)
+            _merge(self._pending, [bytes(registers)])
+
+    def _write(self, registers, current):
+        _merge(registers, [current])
+        while True:
+            previous = self.ssdb.execute_command('getset', self.name,
+                                                 bytes(registers))
+            if _covers(registers, previous):
+                return
+            # a concurrent flush wrote registers we didn't know about
+            _merge(registers, [previous])
+
+    def registers(self):
+        """
+        Return the stored registers merged with the local ones
+        """
+        registers = bytearray(self.size)
+        _merge(registers, [self.ssdb.execute_command('get', self.name)])
+        with self._lock:
+            if self._pending is not None:
+                _merge(registers, [bytes(self._pending)])
+        return registers
+
+    def count(self):
+        """
+        Return the estimated number of distinct items, including those not
+        flushed yet
+        """
+        return estimate(self.registers())
+
+    def merge(self, *names):
+        """
+        Merge the counters ``names`` into this one, like ``PFMERGE``
+        """
+        values = self.ssdb.execute_command('multi_get', self.name, *names)
+        registers = bytearray(self.size)
+        _merge(registers, [values.get(name) for name in names])
+        self._write(registers, values.get(self.name))
+
+
+def pfcount(ssdb, *names, **kwargs):
+    """
+    Return the estimated number of distinct items of the union of the
+    counters ``names``, after one ``multi_get``. ``precision`` must be the
+    one the counters were created with (14 by default).
+    """
+    registers = bytearray(1 << kwargs.get('precision', 14))
+    values = ssdb.execute_command('multi_get', *names)
+    _merge(registers, [values.get(name) for name in names])
+    return estimate(registers)
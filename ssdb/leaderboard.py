@@ -0,0 +1,225 @@
+#coding=utf-8
+"""
+Leaderboards on SSDB zsets.
+
+    >>> from ssdb import SSDB
+    >>> from ssdb.leaderboard import Leaderboard
+    >>> board = Leaderboard(SSDB(), 'game:1', top_size=100, cache_ttl=1.0)
+    >>> board.set_scores(alice=300, bob=200, carol=100)
+    3
+    >>> board.top(2)
+    [('alice', 300), ('bob', 200)]
+    >>> board.ranks(['carol', 'dave'])
+    {'carol': 2, 'dave': None}
+    >>> board.around('bob', 1)
+    [(0, 'alice', 300), (1, 'bob', 200), (2, 'carol', 100)]
+
+Ranks are 0-based and, unless ``reverse`` is ``False``, the highest score
+ranks first.
+
+The ``top_size`` first entries are cached for ``cache_ttl`` seconds. A
+background thread, started by the first `top`_ call, refreshes the cache
+every ``cache_ttl / 2`` seconds so the top of the board is served without a
+round trip; a cache older than ``cache_ttl`` (the thread failed) is
+refreshed synchronously. A ``cache_ttl`` of ``None`` disables the cache.
+"""
+from __future__ import with_statement
+import sys
+import threading
+import time as mod_time
+import weakref
+from ssdb.utils import get_nonnegative_integer, get_positive_integer
+
+
+class Leaderboard(object):
+    """
+    A leaderboard of the members of the zset ``name`` ranked by score.
+    """
+
+    def __init__(self, ssdb, name, reverse=True, top_size=100, cache_ttl=1.0):
+        self.ssdb = ssdb
+        self.name = name
+        self.reverse = reverse
+        self.top_size = get_positive_integer('top_size', top_size)
+        self.cache_ttl = cache_ttl
+        self.last_error = None
+        self._top = None
+        self._top_time = 0
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._thread = None
+        self._time = mod_time.time
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.ssdb.zsize(self.name)
+
+    @property
+    def _rank_command(self):
+        return 'zrrank' if self.reverse else 'zrank'
+
+    @property
+    def _range_command(self):
+        return 'zrrange' if self.reverse else 'zrange'
+
+    def set_score(self, member, score):
+        """
+        Set the score of ``member``
+        """
+        return self.ssdb.zset(self.name, member, score)
+
+    def set_scores(self, **scores):
+        """
+        Set the scores of several members at once
+        """
+        return self.ssdb.multi_zset(self.name, **scores)
+
+    def incr(self, member, amount=1):
+        """
+        Increase the score of ``member`` by ``amount`` and return it
+        """
+        return self.ssdb.zincr(self.name, member, amount)
+
+    def remove(self, *members):
+        """
+        Remove ``members`` from the leaderboard
+        """
+        return self.ssdb.multi_zdel(self.name, *members)
+
+    def scores(self, members):
+        """
+        Return a dict mapping each of ``members`` to its score, ``None`` for
+        those not ranked
+        """
+        members = list(members)
+        if not members:
+            return {}
+        found = self.ssdb.multi_zget(self.name, *members)
+        return dict((member, found.get(member)) for member in members)
+
+    def ranks(self, members):
+        """
+        Return a dict mapping each of ``members`` to its rank, ``None`` for
+        those not ranked, looked up in one batch
+        """
+        members = list(members)
+        if not members:
+            return {}
+        batch = self.ssdb.batch()
+        for member in members:
+            getattr(batch, self._rank_command)(self.name, member)
+        return dict((member, None if rank is None or rank < 0 else rank)
+                    for member, rank in zip(members, batch.execute()))
+
+    def entries(self, members):
+        """
+        Return a dict mapping each of ``members`` to its ``(rank, score)``,
+        ``None`` for those not ranked, looked up in one batch
+        """
+        members = list(members)
+        if not members:
+            return {}
+        batch = self.ssdb.batch()
+        for member in members:
+            getattr(batch, self._rank_command)(self.name, member)
+        batch.multi_zget(self.name, *members)
+        response = batch.execute()
+        scores = response[-1]
+        result = {}
+        for member, rank in zip(members, response[:-1]):
+            if rank is None or rank < 0 or member not in scores:
+                result[member] = None
+            else:
+                result[member] = (rank, scores[member])
+        return result
+
+    def range(self, offset, limit):
+        """
+        Return the ``limit`` entries from rank ``offset`` as a list of
+        ``(rank, member, score)``
+        """
+        offset = get_nonnegative_integer('offset', offset)
+        members, scores = getattr(self.ssdb, self._range_command)(
+            self.name, offset, limit, result_format='pairs')
+        return [(offset + i, member, score)
+                for i, (member, score) in enumerate(zip(members, scores))]
+
+    def around(self, member, size=5):
+        """
+        Return the entries ranked up to ``size`` places above and below
+        ``member`` as a list of ``(rank, member, score)``, empty if
+        ``member`` is not ranked
+        """
+        rank = self.ranks([member])[member]
+        if rank is None:
+            return []
+        offset = max(rank - size, 0)
+        return self.range(offset, rank - offset + size + 1)
+
+    def top(self, count=None):
+        """
+        Return the ``count`` (``top_size`` by default) best entries as a list
+        of ``(member, score)``, from the cache when ``count`` is at most
+        ``top_size``
+        """
+        count = self.top_size if count is None else count
+        if count > self.top_size or self.cache_ttl is None:
+            return [(member, score) for rank, member, score in
+                    self.range(0, count)]
+        self._start_refresh()
+        top = self._top
+        if top is None or self._time() - self._top_time > self.cache_ttl:
+            top = self.refresh()
+        return top[:count]
+
+    def refresh(self):
+        """
+        Fetch the ``top_size`` best entries into the cache and return them
+        """
+        top = [(member, score) for rank, member, score in
+               self.range(0, self.top_size)]
+        with self._lock:
+            self._top, self._top_time = top, self._time()
+        return top
+
+    def _start_refresh(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None or self._closed.is_set():
+                return
+            # the thread only holds a weak reference, so a board dropped
+            # without `close`_ is still collected and the thread stops
+            self._thread = threading.Thread(
+                target=_run,
+                args=(weakref.ref(self), self.cache_ttl / 2.0, self._closed),
+                name='ssdb-leaderboard')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def close(self):
+        """
+        Stop refreshing the cache in the background
+        """
+        self._closed.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+
+def _run(ref, interval, closed):
+    while not closed.wait(interval):
+        board = ref()
+        if board is None:
+            return
+        try:
+            board.refresh()
+        except Exception:
+            # kept for inspection, `top` refreshes a stale cache itself
+            board.last_error = sys.exc_info()[1]
+        del board
@@ -0,0 +1,405 @@
+#coding=utf-8
+"""
+A load generator for SSDB, in the spirit of ``redis-benchmark``, installed as
+the ``ssdb-benchmark`` command.
+
+    $ ssdb-benchmark -p 8888 -c 50 -n 100000 --mix get=9,set=1
+    $ ssdb-benchmark -c 8 --mode processes -P 16 --distribution zipfian \\
+          --duration 30 --mix get=8,set=1,zset=1 --json run.json
+
+Every client runs the commands of ``--mix``, chosen at random with the given
+weights, on keys drawn from a keyspace of ``--keyspace`` keys, uniformly or
+with a zipfian distribution (a few hot keys). Commands go through
+`StrictSSDB` (or a `Batch` of ``--pipeline`` commands), so the client
+overhead is part of the measure. The clients are threads or processes; the
+client being synchronous, there is no asyncio mode.
+
+The report gives the throughput and the p50, p99 and p999 latencies of each
+command. With a pipeline, the latency of a command is the one of its batch.
+All the keys, hashes, zsets and queues written are prefixed with
+``--prefix``.
+"""
+from __future__ import with_statement
+import array
+import bisect
+import json
+import math
+import multiprocessing
+import optparse
+import random
+import sys
+import threading
+import time as mod_time
+import timeit
+from ssdb._compat import OrderedDict, basestring, xrange
+from ssdb.client import StrictSSDB
+from ssdb.exceptions import SSDBError
+from ssdb.utils import get_choice, get_positive_integer, prefix_end
+
+DISTRIBUTIONS = ('uniform', 'zipfian')
+MODES = ('threads', 'processes')
+
+# name -> function(client, workload, key) sending the command
+COMMANDS = OrderedDict([
+    ('set', lambda c, w, key: c.set(key, w.value)),
+    ('get', lambda c, w, key: c.get(key)),
+    ('incr', lambda c, w, key: c.incr(key)),
+    ('del', lambda c, w, key: c.delete(key)),
+    ('hset', lambda c, w, key: c.hset(w.prefix + 'hash', key, w.value)),
+    ('hget', lambda c, w, key: c.hget(w.prefix + 'hash', key)),
+    ('hincr', lambda c, w, key: c.hincr(w.prefix + 'hash:incr', key)),
+    ('zset', lambda c, w, key: c.zset(w.prefix + 'zset', key,
+                                      w.random.randint(0, 1 << 30))),
+    ('zget', lambda c, w, key: c.zget(w.prefix + 'zset', key)),
+    ('zincr', lambda c, w, key: c.zincr(w.prefix + 'zset', key)),
+    ('zrange', lambda c, w, key: c.zrange(w.prefix + 'zset', 0,
+                                          w.scan_limit)),
+    ('qpush', lambda c, w, key: c.qpush_back(w.prefix + 'queue', w.value)),
+    ('qpop', lambda c, w, key: c.qpop_front(w.prefix + 'queue')),
+    ('scan', lambda c, w, key: c.scan(key, w.end, w.scan_limit)),
+    ('multi_set', lambda c, w, key: c.multi_set(
+        **dict.fromkeys(w.keys(w.scan_limit), w.value))),
+    ('multi_get', lambda c, w, key: c.multi_get(*w.keys(w.scan_limit))),
+])
+
+
+def parse_mix(mix):
+    """
+    Parse a command mix like ``'get=9,set=1'`` (a missing weight is 1) into
+    a list of ``(command, weight)``
+    """
+    result = []
+    for item in mix.split(','):
+        name, _, weight = item.strip().partition('=')
+        if name not in COMMANDS:
+            raise ValueError('Unknown command %r, expected one of %s' % (
+                name, ', '.join(COMMANDS)))
+        try:
+            weight = float(weight or 1)
+        except ValueError:
+            raise ValueError('``weight`` of %r must be a number' % name)
+        if weight <= 0:
+            raise ValueError('``weight`` of %r must be positive' % name)
+        result.append((name, weight))
+    return result
+
+
+_zipf_cdfs = {}
+
+
+def zipf_cdf(n, s):
+    "The cumulative weights of a zipfian distribution, shared by the clients"
+    cdf = _zipf_cdfs.get((n, s))
+    if cdf is None:
+        cdf = array.array('d')
+        total = 0.0
+        for i in xrange(n):
+            total += 1.0 / (i + 1) ** s
+            cdf.append(total)
+        _zipf_cdfs[n, s] = cdf
+    return cdf
+
+
+class Zipfian(object):
+    """
+    Draw integers in ``[0, n)``, ``i`` with a probability proportional to
+    ``1 / (i + 1) ** s``
+    """
+
+    def __init__(self, n, s=0.99, random=random):
+        self.random = random
+        self.cdf = zipf_cdf(n, s)
+
+    def __call__(self):
+        return bisect.bisect_left(self.cdf, self.random.random() * self.cdf[-1])
+
+
+class Workload(object):
+    """
+    The commands of the weighted ``mix`` on keys of a ``keyspace`` keys
+    drawn with ``distribution``
+    """
+
+    def __init__(self, mix, keyspace=100000, distribution='uniform',
+                 zipf_s=0.99, value_size=100, scan_limit=10,
+                 prefix='ssdb-benchmark:', seed=None):
+        if isinstance(mix, basestring):
+            mix = parse_mix(mix)
+        self.names = [name for name, weight in mix]
+        self.cumulative = []
+        total = 0
+        for name, weight in mix:
+            total += weight
+            self.cumulative.append(total)
+        self.keyspace = get_positive_integer('keyspace', keyspace)
+        distribution = get_choice('distribution', distribution,
+                                  DISTRIBUTIONS)
+        self.value = 'x' * value_size
+        self.scan_limit = get_positive_integer('scan_limit', scan_limit)
+        self.prefix = prefix
+        # scans stop at the end of the prefix
+        self.end = prefix_end(prefix)
+        self.random = random.Random(seed)
+        if distribution == 'zipfian':
+            self.index = Zipfian(self.keyspace, zipf_s, self.random)
+        else:
+            self.index = lambda: self.random.randrange(self.keyspace)
+
+    def key(self):
+        return '%skey:%012d' % (self.prefix, self.index())
+
+    def keys(self, count):
+        return [self.key() for _ in xrange(count)]
+
+    def next(self):
+        "Return the name of the next command and its key"
+        i = bisect.bisect_right(self.cumulative,
+                                self.random.random() * self.cumulative[-1])
+        return self.names[min(i, len(self.names) - 1)], self.key()
+
+
+class Report(object):
+    "The latencies of the commands run, in seconds"
+
+    def __init__(self):
+        self.latencies = OrderedDict()
+        self.errors = 0
+        self.start = None
+        self.end = None
+
+    def record(self, name, latency):
+        if name not in self.latencies:
+            self.latencies[name] = array.array('d')
+        self.latencies[name].append(latency)
+
+    def merge(self, other):
+        for name, latencies in other.latencies.items():
+            if name not in self.latencies:
+                self.latencies[name] = array.array('d')
+            self.latencies[name].extend(latencies)
+        self.errors += other.errors
+        if self.start is None or other.start < self.start:
+            self.start = other.start
+        if self.end is None or other.end > self.end:
+            self.end = other.end
+        return self
+
+    @property
+    def elapsed(self):
+        return self.end - self.start
+
+    def summary(self):
+        """
+        Return the throughput and latency percentiles, in milliseconds, of
+        every command and of all of them as a dict
+        """
+        everything = array.array('d')
+        commands = OrderedDict()
+        for name, latencies in self.latencies.items():
+            commands[name] = self._stats(latencies)
+            everything.extend(latencies)
+        return {
+            'elapsed': self.elapsed,
+            'errors': self.errors,
+            'commands': commands,
+            'total': self._stats(everything),
+        }
+
+    def _stats(self, latencies):
+        latencies = sorted(latencies)
+        count = len(latencies)
+        stats = {'requests': count,
+                 'ops_per_sec': count / self.elapsed if self.elapsed else 0}
+        for label, p in (('p50', 0.5), ('p99', 0.99), ('p999', 0.999)):
+            stats[label] = percentile(latencies, p) * 1000.0
+        stats['max'] = latencies[-1] * 1000.0 if latencies else 0.0
+        return stats
+
+
+def percentile(latencies, p):
+    "The ``p`` percentile of the sorted ``latencies``"
+    if not latencies:
+        return 0.0
+    index = int(math.ceil(p * len(latencies))) - 1
+    return latencies[min(max(index, 0), len(latencies) - 1)]
+
+
+def run_client(client, workload, requests=None, duration=None, pipeline=1):
+    """
+    Send ``requests`` commands of ``workload`` (or send them for
+    ``duration`` seconds) through ``client`` by batches of ``pipeline`` and
+    return a `Report`
+    """
+    timer = timeit.default_timer
+    report = Report()
+    report.start = mod_time.time()
+    deadline = report.start + duration if duration else None
+    sent = 0
+    while (requests is None or sent < requests) and (
+            deadline is None or mod_time.time() < deadline):
+        size = pipeline if requests is None else min(pipeline,
+                                                     requests - sent)
+        commands = [workload.next() for _ in xrange(size)]
+        target = client.batch() if pipeline > 1 else client
+        start = timer()
+        try:
+            for name, key in commands:
+                COMMANDS[name](target, workload, key)
+            if pipeline > 1:
+                target.execute()
+        except SSDBError:
+            report.errors += size
+        latency = timer() - start
+        for name, key in commands:
+            report.record(name, latency)
+        sent += size
+    report.end = mod_time.time()
+    return report
+
+
+def _worker(args):
+    "Run one client in a process or thread"
+    connection, workload, requests, duration, pipeline = args
+    client = StrictSSDB(**connection)
+    try:
+        return run_client(client, Workload(**workload), requests, duration,
+                          pipeline)
+    finally:
+        client.connection_pool.disconnect()
+
+
+def run(connection, workload, clients=50, requests=None, duration=None,
+        pipeline=1, mode='threads'):
+    """
+    Run ``clients`` clients connected with the ``connection`` keyword
+    arguments of `StrictSSDB`, each running a `Workload` built from the
+    ``workload`` keyword arguments, and return their merged `Report`.
+    ``requests`` is the total number of commands sent.
+    """
+    clients = get_positive_integer('clients', clients)
+    pipeline = get_positive_integer('pipeline', pipeline)
+    mode = get_choice('mode', mode, MODES)
+    if requests is None and duration is None:
+        raise ValueError('``requests`` or ``duration`` must be given')
+    jobs = []
+    for i in xrange(clients):
+        share = None
+        if requests is not None:
+            share = requests // clients + (i < requests % clients)
+        seed = workload.get('seed')
+        jobs.append((connection, dict(workload, seed=None if seed is None
+                                      else seed + i),
+                     share, duration, pipeline))
+
+    if mode == 'processes':
+        pool = multiprocessing.Pool(clients)
+        try:
+            reports = pool.map(_worker, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        reports = [None] * clients
+
+        def target(i):
+            reports[i] = _worker(jobs[i])
+        threads = [threading.Thread(target=target, args=(i,))
+                   for i in xrange(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if None in reports:
+            raise SSDBError('A client failed')
+
+    report = Report()
+    for other in reports:
+        report.merge(other)
+    return report
+
+
+def format_summary(summary):
+    lines = ['%-12s %10s %12s %9s %9s %9s %9s' % (
+        'command', 'requests', 'ops/s', 'p50 ms', 'p99 ms', 'p999 ms',
+        'max ms')]
+    rows = list(summary['commands'].items()) + [('total', summary['total'])]
+    for name, stats in rows:
+        lines.append('%-12s %10d %12.1f %9.3f %9.3f %9.3f %9.3f' % (
+            name, stats['requests'], stats['ops_per_sec'], stats['p50'],
+            stats['p99'], stats['p999'], stats['max']))
+    lines.append('%.2f seconds, %d errors' % (summary['elapsed'],
+                                              summary['errors']))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage='ssdb-benchmark [options]')
+    parser.add_option('-H', '--host', default='127.0.0.1',
+                      help='server host [%default]')
+    parser.add_option('-p', '--port', type='int', default=8888,
+                      help='server port [%default]')
+    parser.add_option('-c', '--clients', type='int', default=50,
+                      help='number of parallel clients [%default]')
+    parser.add_option('--mode', choices=MODES, default='threads',
+                      help='run the clients as threads or processes '
+                      '[%default]')
+    parser.add_option('-n', '--requests', type='int',
+                      help='total number of requests [100000 without '
+                      '--duration]')
+    parser.add_option('--duration', type='float',
+                      help='run for this many seconds')
+    parser.add_option('-P', '--pipeline', type='int', default=1,
+                      help='commands per batch [%default]')
+    parser.add_option('--mix', default='get=1,set=1',
+                      help='weighted commands among %s [%%default]' %
+                      ', '.join(COMMANDS))
+    parser.add_option('-r', '--keyspace', type='int', default=100000,
+                      help='number of distinct keys [%default]')
+    parser.add_option('--distribution', choices=DISTRIBUTIONS,
+                      default='uniform',
+                      help='uniform or zipfian key choice [%default]')
+    parser.add_option('--zipf-s', type='float', default=0.99,
+                      help='zipfian exponent [%default]')
+    parser.add_option('-d', '--value-size', type='int', default=100,
+                      help='bytes per value [%default]')
+    parser.add_option('--scan-limit', type='int', default=10,
+                      help='limit of scan and zrange, keys of multi_* '
+                      '[%default]')
+    parser.add_option('--prefix', default='ssdb-benchmark:',
+                      help='prefix of every key written [%default]')
+    parser.add_option('--seed', type='int', help='random seed')
+    parser.add_option('--json', metavar='PATH',
+                      help='also write the report as JSON to PATH')
+    options, args = parser.parse_args(argv)
+    if args:
+        parser.error('unexpected arguments %s' % ' '.join(args))
+    if options.requests is None and options.duration is None:
+        options.requests = 100000
+    try:
+        mix = parse_mix(options.mix)
+    except ValueError:
+        parser.error(str(sys.exc_info()[1]))
+
+    workload = {
+        'mix': mix,
+        'keyspace': options.keyspace,
+        'distribution': options.distribution,
+        'zipf_s': options.zipf_s,
+        'value_size': options.value_size,
+        'scan_limit': options.scan_limit,
+        'prefix': options.prefix,
+        'seed': options.seed,
+    }
+    connection = {'host': options.host, 'port': options.port}
+    report = run(connection, workload, options.clients, options.requests,
+                 options.duration, options.pipeline, options.mode)
+    summary = report.summary()
+    print(format_summary(summary))
+    if options.json:
+        with open(options.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+    return 1 if summary['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,213 @@
+#coding=utf-8
+from __future__ import with_statement
+import random
+import threading
+import time as mod_time
+import uuid
+from ssdb._compat import nativestr
+from ssdb.exceptions import LockError
+from ssdb.utils import get_positive_integer
+
+
+class Lock(object):
+    """
+    A shared, distributed Lock. Using SSDB for locking allows the Lock to be
+    shared across processes and/or machines.
+
+    It's left to the user to resolve deadlock issues and make sure multiple
+    clients play nicely together.
+
+        >>> with ssdb.lock('scheduler', timeout=30, auto_renewal=True) as lock:
+        ...     run_jobs(fence=lock.fence)
+
+    The lock key is taken with ``setnx`` and given its ``timeout`` (seconds)
+    with ``expire``. SSDB has no scripting, so releasing and extending are a
+    ``get`` followed by a ``del``/``expire``: a lock whose lease ran out can
+    be taken by somebody else in between. Every successful acquire therefore
+    also ``incr`` the ``fence_name`` key and exposes the result as `fence`,
+    a token increasing with each owner that the protected resource can use
+    to reject writes from a previous owner.
+    """
+
+    def __init__(self, ssdb, name, timeout=None, sleep=0.1, max_sleep=1.0,
+                 blocking=True, blocking_timeout=None, thread_local=True,
+                 auto_renewal=False, fence_name=None):
+        """
+        Create a new Lock instance named ``name`` using the SSDB client
+        supplied by ``ssdb``.
+
+        ``timeout`` indicates a maximum life for the lock in seconds, by
+        default it remains locked until `release`_ is called. With
+        ``auto_renewal`` a background thread extends the lease every third
+        of ``timeout`` for as long as the lock is held.
+
+        ``sleep`` is the initial amount of time to sleep between attempts
+        while blocking, doubled (with jitter) after each attempt up to
+        ``max_sleep``. ``blocking`` and ``blocking_timeout`` are the defaults
+        of `acquire`_.
+
+        ``thread_local`` stores the token in thread local storage so one
+        Lock instance can be shared by several threads without one thread
+        releasing the lock of another.
+        """
+        self.ssdb = ssdb
+        self.name = name
+        if timeout is not None:
+            timeout = get_positive_integer('timeout', timeout)
+        elif auto_renewal:
+            raise LockError("auto_renewal requires a timeout")
+        self.timeout = timeout
+        self.sleep = sleep
+        self.max_sleep = max_sleep
+        self.blocking = blocking
+        self.blocking_timeout = blocking_timeout
+        self.auto_renewal = auto_renewal
+        self.fence_name = fence_name or '%s:fence' % name
+        self.local = threading.local() if thread_local else _Local()
+        self.local.token = None
+        self.local.fence = None
+        self._renewals = {}
+
+    def __enter__(self):
+        if self.acquire():
+            return self
+        raise LockError("Unable to acquire lock within the time specified")
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    @property
+    def token(self):
+        return getattr(self.local, 'token', None)
+
+    @property
+    def fence(self):
+        "The fencing token of the current acquisition"
+        return getattr(self.local, 'fence', None)
+
+    def acquire(self, blocking=None, blocking_timeout=None):
+        """
+        Use ``ssdb.setnx`` to acquire the lock. If ``blocking`` is ``False``,
+        always return immediately, otherwise retry for at most
+        ``blocking_timeout`` seconds (forever if ``None``). Return whether
+        the lock was acquired.
+        """
+        if blocking is None:
+            blocking = self.blocking
+        if blocking_timeout is None:
+            blocking_timeout = self.blocking_timeout
+        stop_trying_at = None
+        if blocking_timeout is not None:
+            stop_trying_at = mod_time.time() + blocking_timeout
+        token = uuid.uuid4().hex
+        sleep = self.sleep
+        while True:
+            if self.do_acquire(token):
+                self.local.token = token
+                if self.auto_renewal:
+                    self._start_renewal(token)
+                return True
+            if not blocking:
+                return False
+            if stop_trying_at is not None and \
+               mod_time.time() > stop_trying_at:
+                return False
+            mod_time.sleep(sleep / 2.0 + random.uniform(0, sleep / 2.0))
+            sleep = min(sleep * 2, self.max_sleep)
+
+    def do_acquire(self, token):
+        if not self.ssdb.setnx(self.name, token):
+            self._expire_stale()
+            return False
+        batch = self.ssdb.batch()
+        if self.timeout is not None:
+            batch.expire(self.name, self.timeout)
+        batch.incr(self.fence_name)
+        self.local.fence = batch.execute()[-1]
+        return True
+
+    def _expire_stale(self):
+        # a client that died between ``setnx`` and ``expire`` left a lock
+        # that would never expire
+        if self.timeout is not None and self.ssdb.ttl(self.name) == -1:
+            self.ssdb.expire(self.name, self.timeout)
+
+    def locked(self):
+        """
+        Return whether somebody holds the lock
+        """
+        return self.ssdb.exists(self.name)
+
+    def owned(self):
+        """
+        Return whether the lock is held with the current token
+        """
+        return self._is_owner(self.token)
+
+    def _is_owner(self, token):
+        if token is None:
+            return False
+        value = self.ssdb.get(self.name)
+        return value is not None and nativestr(value) == token
+
+    def release(self):
+        """
+        Release the already acquired lock
+        """
+        token = self.token
+        if token is None:
+            raise LockError("Cannot release an unlocked lock")
+        self.local.token = None
+        self._stop_renewal(token)
+        if not self._is_owner(token):
+            raise LockError("Cannot release a lock that's no longer owned")
+        self.ssdb.delete(self.name)
+
+    def extend(self, timeout=None):
+        """
+        Reset the lease of the already acquired lock to ``timeout`` seconds
+        (the lock ``timeout`` by default)
+        """
+        token = self.token
+        if token is None:
+            raise LockError("Cannot extend an unlocked lock")
+        return self._extend(token, timeout or self.timeout)
+
+    def _extend(self, token, timeout):
+        if timeout is None:
+            raise LockError("Cannot extend a lock with no timeout")
+        if not self._is_owner(token):
+            raise LockError("Cannot extend a lock that's no longer owned")
+        self.ssdb.expire(self.name, get_positive_integer('timeout', timeout))
+        return True
+
+    def _start_renewal(self, token):
+        stop = threading.Event()
+        thread = threading.Thread(target=self._renew, args=(token, stop),
+                                  name='ssdb-lock-renewal')
+        thread.daemon = True
+        self._renewals[token] = (thread, stop)
+        thread.start()
+
+    def _renew(self, token, stop):
+        while not stop.wait(self.timeout / 3.0):
+            try:
+                self._extend(token, self.timeout)
+            except LockError:
+                return
+            except Exception:
+                # transient errors, the lease has two more thirds to go
+                pass
+
+    def _stop_renewal(self, token):
+        renewal = self._renewals.pop(token, None)
+        if renewal is not None:
+            thread, stop = renewal
+            stop.set()
+            if thread is not threading.current_thread():
+                thread.join()
+
+
+class _Local(object):
+    "Plain attribute storage used when ``thread_local`` is disabled"
+    pass
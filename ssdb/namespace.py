@@ -0,0 +1,249 @@
+#coding=utf-8
+"""
+Clients confined to the names starting with a prefix, for several tenants
+sharing one server.
+
+    >>> from ssdb.namespace import NamespacedSSDB
+    >>> tenant = NamespacedSSDB('tenant42:', port=8888)
+    >>> tenant.set('config', 'x')
+    True
+    >>> tenant.multi_hset('users', alice='1')
+    1
+    >>> tenant.keys('', '', 10)
+    ['config']
+    >>> tenant.hlist('', '', 10)
+    ['users']
+
+The prefix is added to every key, hash, zset and queue name sent, the names
+listed by ``keys``, ``scan``, ``multi_get``, ``hlist``, ``zlist``, ``qlist``
+and their reverse variants are returned without it, and the empty (infinite)
+bounds of these ranges are clamped to the names of the namespace. The keys
+inside hashes and zsets are left alone. Commands the namespace doesn't know
+are refused with a `DataError` rather than sent unprefixed, and so are empty
+names, which SSDB doesn't store and which would be the bare prefix.
+
+The prefix is encoded once and joined to the encoded names at the bytes
+level; the names of a reply are stripped by slicing. To share the
+connections of an existing client, pass its pool:
+
+    >>> tenant = NamespacedSSDB('tenant42:',
+    ...                         connection_pool=client.connection_pool)
+"""
+from ssdb._compat import b, bytes, unicode
+from ssdb.client import SSDB, StrictSSDB, StrictBatch, Batch
+from ssdb.exceptions import DataError
+from ssdb.utils import prefix_end
+
+# commands whose first argument is a name
+NAME_COMMANDS = frozenset((
+    'get set setx setnx getset del exists expire ttl incr decr '
+    'getbit setbit countbit substr strlen '
+    'hget hset hdel hclear hexists hincr hdecr hsize multi_hset multi_hget '
+    'multi_hdel hkeys hgetall hscan hrscan '
+    'zset zget zdel zclear zexists zincr zdecr zsize multi_zset multi_zget '
+    'multi_zdel zkeys zscan zrscan zrank zrrank zrange zrrange zcount zsum '
+    'zavg zremrangebyrank zremrangebyscore '
+    'qget qset qpush_back qpush_front qpop_front qpop_back qsize qclear '
+    'qfront qback qrange qslice qtrim_front qtrim_back'
+).split())
+# commands whose arguments are all names
+MULTI_NAME_COMMANDS = frozenset(('multi_get', 'multi_del'))
+# commands listing the names between their first two arguments
+RANGE_COMMANDS = frozenset(('keys', 'scan', 'hlist', 'zlist', 'qlist'))
+REVERSE_RANGE_COMMANDS = frozenset(('rscan', 'hrlist', 'zrlist', 'qrlist'))
+# commands replying with names, or with name/value pairs
+NAME_REPLIES = frozenset(('keys', 'hlist', 'hrlist', 'zlist', 'zrlist',
+                          'qlist', 'qrlist'))
+PAIR_REPLIES = frozenset(('scan', 'rscan', 'multi_get'))
+
+
+def _is_empty(bound):
+    return bound == '' or bound == b''
+
+
+class Namespace(object):
+    """
+    Add the ``prefix`` to the names of the commands and strip it from the
+    names of their replies
+    """
+
+    def __init__(self, prefix, encoding='utf-8'):
+        self.encoding = encoding
+        if isinstance(prefix, unicode):
+            prefix = prefix.encode(encoding)
+        if not prefix:
+            raise ValueError('``prefix`` must be a non empty string')
+        self.prefix = prefix
+        # the first name after the namespace, the end of its ranges: it is
+        # listed by the forward ones, and left out by `strip`_
+        self.upper = prefix_end(prefix)
+        # replies are decoded with ``decode_responses``
+        self.text_prefix = prefix.decode(encoding)
+
+    def name(self, name):
+        "Return ``name`` in the namespace, as bytes"
+        if _is_empty(name):
+            raise DataError("Empty names can't be namespaced")
+        if isinstance(name, bytes):
+            return self.prefix + name
+        if isinstance(name, unicode):
+            return self.prefix + name.encode(self.encoding)
+        return self.prefix + b(str(name))
+
+    def args(self, args):
+        "Return the command ``args`` with its names in the namespace"
+        command = args[0]
+        if command in NAME_COMMANDS:
+            if len(args) < 2:
+                return args
+            return (command, self.name(args[1])) + args[2:]
+        if command in MULTI_NAME_COMMANDS:
+            return (command,) + tuple(self.name(name) for name in args[1:])
+        if command == 'multi_set':
+            args = list(args)
+            args[1::2] = [self.name(name) for name in args[1::2]]
+            return tuple(args)
+        if command in RANGE_COMMANDS:
+            lower, upper = self.prefix, self.upper
+        elif command in REVERSE_RANGE_COMMANDS:
+            lower, upper = self.upper, self.prefix
+        else:
+            raise DataError("``%s`` can't be namespaced" % command)
+        start, end = args[1:3]
+        start = lower if _is_empty(start) else self.name(start)
+        end = upper if _is_empty(end) else self.name(end)
+        return (command, start, end) + args[3:]
+
+    def _prefix(self, names):
+        "Return the prefix as found in the ``names`` of a reply"
+        if isinstance(names[0], bytes):
+            return self.prefix
+        return self.text_prefix
+
+    def strip(self, names):
+        "Return the ``names`` of the namespace, without the prefix"
+        if not names:
+            return names
+        prefix = self._prefix(names)
+        length = len(prefix)
+        return [name[length:] for name in names
+                if len(name) > length and name.startswith(prefix)]
+
+    def strip_pairs(self, response):
+        """
+        Return the name/value pairs of ``response`` whose name is in the
+        namespace, without the prefix
+        """
+        if not response:
+            return response
+        prefix = self._prefix(response)
+        length = len(prefix)
+        stripped = []
+        for name, value in zip(response[0::2], response[1::2]):
+            if len(name) > length and name.startswith(prefix):
+                stripped.extend((name[length:], value))
+        return stripped
+
+    def callback(self, command, callback):
+        """
+        Return the response ``callback`` of ``command``, stripping the
+        prefix from the names of the reply first
+        """
+        if command in NAME_REPLIES:
+            def strip_names(response, **options):
+                return callback(self.strip(response), **options)
+            return strip_names
+        if command in PAIR_REPLIES:
+            def strip_pairs(response, **options):
+                return callback(self.strip_pairs(response), **options)
+            return strip_pairs
+        return callback
+
+    def callbacks(self, callbacks):
+        "Return the response ``callbacks`` wrapped by `callback`_"
+        return dict((command, self.callback(command, callback))
+                    for command, callback in callbacks.items())
+
+
+class BaseNamespacedBatch(object):
+    "Batch sending its commands in ``namespace``"
+
+    def __init__(self, namespace, *args, **kwargs):
+        self.namespace = namespace
+        super(BaseNamespacedBatch, self).__init__(*args, **kwargs)
+
+    def execute_command(self, *args, **kwargs):
+        return super(BaseNamespacedBatch, self).execute_command(
+            *self.namespace.args(args), **kwargs)
+
+
+class NamespacedStrictBatch(BaseNamespacedBatch, StrictBatch):
+    """
+    Batch for the NamespacedStrictSSDB class
+    """
+    pass
+
+
+class NamespacedBatch(BaseNamespacedBatch, Batch):
+    """
+    Batch for the NamespacedSSDB class
+    """
+    pass
+
+
+class NamespacedStrictSSDB(StrictSSDB):
+    """
+    A `StrictSSDB`_ whose names are all prefixed with ``prefix``, the other
+    keyword arguments are passed to `StrictSSDB`_
+    """
+
+    def __init__(self, prefix, **kwargs):
+        super(NamespacedStrictSSDB, self).__init__(**kwargs)
+        self.namespace = Namespace(prefix, kwargs.get('charset', 'utf-8'))
+        self.response_callbacks = self.namespace.callbacks(
+            self.response_callbacks)
+
+    def __repr__(self):
+        return "%s<%r, %r>" % (type(self).__name__, self.namespace.prefix,
+                               self.connection_pool)
+
+    def set_response_callback(self, command, callback):
+        """
+        Set a custom Response Callback
+        """
+        self.response_callbacks[command] = self.namespace.callback(command,
+                                                                   callback)
+
+    def execute_command(self, *args, **options):
+        return StrictSSDB.execute_command(self, *self.namespace.args(args),
+                                          **options)
+
+    def batch(self):
+        return NamespacedStrictBatch(
+            self.namespace,
+            self.connection_pool,
+            self.response_callbacks,
+            self.codec,
+            self.result_format,
+            self.slowlog,
+            self.negative_cache
+        )
+    pipeline = batch
+
+
+class NamespacedSSDB(NamespacedStrictSSDB, SSDB):
+    """
+    A `SSDB`_ whose names are all prefixed with ``prefix``
+    """
+
+    def batch(self):
+        return NamespacedBatch(
+            self.namespace,
+            self.connection_pool,
+            self.response_callbacks,
+            self.codec,
+            self.result_format,
+            self.slowlog,
+            self.negative_cache
+        )
+    pipeline = batch
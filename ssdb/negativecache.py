@@ -0,0 +1,222 @@
+#coding=utf-8
+"""
+Answer the lookups of missing keys and hash fields without a round trip.
+
+    >>> from ssdb import SSDB
+    >>> from ssdb.negativecache import NegativeCache
+    >>> cache = NegativeCache(ttl=5.0, capacity=1000000)
+    >>> client = SSDB(negative_cache=cache)
+    >>> cache.rebuild(client, hashes=['users'])
+    >>> client.get('not_there'), client.hget('users', 'nobody')
+    (None, None)
+    >>> cache.stats
+    {'filtered': 2, 'cached': 0, 'misses': 0}
+
+Two mechanisms answer the ``get``, ``exists``, ``hget`` and ``hexists`` of
+a client built with ``negative_cache``:
+
+* the misses, remembered for ``ttl`` seconds, at most ``max_size`` of them;
+* with ``capacity``, a `LocalBloomFilter`_ of the known keys and of the
+  fields of some hashes. Once `rebuild`_ has loaded it from a ``keys`` and
+  ``hkeys`` scan, the names it doesn't contain are definitely missing.
+
+The writes of the client and of its batches (``set``, ``multi_set``,
+``hset``, ``multi_hset``...) add their names to the filter and forget their
+misses. The writes of other clients are not seen: the misses may be stale
+for ``ttl`` seconds and the filter until the next `rebuild`_, so a filter
+only suits data written through the clients sharing it.
+"""
+from __future__ import with_statement
+import threading
+import time as mod_time
+from ssdb._compat import OrderedDict, bytes, unicode
+from ssdb.bloom import LocalBloomFilter
+from ssdb.utils import get_positive_integer
+
+# returned by `lookup`_ for a missing key or field
+ABSENT = object()
+# command -> its result for a missing key or field
+ABSENT_RESULTS = {'get': None, 'exists': False, 'hget': None,
+                  'hexists': False}
+HASH_COMMANDS = frozenset(('hget', 'hexists', 'hset', 'hincr', 'hdecr'))
+KV_WRITES = frozenset(('set', 'setx', 'setnx', 'getset', 'incr', 'decr',
+                       'setbit'))
+
+
+def _to_bytes(value):
+    if isinstance(value, bytes):
+        return value
+    return unicode(value).encode('utf-8')
+
+
+def _item(name, key=None):
+    "Return the entry of the key ``name``, or of the field ``key`` of a hash"
+    if key is None:
+        return b'k\x00' + _to_bytes(name)
+    return b'\x00'.join((b'h', _to_bytes(name), _to_bytes(key)))
+
+
+class NegativeCache(object):
+    """
+    Misses cached for ``ttl`` seconds and, with ``capacity``, a Bloom filter
+    with a false positive rate of ``error_rate`` of the existing keys
+    """
+
+    def __init__(self, ttl=1.0, max_size=10000, capacity=None,
+                 error_rate=0.001):
+        if ttl is not None and ttl <= 0:
+            raise ValueError('``ttl`` must be positive')
+        self.ttl = ttl
+        self.max_size = get_positive_integer('max_size', max_size)
+        if capacity is not None:
+            capacity = get_positive_integer('capacity', capacity)
+        if not 0 < error_rate < 1:
+            raise ValueError('``error_rate`` must be between 0 and 1')
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.misses = OrderedDict()
+        # the filter, ``None`` until rebuilt, and the hashes it holds
+        self.filter = None
+        self.hashes = frozenset()
+        self.stats = {'filtered': 0, 'cached': 0, 'misses': 0}
+        self._building = None
+        # writes are numbered, ``_written`` holds the number of the last
+        # write of at most ``max_size`` entries and ``_forgotten`` the
+        # highest number dropped from it
+        self._generation = 0
+        self._written = OrderedDict()
+        self._forgotten = 0
+        self._lock = threading.Lock()
+        self._time = mod_time.time
+
+    def _lookup_item(self, args):
+        if args[0] in HASH_COMMANDS:
+            return _to_bytes(args[1]), _item(args[1], args[2])
+        return None, _item(args[1])
+
+    def lookup(self, args):
+        """
+        Return `ABSENT` if the lookup ``args`` is for a missing key or field,
+        known without asking the server, otherwise the generation to pass
+        to `record`_ with its result
+        """
+        if args[0] not in ABSENT_RESULTS:
+            return None
+        hash, item = self._lookup_item(args)
+        with self._lock:
+            bloom = self.filter
+            if bloom is not None and (hash is None or hash in self.hashes):
+                if item not in bloom:
+                    self.stats['filtered'] += 1
+                    return ABSENT
+            expires = self.misses.get(item)
+            if expires is not None:
+                if expires > self._time():
+                    self.stats['cached'] += 1
+                    return ABSENT
+                del self.misses[item]
+            return self._generation
+
+    def record(self, args, result, generation):
+        """
+        Remember the lookup ``args`` as a miss if ``result`` is its result
+        for a missing key or field and its entry wasn't written since the
+        ``generation`` returned by `lookup`_
+        """
+        command = args[0]
+        if (self.ttl is None or command not in ABSENT_RESULTS or
+                result is not ABSENT_RESULTS[command]):
+            return
+        item = self._lookup_item(args)[1]
+        with self._lock:
+            if (generation < self._forgotten or
+                    self._written.get(item, 0) > generation):
+                return
+            self.stats['misses'] += 1
+            self.misses.pop(item, None)
+            if len(self.misses) >= self.max_size:
+                self.misses.popitem(last=False)
+            self.misses[item] = self._time() + self.ttl
+
+    def write(self, args):
+        """
+        Take the names written by the command ``args`` into account
+        """
+        command = args[0]
+        if command in KV_WRITES:
+            items = [_item(args[1])]
+        elif command == 'multi_set':
+            items = [_item(name) for name in args[1::2]]
+        elif command in HASH_COMMANDS:
+            if command in ABSENT_RESULTS:
+                return
+            items = [_item(args[1], args[2])]
+        elif command == 'multi_hset':
+            items = [_item(args[1], key) for key in args[2::2]]
+        else:
+            return
+        with self._lock:
+            for item in items:
+                self._generation += 1
+                self._written.pop(item, None)
+                self._written[item] = self._generation
+                if len(self._written) > self.max_size:
+                    self._forgotten = self._written.popitem(last=False)[1]
+                self.misses.pop(item, None)
+                if self.filter is not None:
+                    self.filter.add(item)
+                if self._building is not None:
+                    self._building.add(item)
+
+    def rebuild(self, ssdb, hashes=(), page_size=1000):
+        """
+        Load a new filter with the keys of ``ssdb`` and the fields of its
+        ``hashes``, the writes made meanwhile included. The names listed by
+        a namespaced client are put back in its namespace, as its commands
+        reach the cache
+        """
+        if self.capacity is None:
+            raise ValueError('``capacity`` is needed for a filter')
+        page_size = get_positive_integer('page_size', page_size)
+        namespace = getattr(ssdb, 'namespace', None)
+        if namespace is not None:
+            qualify = namespace.name
+        else:
+            qualify = lambda name: name
+        hashes = [(hash, qualify(hash)) for hash in hashes]
+        bloom = LocalBloomFilter(self.capacity, self.error_rate)
+        with self._lock:
+            self._building = bloom
+        try:
+            for name in self._scan(ssdb, 'keys', (), page_size):
+                with self._lock:
+                    bloom.add(_item(qualify(name)))
+            for hash, name in hashes:
+                for key in self._scan(ssdb, 'hkeys', (hash,), page_size):
+                    with self._lock:
+                        bloom.add(_item(name, key))
+            with self._lock:
+                self.filter = bloom
+                self.hashes = frozenset(_to_bytes(name)
+                                        for hash, name in hashes)
+        finally:
+            with self._lock:
+                self._building = None
+
+    def _scan(self, ssdb, command, args, page_size):
+        start = ''
+        while True:
+            names = ssdb.execute_command(command, *(args + (start, '',
+                                                            page_size)))
+            for name in names:
+                yield name
+            if len(names) < page_size:
+                return
+            start = names[-1]
+
+    def clear(self):
+        "Forget the misses and the filter"
+        with self._lock:
+            self.misses.clear()
+            self.filter = None
+            self.hashes = frozenset()
@@ -0,0 +1,211 @@
+#coding=utf-8
+"""
+An opt-in profiler of the time the client spends in each phase of a command.
+
+    >>> from ssdb import profiler
+    >>> profiler.enable()
+    >>> client.multi_get('a', 'b')
+    >>> print(profiler.report())
+    phase      command            calls      seconds
+    pack       multi_get              1     0.000012
+    send       multi_get              1     0.000025
+    recv       multi_get              1     0.000110
+    parse      multi_get              1     0.000009
+    callback   multi_get              1     0.000004
+    >>> profiler.disable()
+
+The phases are:
+
+* ``pack``: `Connection.pack_command`,
+* ``send``: `Connection.send_packed_command` (connecting included),
+* ``recv``: `SocketBuffer._read_from_socket`, waiting for the server,
+* ``parse``: `PythonParser.read_response`, not counting ``recv``,
+* ``callback``: `StrictSSDB.parse_response`, turning the reply into a
+  result with the ``RESPONSE_CALLBACKS``, not counting ``parse`` and
+  ``recv``.
+
+Times are wall clock and exclusive, so the phases of a command add up. The
+``send`` of a batch is recorded under the command ``batch``.
+
+`enable`_ replaces these methods on their classes by timed wrappers and
+`disable`_ puts the originals back, so a disabled profiler costs nothing.
+The counters are global, shared by all the threads, and can be read with
+`stats`_ and cleared with `reset`_ at any time.
+"""
+from __future__ import with_statement
+import threading
+import timeit
+from contextlib import contextmanager
+from ssdb.batch import BaseBatch
+from ssdb.client import Batch, StrictBatch, StrictSSDB
+from ssdb.connection import Connection, PythonParser, SocketBuffer
+
+PHASES = ('pack', 'send', 'recv', 'parse', 'callback')
+
+_timer = timeit.default_timer
+_lock = threading.Lock()
+_local = threading.local()
+# (phase, command) -> [calls, seconds]
+_counters = {}
+_originals = {}
+
+
+def _record(phase, command, seconds):
+    with _lock:
+        counter = _counters.get((phase, command))
+        if counter is None:
+            counter = _counters[phase, command] = [0, 0.0]
+        counter[0] += 1
+        counter[1] += seconds
+
+
+def _timed(phase, function, command=None):
+    """
+    Wrap ``function`` to record its time, less the time of the timed calls
+    it makes, under ``phase``. ``command(args)`` names the command, which
+    becomes the current command of the thread, otherwise the current command
+    is used.
+    """
+    def wrapper(self, *args, **kwargs):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        if command is not None:
+            name = _local.command = command(args)
+        else:
+            name = getattr(_local, 'command', None)
+        stack.append(0.0)
+        start = _timer()
+        try:
+            return function(self, *args, **kwargs)
+        finally:
+            elapsed = _timer() - start
+            children = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            _record(phase, name, elapsed - children)
+    wrapper.__name__ = function.__name__
+    wrapper.__doc__ = function.__doc__
+    return wrapper
+
+
+def _batch(function):
+    "Mark the thread as running a batch, whose ``send`` is not one command's"
+    def wrapper(self, *args, **kwargs):
+        _local.batch = True
+        try:
+            return function(self, *args, **kwargs)
+        finally:
+            _local.batch = False
+    wrapper.__name__ = function.__name__
+    wrapper.__doc__ = function.__doc__
+    return wrapper
+
+
+def _sent_command(args):
+    if getattr(_local, 'batch', False):
+        return 'batch'
+    return getattr(_local, 'command', None)
+
+
+def _callback(args):
+    return args[1]
+
+
+_WRAPPERS = (
+    (Connection, 'pack_command',
+     lambda f: _timed('pack', f, lambda args: args[0])),
+    (Connection, 'send_packed_command',
+     lambda f: _timed('send', f, _sent_command)),
+    (SocketBuffer, '_read_from_socket', lambda f: _timed('recv', f)),
+    (PythonParser, 'read_response', lambda f: _timed('parse', f)),
+    (StrictSSDB, 'parse_response',
+     lambda f: _timed('callback', f, _callback)),
+    (StrictBatch, 'parse_response',
+     lambda f: _timed('callback', f, _callback)),
+    (Batch, 'parse_response',
+     lambda f: _timed('callback', f, _callback)),
+    (BaseBatch, '_execute_pipeline', _batch),
+)
+
+
+def enabled():
+    "Return whether the profiler is enabled"
+    return bool(_originals)
+
+
+def enable():
+    """
+    Start recording the phases of the commands of every client
+    """
+    with _lock:
+        if _originals:
+            return
+        for cls, name, wrap in _WRAPPERS:
+            original = cls.__dict__[name]
+            _originals[cls, name] = original
+            setattr(cls, name, wrap(original))
+
+
+def disable():
+    """
+    Stop recording, the counters are kept
+    """
+    with _lock:
+        for (cls, name), original in _originals.items():
+            setattr(cls, name, original)
+        _originals.clear()
+
+
+def reset():
+    "Clear the counters"
+    with _lock:
+        _counters.clear()
+
+
+@contextmanager
+def profile():
+    """
+    Record the phases of the commands run in the ``with`` block
+    """
+    was_enabled = enabled()
+    enable()
+    try:
+        yield
+    finally:
+        if not was_enabled:
+            disable()
+
+
+def stats(by_command=False):
+    """
+    Return ``{phase: (calls, seconds)}``, or with ``by_command``
+    ``{command: {phase: (calls, seconds)}}``
+    """
+    with _lock:
+        counters = [(key, tuple(value)) for key, value in _counters.items()]
+    if not by_command:
+        result = dict((phase, (0, 0.0)) for phase in PHASES)
+        for (phase, command), (calls, seconds) in counters:
+            total = result[phase]
+            result[phase] = (total[0] + calls, total[1] + seconds)
+        return result
+    result = {}
+    for (phase, command), value in counters:
+        result.setdefault(command, {})[phase] = value
+    return result
+
+
+def report():
+    "Return the counters of each command as a table"
+    lines = ['%-10s %-16s %8s %12s' % ('phase', 'command', 'calls',
+                                      'seconds')]
+    order = dict((phase, i) for i, phase in enumerate(PHASES))
+    by_command = stats(by_command=True)
+    for command in sorted(by_command, key=str):
+        phases = by_command[command]
+        for phase in sorted(phases, key=order.get):
+            calls, seconds = phases[phase]
+            lines.append('%-10s %-16s %8d %12.6f' % (phase, command, calls,
+                                                     seconds))
+    return '\n'.join(lines)
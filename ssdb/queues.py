@@ -0,0 +1,477 @@
+#coding=utf-8
+"""
+High throughput helpers built on the SSDB queue commands.
+
+    >>> from ssdb import SSDB
+    >>> from ssdb.queues import QueueConsumer
+    >>> consumer = QueueConsumer(SSDB(), ['jobs_high', 'jobs_low'],
+    ...                          weights={'jobs_high': 4, 'jobs_low': 1})
+    >>> for name, item in consumer:
+    ...     handle(item)
+"""
+from __future__ import with_statement
+import itertools
+import sys
+import threading
+import time as mod_time
+import uuid
+from ssdb._compat import Queue, Empty, Full, basestring, iteritems, izip
+from ssdb.exceptions import DataError, ResponseError
+from ssdb.utils import get_positive_integer, get_choice
+
+
+class QueueConsumer(object):
+    """
+    Pop items from one or more queues in batches on a background thread and
+    prefetch them into a local buffer of at most ``buffer_size`` items.
+
+    Every fetch sends ``qpop_front`` (or ``qpop_back`` with ``end='back'``)
+    and ``qsize`` in one round trip: the backlog reported by ``qsize`` sizes
+    the next pop of that queue, between ``min_batch`` and ``max_batch``
+    items and never more than the free room in the buffer.
+
+    Queues are picked by smooth weighted round robin using ``weights``
+    (``1`` for the queues missing from it). An empty queue is left alone
+    for ``min_wait`` seconds, doubling up to ``max_wait`` while it stays
+    empty, and the thread sleeps when every queue is empty.
+
+    Items popped but not consumed yet are pushed back where they came from
+    by `close`_.
+    """
+
+    def __init__(self, ssdb, names, weights=None, min_batch=1, max_batch=1000,
+                 buffer_size=10000, min_wait=0.01, max_wait=1.0, end='front'):
+        if isinstance(names, basestring):
+            names = [names]
+        self.ssdb = ssdb
+        self.names = list(names)
+        weights = weights or {}
+        self.weights = dict((name, weights.get(name, 1))
+                            for name in self.names)
+        self.min_batch = get_positive_integer('min_batch', min_batch)
+        self.max_batch = get_positive_integer('max_batch', max_batch)
+        self.buffer_size = get_positive_integer('buffer_size', buffer_size)
+        self.min_wait = min_wait
+        self.max_wait = max_wait
+        self.end = get_choice('end', end, ('front', 'back'))
+        self.last_error = None
+        self._buffer = Queue(self.buffer_size)
+        self._backlog = dict.fromkeys(self.names, 0)
+        self._current = dict.fromkeys(self.names, 0)
+        self._idle_until = dict.fromkeys(self.names, 0)
+        self._wait = dict.fromkeys(self.names, min_wait)
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run,
+                                        name='ssdb-queue-consumer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __iter__(self):
+        while True:
+            result = self.get(timeout=self.max_wait)
+            if result is not None:
+                yield result
+            elif self._closed.is_set():
+                return
+
+    def __len__(self):
+        "Number of prefetched items waiting in the local buffer"
+        return self._buffer.qsize()
+
+    def get(self, block=True, timeout=None):
+        """
+        Return the next ``(name, item)`` pair, or ``None`` if none arrived
+        within ``timeout`` seconds (or at once if ``block`` is ``False``).
+        """
+        try:
+            return self._buffer.get(block, timeout)
+        except Empty:
+            return None
+
+    def _next_queue(self, now):
+        "Pick the next queue by smooth weighted round robin"
+        best = None
+        total = 0
+        for name in self.names:
+            if self._idle_until[name] > now:
+                continue
+            weight = self.weights[name]
+            total += weight
+            self._current[name] += weight
+            if best is None or self._current[name] > self._current[best]:
+                best = name
+        if best is not None:
+            self._current[best] -= total
+        return best
+
+    def _batch_size(self, name, free):
+        size = max(self.min_batch, min(self._backlog[name], self.max_batch))
+        return min(size, free)
+
+    def fetch(self, name, size):
+        """
+        Pop up to ``size`` items from queue ``name`` into the buffer and
+        return how many were popped.
+        """
+        batch = self.ssdb.batch()
+        getattr(batch, 'qpop_' + self.end)(name, size)
+        batch.qsize(name)
+        items, backlog = batch.execute()
+        items = items or []
+        self._backlog[name] = backlog or 0
+        for item in items:
+            self._buffer.put_nowait((name, item))
+        return len(items)
+
+    def _run(self):
+        while not self._closed.is_set():
+            free = self.buffer_size - self._buffer.qsize()
+            if free <= 0:
+                self._closed.wait(self.min_wait)
+                continue
+            now = mod_time.time()
+            name = self._next_queue(now)
+            if name is None:
+                wake = min(self._idle_until.values())
+                self._closed.wait(max(wake - now, 0))
+                continue
+            try:
+                fetched = self.fetch(name, self._batch_size(name, free))
+            except Exception:
+                self.last_error = sys.exc_info()[1]
+                fetched = 0
+            if fetched:
+                self._wait[name] = self.min_wait
+            else:
+                self._idle_until[name] = now + self._wait[name]
+                self._wait[name] = min(self._wait[name] * 2, self.max_wait)
+
+    def close(self, requeue=True):
+        """
+        Stop prefetching. With ``requeue`` the buffered items are pushed back
+        to the end of the queue they were popped from, in their original
+        order, otherwise they can still be read with `get`_.
+        """
+        self._closed.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+        if not requeue:
+            return
+        leftovers = {}
+        while True:
+            try:
+                name, item = self._buffer.get_nowait()
+            except Empty:
+                break
+            leftovers.setdefault(name, []).append(item)
+        push = getattr(self.ssdb, 'qpush_' + self.end)
+        for name, items in iteritems(leftovers):
+            items.reverse()
+            push(name, *items)
+
+
+class QueueProducer(object):
+    """
+    Buffer the items pushed to one or more queues and send them in chunks of
+    at most ``chunk_size`` items and ``chunk_bytes`` bytes, instead of one
+    giant ``qpush_back`` or one round trip per item. A queue is flushed as
+    soon as it holds a full chunk; `flush`_ sends everything, the chunks of
+    every queue being pipelined in one batch.
+
+    With ``high_water`` set, `put`_ blocks while the last known length of
+    the target queue (as returned by ``qpush_*``) is at or above it, polling
+    ``qsize`` with a backoff from ``min_wait`` to ``max_wait`` seconds until
+    the queue drains below ``low_water`` (default ``high_water``).
+
+        >>> producer = QueueProducer(SSDB(), chunk_size=500, high_water=10 ** 6)
+        >>> for row in rows:
+        ...     producer.put('jobs', row)
+        >>> producer.close()
+    """
+
+    def __init__(self, ssdb, chunk_size=1000, chunk_bytes=1024 * 1024,
+                 high_water=None, low_water=None, min_wait=0.01, max_wait=1.0,
+                 end='back'):
+        self.ssdb = ssdb
+        self.chunk_size = get_positive_integer('chunk_size', chunk_size)
+        self.chunk_bytes = get_positive_integer('chunk_bytes', chunk_bytes)
+        self.high_water = high_water
+        self.low_water = low_water if low_water is not None else high_water
+        self.min_wait = min_wait
+        self.max_wait = max_wait
+        self.end = get_choice('end', end, ('front', 'back'))
+        self.command = 'qpush_' + self.end
+        # name -> [items], name -> bytes buffered, name -> last known length
+        self._pending = {}
+        self._bytes = {}
+        self._sizes = {}
+        self._lock = threading.RLock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        "Number of items waiting to be pushed"
+        return sum(len(items) for items in self._pending.values())
+
+    def put(self, name, *items, **kwargs):
+        """
+        Buffer ``items`` for the queue ``name``. ``timeout`` (keyword only)
+        bounds how long to wait for a queue above its high-water mark, after
+        which :class:`Full` is raised.
+        """
+        timeout = kwargs.pop('timeout', None)
+        if self.high_water is not None:
+            self.wait_below_high_water(name, timeout)
+        encode = self.ssdb.encode_value
+        with self._lock:
+            pending = self._pending.setdefault(name, [])
+            size = self._bytes.get(name, 0)
+            for item in items:
+                item = encode(item)
+                pending.append(item)
+                size += _item_size(item)
+            self._bytes[name] = size
+            if len(pending) >= self.chunk_size or size >= self.chunk_bytes:
+                self.flush(full_only=True)
+
+    def wait_below_high_water(self, name, timeout=None):
+        """
+        Block while the queue ``name`` is known to be at or above the
+        high-water mark
+        """
+        if self._sizes.get(name, 0) < self.high_water:
+            return
+        deadline = timeout is not None and mod_time.time() + timeout
+        wait = self.min_wait
+        while True:
+            size = self.ssdb.qsize(name)
+            self._sizes[name] = size
+            if size < self.low_water:
+                return
+            if deadline and mod_time.time() + wait > deadline:
+                raise Full("Queue %s is above its high-water mark" % name)
+            mod_time.sleep(wait)
+            wait = min(wait * 2, self.max_wait)
+
+    def _chunks(self, items):
+        chunk = []
+        size = 0
+        for item in items:
+            item_size = _item_size(item)
+            if chunk and (len(chunk) >= self.chunk_size or
+                          size + item_size > self.chunk_bytes):
+                yield chunk
+                chunk = []
+                size = 0
+            chunk.append(item)
+            size += item_size
+        if chunk:
+            yield chunk
+
+    def flush(self, full_only=False):
+        """
+        Push the buffered items, chunked and pipelined in one batch, and
+        return how many were sent. With ``full_only`` only the queues
+        holding at least a full chunk are flushed.
+
+        Only the chunks the server refused stay buffered, the first error
+        being raised once the others are accounted for. If the batch fails
+        as a whole (the connection is lost) every item stays buffered,
+        though some may have been pushed: they are then pushed twice.
+        """
+        with self._lock:
+            chunks = []
+            batch = self.ssdb.batch()
+            for name, items in iteritems(self._pending):
+                if not items or full_only and \
+                   len(items) < self.chunk_size and \
+                   self._bytes.get(name, 0) < self.chunk_bytes:
+                    continue
+                for chunk in self._chunks(items):
+                    batch.execute_command(self.command, name, *chunk)
+                    chunks.append((name, chunk))
+            if not chunks:
+                return 0
+            responses = batch.execute(raise_on_error=False)
+            failed = dict((name, []) for name, chunk in chunks)
+            count = 0
+            error = None
+            for (name, chunk), response in zip(chunks, responses):
+                if isinstance(response, (ResponseError, DataError)):
+                    failed[name].extend(chunk)
+                    error = error or response
+                else:
+                    self._sizes[name] = response
+                    count += len(chunk)
+            for name, items in iteritems(failed):
+                self._pending[name] = items
+                self._bytes[name] = sum(_item_size(item) for item in items)
+            if error is not None:
+                raise error
+            return count
+
+    def close(self):
+        """
+        Flush what's left
+        """
+        self.flush()
+
+
+class ReliableQueue(object):
+    """
+    At-least-once consumption of the queue ``name``.
+
+    Every popped item gets a unique id and is recorded, in the same
+    pipeline, in the hash ``inflight`` (id -> item) and the zset
+    ``deadlines`` (id -> deadline in milliseconds, ``visibility_timeout``
+    seconds ahead). `ack`_ removes the records of processed items in bulk;
+    `requeue_expired`_ pushes the items whose deadline passed back to the
+    queue, from a background thread every ``requeue_interval`` seconds if
+    set.
+
+    .. note:: The pop and the record are two round trips, a client dying
+       right between them still loses the items popped. Items can be
+       delivered twice if they are acknowledged after their deadline.
+
+        >>> queue = ReliableQueue(SSDB(), 'jobs', visibility_timeout=60)
+        >>> for item_id, item in queue.pop(100):
+        ...     handle(item)
+        ...     done.append(item_id)
+        >>> queue.ack(*done)
+    """
+
+    def __init__(self, ssdb, name, visibility_timeout=30, inflight=None,
+                 deadlines=None, requeue_interval=None, requeue_limit=1000):
+        self.ssdb = ssdb
+        self.name = name
+        self.visibility_timeout = visibility_timeout
+        self.inflight = inflight or '%s:inflight' % name
+        self.deadlines = deadlines or '%s:deadlines' % name
+        self.requeue_limit = get_positive_integer('requeue_limit',
+                                                  requeue_limit)
+        self.last_error = None
+        self._prefix = uuid.uuid4().hex
+        self._counter = itertools.count()
+        self._closed = threading.Event()
+        self._thread = None
+        if requeue_interval is not None:
+            self._thread = threading.Thread(target=self._run,
+                                            args=(requeue_interval,),
+                                            name='ssdb-reliable-queue')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _deadline(self, timeout=None):
+        if timeout is None:
+            timeout = self.visibility_timeout
+        return int((mod_time.time() + timeout) * 1000)
+
+    def push(self, *items):
+        """
+        Push ``items`` onto the tail of the queue
+        """
+        return self.ssdb.qpush_back(self.name, *items)
+
+    def pop(self, size=1):
+        """
+        Pop up to ``size`` items and return a list of ``(id, item)`` pairs,
+        the ids being what `ack`_ expects.
+        """
+        items = self.ssdb.qpop_front(self.name, size)
+        if not items:
+            return []
+        ids = ['%s:%d' % (self._prefix, next(self._counter))
+               for _ in items]
+        deadline = self._deadline()
+        batch = self.ssdb.batch()
+        batch.multi_hset(self.inflight, **dict(izip(ids, items)))
+        batch.multi_zset(self.deadlines, **dict.fromkeys(ids, deadline))
+        batch.execute()
+        return list(izip(ids, items))
+
+    def extend(self, ids, timeout=None):
+        """
+        Push back the deadline of the in-flight ``ids`` by ``timeout``
+        seconds (``visibility_timeout`` by default)
+        """
+        if not ids:
+            return 0
+        return self.ssdb.multi_zset(
+            self.deadlines, **dict.fromkeys(ids, self._deadline(timeout)))
+
+    def ack(self, *ids):
+        """
+        Acknowledge the processed items ``ids`` in one round trip
+        """
+        if not ids:
+            return 0
+        batch = self.ssdb.batch()
+        batch.multi_hdel(self.inflight, *ids)
+        batch.multi_zdel(self.deadlines, *ids)
+        return batch.execute()[0]
+
+    def requeue_expired(self):
+        """
+        Push the items whose deadline passed back to the queue and return how
+        many were requeued. Each page of ``requeue_limit`` expired items
+        costs one ``zscan``, one ``multi_hget`` and one pipeline.
+        """
+        now = int(mod_time.time() * 1000)
+        count = 0
+        while True:
+            expired = self.ssdb.zscan(self.deadlines, '', '', now,
+                                      self.requeue_limit,
+                                      result_format='dict')
+            ids = list(expired or [])
+            if not ids:
+                return count
+            items = self.ssdb.multi_hget(self.inflight, *ids) or {}
+            batch = self.ssdb.batch()
+            values = [items[i] for i in ids if i in items]
+            if values:
+                batch.qpush_back(self.name, *values)
+            batch.multi_hdel(self.inflight, *ids)
+            batch.multi_zdel(self.deadlines, *ids)
+            batch.execute()
+            count += len(values)
+            if len(ids) < self.requeue_limit:
+                return count
+
+    def _run(self, interval):
+        while not self._closed.wait(interval):
+            try:
+                self.requeue_expired()
+            except Exception:
+                self.last_error = sys.exc_info()[1]
+
+    def close(self):
+        """
+        Stop the background requeuer, if any
+        """
+        self._closed.set()
+        if self._thread is not None and \
+           self._thread is not threading.current_thread():
+            self._thread.join()
+
+
+def _item_size(item):
+    try:
+        return len(item)
+    except TypeError:
+        return len(str(item))
@@ -0,0 +1,181 @@
+#coding=utf-8
+"""
+Rate limiters keyed by tenant (or any other key).
+
+    >>> from ssdb import SSDB
+    >>> from ssdb.ratelimit import FixedWindowRateLimiter
+    >>> limiter = FixedWindowRateLimiter(SSDB(), 'api', limit=100, window=60)
+    >>> limiter.check('tenant_1')
+    True
+
+Every check costs one pipelined round trip (plus one more to give tokens
+back when a request is denied), except for the token buckets: a ``get``
+then a ``getset``, and one more round trip per retry. With ``prefetch`` a
+limiter takes that many tokens at once and serves the following checks of
+the key from memory for at most ``prefetch_ttl`` seconds, trading a little
+accuracy (tokens taken but unused in time are wasted) for skipping the
+round trips on hot keys.
+"""
+from __future__ import with_statement
+import itertools
+import threading
+import time as mod_time
+import uuid
+from ssdb.utils import get_positive_integer
+
+
+class RateLimiter(object):
+    """
+    Base class of the rate limiters, subclasses implement ``acquire``.
+    """
+
+    def __init__(self, ssdb, name, prefetch=None, prefetch_ttl=1.0):
+        self.ssdb = ssdb
+        self.name = name
+        if prefetch is not None:
+            prefetch = get_positive_integer('prefetch', prefetch)
+        self.prefetch = prefetch
+        self.prefetch_ttl = prefetch_ttl
+        self._local = {}
+        self._lock = threading.Lock()
+        self._time = mod_time.time
+
+    def key(self, key):
+        return '%s:%s' % (self.name, key)
+
+    def check(self, key, cost=1):
+        """
+        Consume ``cost`` tokens of ``key`` and return whether it's allowed
+        """
+        cost = get_positive_integer('cost', cost)
+        if not self.prefetch or cost > self.prefetch:
+            return self.acquire(key, cost)
+        now = self._time()
+        with self._lock:
+            local = self._local.get(key)
+            if local is not None and local[1] > now and local[0] >= cost:
+                local[0] -= cost
+                return True
+        if self.acquire(key, self.prefetch):
+            with self._lock:
+                self._local[key] = [self.prefetch - cost,
+                                    now + self.prefetch_ttl]
+            return True
+        return self.acquire(key, cost)
+
+    def acquire(self, key, cost):
+        """
+        Take ``cost`` tokens of ``key`` from SSDB, all or nothing
+        """
+        raise NotImplementedError
+
+
+class FixedWindowRateLimiter(RateLimiter):
+    """
+    Allow ``limit`` tokens per key and per ``window`` seconds, counted with
+    ``incr`` on a key named after the window that ``expire`` cleans up.
+    """
+
+    def __init__(self, ssdb, name, limit, window, **kwargs):
+        super(FixedWindowRateLimiter, self).__init__(ssdb, name, **kwargs)
+        self.limit = get_positive_integer('limit', limit)
+        self.window = get_positive_integer('window', window)
+
+    def acquire(self, key, cost):
+        name = '%s:%d' % (self.key(key), int(self._time()) // self.window)
+        batch = self.ssdb.batch()
+        batch.incr(name, cost)
+        batch.expire(name, self.window)
+        count = batch.execute()[0]
+        if count <= self.limit:
+            return True
+        if count - cost < self.limit:
+            # give back what a smaller request could still use
+            self.ssdb.incr(name, -cost)
+        return False
+
+
+class SlidingWindowRateLimiter(RateLimiter):
+    """
+    Allow ``limit`` tokens per key over any ``window`` seconds, logging each
+    token in a zset scored by its time in milliseconds. A check trims the
+    entries older than the window with ``zremrangebyscore``, logs its tokens
+    and counts the window with ``zcount`` in one pipeline.
+
+    .. note:: SSDB zsets don't expire, the log of a key that stops being
+       checked is left with at most ``limit`` entries.
+    """
+
+    def __init__(self, ssdb, name, limit, window, **kwargs):
+        super(SlidingWindowRateLimiter, self).__init__(ssdb, name, **kwargs)
+        self.limit = get_positive_integer('limit', limit)
+        self.window = window
+        self._prefix = uuid.uuid4().hex
+        self._counter = itertools.count()
+
+    def acquire(self, key, cost):
+        name = self.key(key)
+        now = int(self._time() * 1000)
+        start = now - int(self.window * 1000)
+        members = ['%s:%d' % (self._prefix, next(self._counter))
+                   for _ in range(cost)]
+        batch = self.ssdb.batch()
+        batch.zremrangebyscore(name, '', start)
+        batch.multi_zset(name, **dict.fromkeys(members, now))
+        batch.zcount(name, start + 1, '')
+        count = batch.execute()[-1]
+        if count <= self.limit:
+            return True
+        self.ssdb.multi_zdel(name, *members)
+        return False
+
+
+class TokenBucketRateLimiter(RateLimiter):
+    """
+    Token buckets of ``capacity`` tokens refilled at ``rate`` tokens per
+    second, as a generic cell rate algorithm: the key of each bucket holds
+    its theoretical arrival time in microseconds, read with ``get`` and
+    replaced by ``max(tat, now) + cost / rate`` with ``getset``, then left to
+    ``expire`` once it's in the past.
+
+    ``getset`` returns the value it replaced: if another client wrote in
+    between, the write is redone on top of that value, up to ``retries``
+    times, so concurrent checks never take less than their tokens.
+
+    This is not a single pipelined round trip: a check is a ``get`` then,
+    unless the bucket is left as it is, a ``getset`` sent in one batch with
+    the ``expire``, plus one more such batch per retry (optimistic
+    concurrency, as SSDB has no compare and set).
+    """
+
+    def __init__(self, ssdb, name, rate, capacity, retries=8, **kwargs):
+        super(TokenBucketRateLimiter, self).__init__(ssdb, name, **kwargs)
+        self.rate = rate
+        self.capacity = get_positive_integer('capacity', capacity)
+        self.retries = get_positive_integer('retries', retries)
+        self._interval = int(1000000 / rate)
+
+    def acquire(self, key, cost):
+        if cost > self.capacity:
+            return False
+        name = self.key(key)
+        now = int(self._time() * 1000000)
+        increment = cost * self._interval
+        burst = self.capacity * self._interval
+        # ``stored`` is the value expected in SSDB, ``tat`` the arrival time
+        # the new one builds on
+        stored = tat = int(self.ssdb.get(name) or 0)
+        for _ in range(self.retries):
+            allowed = max(tat, now) + increment - now <= burst
+            value = max(tat, now) + increment if allowed else tat
+            if value == stored:
+                return allowed
+            batch = self.ssdb.batch()
+            batch.getset(name, value)
+            batch.expire(name, max(value - now, 0) // 1000000 + 1)
+            previous = int(batch.execute()[0] or 0)
+            if previous == stored:
+                return allowed
+            # another client wrote meanwhile, redo on top of its value
+            stored, tat = value, previous
+        return False
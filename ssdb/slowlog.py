@@ -0,0 +1,168 @@
+#coding=utf-8
+"""
+A client side log of the slow commands and of the commands with large
+replies.
+
+    >>> from ssdb import SSDB
+    >>> from ssdb.slowlog import SlowLog
+    >>> slowlog = SlowLog(slower_than=0.05, larger_than=1 << 20,
+    ...                   limit_cap=10000, callback=logger.warning)
+    >>> client = SSDB(slowlog=slowlog)
+    >>> client.hgetall('huge')
+    >>> slowlog.get(1)
+    [SlowLogEntry(id=0, time=1500000000.0, command='hgetall', args=['huge'],
+                  duration=2.5, bytes=52428800, elements=1048576)]
+
+A command is logged when it took more than ``slower_than`` seconds or its
+reply had more than ``larger_than`` bytes or ``more_than`` elements. The
+log keeps the last ``max_len`` entries, the arguments truncated to
+``max_args`` of at most ``max_arg_len`` characters each, and ``callback`` is
+called with every new entry.
+
+With ``limit_cap``, the commands whose ``limit`` (or ``size`` for
+``qpop_*``) exceeds the cap are stopped before being sent: a `DataError` is
+raised, or a warning issued if ``limit_action`` is ``'warn'``.
+
+A batch is logged as a whole, as the command ``batch`` whose arguments are
+the names of its commands, with the time of the pipeline and the total
+size of the replies.
+"""
+from __future__ import with_statement
+import collections
+import itertools
+import time as mod_time
+import timeit
+import warnings
+from ssdb._compat import bytes, nativestr, unicode
+from ssdb.exceptions import DataError
+from ssdb.utils import get_choice, get_positive_integer
+
+LIMIT_ACTIONS = ('raise', 'warn')
+
+# command -> index of its limit in the command arguments
+LIMIT_ARGUMENTS = {
+    'keys': 3, 'scan': 3, 'rscan': 3,
+    'hlist': 3, 'hrlist': 3, 'hkeys': 4, 'hscan': 4, 'hrscan': 4,
+    'zlist': 3, 'zrlist': 3, 'zkeys': 5, 'zscan': 5, 'zrscan': 5,
+    'zrange': 3, 'zrrange': 3,
+    'qlist': 3, 'qrlist': 3, 'qrange': 3, 'qpop_front': 2, 'qpop_back': 2,
+}
+
+SlowLogEntry = collections.namedtuple(
+    'SlowLogEntry', 'id time command args duration bytes elements')
+
+
+class SlowLimitWarning(UserWarning):
+    "A command asked for more items than the ``limit_cap`` of the slow log"
+    pass
+
+
+def reply_size(response):
+    "Return the bytes and the elements of the raw ``response``, less status"
+    if not response:
+        return 0, 0
+    return (sum(len(value) for value in response) - len(response[0]),
+            len(response) - 1)
+
+
+class SlowLog(object):
+    """
+    A ring buffer of the last ``max_len`` commands slower than
+    ``slower_than`` seconds or with replies larger than ``larger_than``
+    bytes or ``more_than`` elements
+    """
+
+    def __init__(self, slower_than=0.1, larger_than=None, more_than=None,
+                 max_len=128, max_args=8, max_arg_len=32, callback=None,
+                 limit_cap=None, limit_action='raise'):
+        self.slower_than = slower_than
+        self.larger_than = larger_than
+        self.more_than = more_than
+        self.max_args = get_positive_integer('max_args', max_args)
+        self.max_arg_len = get_positive_integer('max_arg_len', max_arg_len)
+        self.callback = callback
+        if limit_cap is not None:
+            limit_cap = get_positive_integer('limit_cap', limit_cap)
+        self.limit_cap = limit_cap
+        self.limit_action = get_choice('limit_action', limit_action,
+                                       LIMIT_ACTIONS)
+        self.entries = collections.deque(
+            maxlen=get_positive_integer('max_len', max_len))
+        self.timer = timeit.default_timer
+        self._ids = itertools.count()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.get())
+
+    def get(self, count=None):
+        """
+        Return the ``count`` (all by default) latest entries, newest first
+        """
+        entries = list(self.entries)
+        entries.reverse()
+        return entries if count is None else entries[:count]
+
+    def reset(self):
+        "Empty the log"
+        self.entries.clear()
+
+    def check(self, args):
+        """
+        Apply the ``limit_cap`` to the command ``args``
+        """
+        if self.limit_cap is None:
+            return
+        index = LIMIT_ARGUMENTS.get(args[0])
+        if index is None or len(args) <= index:
+            return
+        try:
+            limit = int(args[index])
+        except (TypeError, ValueError):
+            return
+        if limit <= self.limit_cap:
+            return
+        message = '%s with a limit of %d exceeds the cap of %d' % (
+            args[0], limit, self.limit_cap)
+        if self.limit_action == 'raise':
+            raise DataError(message)
+        warnings.warn(message, SlowLimitWarning, stacklevel=4)
+
+    def record(self, args, duration, size):
+        """
+        Log the command ``args`` if it took ``duration`` seconds or its reply
+        ``size``, a ``(bytes, elements)`` pair, is over the thresholds and
+        return the entry, ``None`` otherwise
+        """
+        length, elements = size
+        if not ((self.slower_than is not None and
+                 duration > self.slower_than) or
+                (self.larger_than is not None and
+                 length > self.larger_than) or
+                (self.more_than is not None and elements > self.more_than)):
+            return None
+        entry = SlowLogEntry(next(self._ids), mod_time.time(),
+                             nativestr(args[0]), self._truncate(args[1:]),
+                             duration, length, elements)
+        self.entries.append(entry)
+        if self.callback is not None:
+            self.callback(entry)
+        return entry
+
+    def _truncate(self, args):
+        result = []
+        for arg in args[:self.max_args]:
+            if isinstance(arg, bytes):
+                arg = nativestr(arg)
+            elif not isinstance(arg, unicode):
+                arg = str(arg)
+            if len(arg) > self.max_arg_len:
+                arg = '%s... (%d more)' % (arg[:self.max_arg_len],
+                                           len(arg) - self.max_arg_len)
+            result.append(arg)
+        if len(args) > self.max_args:
+            result.append('... (%d more arguments)' %
+                          (len(args) - self.max_args))
+        return result
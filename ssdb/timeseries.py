@@ -0,0 +1,221 @@
+#coding=utf-8
+"""
+Time series stored in SSDB zsets.
+
+    >>> from ssdb import SSDB
+    >>> from ssdb.timeseries import TimeSeries
+    >>> cpu = TimeSeries(SSDB(), 'cpu:host1', retention=7 * 86400)
+    >>> cpu.add(1451606400, 0.25)
+    >>> cpu.add(1451606410, 0.75)
+    >>> cpu.flush()
+    2
+    >>> cpu.range(1451606400, 1451606459)
+    (array('q', [1451606400, 1451606410]), array('d', [0.25, 0.75]))
+    >>> cpu.downsample(60, 1451606400, 1451606459, 'max')
+    (array('q', [1451606400]), array('d', [0.75]))
+
+Each point is a zset key ``<timestamp>:<value>:<writer>.<sequence>`` scored
+by its integer timestamp (in whatever unit the caller uses); the random
+``writer`` id and the sequence of each `TimeSeries`_ keep equal points
+apart. Time ranges map to score ranges: reads page through ``zscan``,
+`count`_ is a ``zcount`` and trimming a ``zremrangebyscore``. ``zsum`` and
+``zavg`` aggregate scores, that is timestamps here, so sums, averages and
+the other aggregations of values are computed by the client.
+
+Results are a pair of ``array.array`` (64 bit integer timestamps and
+``'d'`` values), which ``numpy.frombuffer`` turns into arrays without a copy.
+"""
+from __future__ import with_statement
+import array
+import itertools
+import threading
+import uuid
+from ssdb._compat import iteritems, nativestr
+from ssdb.utils import get_choice, get_positive_integer
+
+AGGREGATIONS = {
+    'avg': lambda values: sum(values) / len(values),
+    'sum': sum,
+    'min': min,
+    'max': max,
+    'count': len,
+    'first': lambda values: values[0],
+    'last': lambda values: values[-1],
+    }
+
+try:
+    TIMESTAMP_TYPECODE = array.array('q').typecode
+except ValueError:
+    # 'q' is new in Python 3.3, 'l' is 64 bits on 64 bit Unix
+    TIMESTAMP_TYPECODE = 'l'
+
+
+class TimeSeries(object):
+    """
+    A series of ``(timestamp, value)`` points in the zset ``name``.
+
+    Points are buffered by `add`_ and written by `flush`_ with one
+    ``multi_zset`` per ``chunk_size`` points, all in one batch. With
+    ``retention`` the same batch drops the points older than ``retention``
+    before the latest one written. Reads fetch ``page_size`` points per
+    ``zscan``.
+    """
+
+    def __init__(self, ssdb, name, retention=None, chunk_size=1000,
+                 page_size=1000):
+        self.ssdb = ssdb
+        self.name = name
+        self.retention = retention
+        self.chunk_size = get_positive_integer('chunk_size', chunk_size)
+        self.page_size = get_positive_integer('page_size', page_size)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._writer = uuid.uuid4().hex[:12]
+        self._sequence = itertools.count()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+    def __len__(self):
+        "Number of points stored"
+        return self.ssdb.zsize(self.name)
+
+    def add(self, timestamp, value):
+        """
+        Buffer the point ``value`` at ``timestamp``
+        """
+        timestamp = int(timestamp)
+        with self._lock:
+            key = '%d:%r:%s.%d' % (timestamp, float(value), self._writer,
+                                   next(self._sequence))
+            self._pending[key] = timestamp
+
+    def add_many(self, points):
+        """
+        Write the ``(timestamp, value)`` pairs ``points``, return the number
+        of points written
+        """
+        for timestamp, value in points:
+            self.add(timestamp, value)
+        return self.flush()
+
+    def flush(self):
+        """
+        Write the buffered points and return their number
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        items = list(iteritems(pending))
+        batch = self.ssdb.batch()
+        for i in range(0, len(items), self.chunk_size):
+            batch.multi_zset(self.name, **dict(items[i:i + self.chunk_size]))
+        if self.retention is not None:
+            oldest = max(pending.values()) - self.retention
+            batch.zremrangebyscore(self.name, '', oldest - 1)
+        try:
+            batch.execute()
+        except Exception:
+            with self._lock:
+                pending.update(self._pending)
+                self._pending = pending
+            raise
+        return len(items)
+
+    def iter_range(self, start='', end=''):
+        """
+        Iterate over the ``(timestamp, value)`` points between ``start`` and
+        ``end`` (both included, ``''`` means unbounded) in time order
+        """
+        key_start, score_start = '', start
+        while True:
+            keys, scores = self.ssdb.zscan(self.name, key_start, score_start,
+                                           end, self.page_size,
+                                           result_format='pairs')
+            for key, score in zip(keys, scores):
+                yield score, float(nativestr(key).split(':', 2)[1])
+            if len(keys) < self.page_size:
+                return
+            key_start, score_start = keys[-1], scores[-1]
+
+    def range(self, start='', end=''):
+        """
+        Return the timestamps and the values of the points between ``start``
+        and ``end`` (both included, ``''`` means unbounded)
+        """
+        timestamps = array.array(TIMESTAMP_TYPECODE)
+        values = array.array('d')
+        for timestamp, value in self.iter_range(start, end):
+            timestamps.append(timestamp)
+            values.append(value)
+        return timestamps, values
+
+    def count(self, start='', end=''):
+        """
+        Return the number of points between ``start`` and ``end``, counted by
+        the server
+        """
+        return self.ssdb.zcount(self.name, start, end)
+
+    def aggregate(self, start='', end='', aggregation='avg'):
+        """
+        Return the ``aggregation`` (one of ``avg``, ``sum``, ``min``, ``max``,
+        ``count``, ``first`` and ``last``) of the values between ``start`` and
+        ``end``, ``None`` if there are none
+        """
+        func = AGGREGATIONS[get_choice('aggregation', aggregation,
+                                       sorted(AGGREGATIONS))]
+        if aggregation == 'count':
+            return self.count(start, end)
+        values = self.range(start, end)[1]
+        if not values:
+            return None
+        return func(values)
+
+    def downsample(self, step, start='', end='', aggregation='avg'):
+        """
+        Return the timestamps and the values of the points between ``start``
+        and ``end`` aggregated over buckets of ``step``, each timestamped by
+        its first instant
+        """
+        step = get_positive_integer('step', step)
+        func = AGGREGATIONS[get_choice('aggregation', aggregation,
+                                       sorted(AGGREGATIONS))]
+        timestamps = array.array(TIMESTAMP_TYPECODE)
+        values = array.array('d')
+        bucket, bucket_values = None, []
+        for timestamp, value in self.iter_range(start, end):
+            current = timestamp - timestamp % step
+            if current != bucket and bucket_values:
+                timestamps.append(bucket)
+                values.append(func(bucket_values))
+                bucket_values = []
+            bucket = current
+            bucket_values.append(value)
+        if bucket_values:
+            timestamps.append(bucket)
+            values.append(func(bucket_values))
+        return timestamps, values
+
+    def rollup(self, target, step, start='', end='', aggregation='avg'):
+        """
+        Downsample the points between ``start`` and ``end`` into the
+        `TimeSeries`_ (or series name) ``target`` and return the number of
+        points written
+        """
+        if not isinstance(target, TimeSeries):
+            target = TimeSeries(self.ssdb, target,
+                                chunk_size=self.chunk_size,
+                                page_size=self.page_size)
+        timestamps, values = self.downsample(step, start, end, aggregation)
+        return target.add_many(zip(timestamps, values))
+
+    def trim(self, oldest):
+        """
+        Remove the points older than ``oldest`` and return their number
+        """
+        return self.ssdb.zremrangebyscore(self.name, '', int(oldest) - 1)
@@ -1,5 +1,7 @@
 #coding=utf-8
 from contextlib import contextmanager
+from itertools import islice
+from ssdb._compat import Mapping, izip, xrange, unicode
 
 @contextmanager
 def batch(ssdb_obj):
@@ -43,6 +45,76 @@ def get_boolean(name, bol):
         raise ValueError('``%s`` must be a boolean' % name)
     return bool(bol)
 
+def get_choice(name, value, choices):
+    if value not in choices:
+        raise ValueError('``%s`` must be one of %s' % (name, ', '.join(choices)))
+    return value
+
+def prefix_end(prefix):
+    """
+    Return the first name after all the names starting with ``prefix``, as
+    bytes, or ``''`` if there is none (``prefix`` is only ``\\xff`` bytes)
+    """
+    if isinstance(prefix, unicode):
+        prefix = prefix.encode('utf-8')
+    end = bytearray(prefix.rstrip(b'\xff'))
+    if not end:
+        return ''
+    end[-1] += 1
+    return bytes(end)
+
+
+class ResponseView(Mapping):
+    """
+    A read-only mapping over a flat ``[key1, value1, key2, value2, ...]``
+    reply. Creating it doesn't touch the reply, the key index is built on
+    the first lookup by key and values are passed through ``convert`` (if
+    any) each time they are accessed.
+    """
+    def __init__(self, response, convert=None):
+        self._response = response
+        self._convert = convert
+        self._index = None
+
+    def __len__(self):
+        return len(self._response) // 2
+
+    def __iter__(self):
+        return islice(self._response, 0, None, 2)
+
+    def __contains__(self, key):
+        if self._index is None:
+            self._build_index()
+        return key in self._index
+
+    def __getitem__(self, key):
+        if self._index is None:
+            self._build_index()
+        value = self._response[self._index[key]]
+        if self._convert is not None:
+            value = self._convert(value)
+        return value
+
+    def _build_index(self):
+        response = self._response
+        self._index = dict(izip(islice(response, 0, None, 2),
+                                xrange(1, len(response), 2)))
+
+    def keys(self):
+        return self._response[0::2]
+
+    def values(self):
+        values = self._response[1::2]
+        if self._convert is not None:
+            values = [self._convert(v) for v in values]
+        return values
+
+    def items(self):
+        return list(izip(self.keys(), self.values()))
+
+    def __repr__(self):
+        return '{%s}' % ', '.join('%r: %r' % (k, v) for k, v in self.items())
+
 
 class SortedDict(dict):
     """
@@ -1 +1,22 @@
 #coding=utf-8
+import socket
+from ssdb.fakeserver import FakeServer
+
+_server = None
+
+
+def setup_package():
+    """
+    The tests expect an SSDB server on 127.0.0.1:8888, start a fake one
+    there when no server is running
+    """
+    global _server
+    try:
+        socket.create_connection(('127.0.0.1', 8888), 0.5).close()
+    except socket.error:
+        _server = FakeServer(port=8888).start()
+
+
+def teardown_package():
+    if _server is not None:
+        _server.stop()
@@ -0,0 +1,108 @@
+#coding=utf-8
+import json
+import os
+import tempfile
+from nose.tools import assert_equals, assert_true, raises
+from ssdb.analyzer import KeyspaceAnalyzer, KeyspaceReport, bucket, main
+from ssdb.fakeserver import FakeServer
+
+
+class TestAnalyzer(object):
+
+    def setUp(self):
+        self.server = FakeServer().start()
+        self.client = self.server.client()
+        self.client.multi_set(**dict(('user:%d' % i, 'x' * i)
+                                     for i in range(30)))
+        self.client.set('config', 'x' * 1000)
+        for i in range(10):
+            self.client.multi_hset('session:%d' % i,
+                                   **dict(('f%d' % j, '1')
+                                          for j in range(i * 10 + 1)))
+        self.client.multi_zset('board:big', **dict(('m%d' % j, j)
+                                                   for j in range(500)))
+        self.client.qpush_back('jobs', *range(7))
+        print('set UP')
+
+    def tearDown(self):
+        self.server.stop()
+        print('tear down')
+
+    def test_bucket(self):
+        assert_equals([bucket(size) for size in (0, 1, 2, 3, 4, 1023, 1024)],
+                      [0, 1, 2, 2, 3, 10, 11])
+
+    def test_report(self):
+        report = KeyspaceReport(top=2, depth=2)
+        for name, size in (('a:b:c', 5), ('a:b:d', 3), ('a:x', 9),
+                           ('plain', 1)):
+            report.add('hash', name, size)
+        assert_equals(sorted(report.prefixes),
+                      [('hash', ''), ('hash', 'a:b:')])
+        assert_equals(report.prefixes['hash', 'a:b:'], [2, 8, {2: 1, 3: 1}])
+        assert_equals(report.top['hash'], [(9, 'a:x'), (5, 'a:b:c')])
+        assert_equals(report.totals()['hash'], (4, 18))
+
+    def test_analyze(self):
+        streamed = []
+        analyzer = KeyspaceAnalyzer(self.client, page_size=4, workers=3,
+                                    top=3)
+        report = analyzer.analyze(lambda *item: streamed.append(item))
+        assert_equals(len(streamed), 31 + 10 + 1 + 1)
+        totals = report.totals()
+        assert_equals(totals['kv'], (31, sum(range(30)) + 1000))
+        assert_equals(totals['hash'], (10, sum(i * 10 + 1 for i in range(10))))
+        assert_equals(report.top['kv'][0], (1000, 'config'))
+        assert_equals(report.top['hash'], [(91, 'session:9'),
+                                           (81, 'session:8'),
+                                           (71, 'session:7')])
+        assert_equals(report.top['zset'], [(500, 'board:big')])
+        assert_equals(report.top['queue'], [(7, 'jobs')])
+        assert_true('session:' in report.format())
+        # one batch of sizes per page of names
+        assert_equals(self.server.commands['hsize'], 10)
+        assert_equals(self.server.commands['hlist'], 3)
+
+    def test_prefix_sample(self):
+        analyzer = KeyspaceAnalyzer(self.client, prefix='user:',
+                                    types=['kv'], sample=0.5, seed=3)
+        sizes = list(analyzer.iter_sizes())
+        assert_true(0 < len(sizes) < 30)
+        assert_true(all(name.startswith('user:') for _, name, _ in sizes))
+
+    def test_prefix_bounds(self):
+        for name in (b'pr', b'pre', b'pre\xff', b'pre\xff\x01', b'prf'):
+            self.client.set(name, 'v')
+            self.client.hset(name, 'k', 'v')
+        for type in ('kv', 'hash'):
+            analyzer = KeyspaceAnalyzer(self.client, prefix='pre',
+                                        types=[type], page_size=2)
+            assert_equals(sorted(name for _, name, _ in
+                                 analyzer.iter_sizes()),
+                          [b'pre', b'pre\xff', b'pre\xff\x01'])
+
+    def test_rate(self):
+        analyzer = KeyspaceAnalyzer(self.client, types=['hash'], page_size=5,
+                                    rate=100)
+        slept = []
+        analyzer._sleep = slept.append
+        analyzer._time = lambda: 0.0
+        analyzer.analyze()
+        # 3 hlist and 10 hsize at 100 commands per second
+        assert_true(abs(analyzer._next_time - 0.13) < 1e-9)
+
+    @raises(ValueError)
+    def test_bad_sample(self):
+        KeyspaceAnalyzer(self.client, sample=2)
+
+    def test_main(self):
+        fd, path = tempfile.mkstemp(suffix='.jsonl')
+        os.close(fd)
+        try:
+            assert_equals(main(['-p', str(self.server.port), '-t', 'queue',
+                                '-o', path, '--json']), 0)
+            with open(path) as f:
+                lines = [json.loads(line) for line in f]
+        finally:
+            os.remove(path)
+        assert_equals(lines, [{'type': 'queue', 'name': 'jobs', 'size': 7}])
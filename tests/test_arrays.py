@@ -0,0 +1,73 @@
+#coding=utf-8
+from nose.tools import assert_equals, assert_true, raises
+from nose.plugins.skip import SkipTest
+import ssdb
+from ssdb.client import (list_to_array, parse_scores, parse_score_dict,
+                         parse_value_dict)
+
+try:
+    import numpy
+    from ssdb.codecs import NumpyCodec
+except ImportError:
+    numpy = None
+
+
+class TestArrays(object):
+
+    def setUp(self):
+        if numpy is None:
+            raise SkipTest('numpy is not installed')
+        print('set UP')
+
+    def tearDown(self):
+        print('tear down')
+
+    def test_list_to_array(self):
+        keys, scores = list_to_array(['a', '-3', 'b', '0', 'c', '42'], 'int64')
+        assert_equals(keys, ['a', 'b', 'c'])
+        assert_equals(scores.dtype, numpy.int64)
+        assert_equals(scores.tolist(), [-3, 0, 42])
+
+    def test_list_to_array_empty(self):
+        keys, scores = list_to_array([], 'int64')
+        assert_equals(keys, [])
+        assert_equals(scores.dtype, numpy.int64)
+        assert_equals(len(scores), 0)
+
+    def test_parse_scores(self):
+        response = ['a', '1', 'b', '2']
+        assert_equals(list(parse_scores(response).items()),
+                      [('a', 1), ('b', 2)])
+        keys, scores = parse_scores(response, dtype='int64')
+        assert_equals(scores.tolist(), [1, 2])
+        assert_equals(parse_score_dict(response), {'a': 1, 'b': 2})
+
+    def test_parse_value_dict_dtype(self):
+        keys, values = parse_value_dict(['a', '1.5', 'b', '2'],
+                                        dtype='float64')
+        assert_equals(keys, ['a', 'b'])
+        assert_equals(values.tolist(), [1.5, 2.0])
+
+    def test_numpy_codec(self):
+        codec = NumpyCodec()
+        value = numpy.arange(12, dtype='<i4').reshape(3, 4)
+        decoded = codec.decode(codec.encode(value))
+        assert_equals(decoded.dtype, value.dtype)
+        assert_equals(decoded.shape, (3, 4))
+        assert_true((decoded == value).all())
+
+    def test_numpy_codec_empty(self):
+        codec = NumpyCodec()
+        decoded = codec.decode(codec.encode(numpy.zeros((0, 2), 'float32')))
+        assert_equals(decoded.shape, (0, 2))
+        assert_equals(decoded.dtype, numpy.float32)
+
+    @raises(ssdb.DataError)
+    def test_numpy_codec_truncated(self):
+        codec = NumpyCodec()
+        encoded = codec.encode(numpy.arange(4, dtype='<i4'))
+        codec.decode(encoded[:-16])
+
+    @raises(ssdb.DataError)
+    def test_numpy_codec_objects(self):
+        NumpyCodec().encode(numpy.array([{}, []], dtype=object))
@@ -0,0 +1,67 @@
+#coding=utf-8
+import json
+import os
+import tempfile
+from nose.tools import assert_equals, assert_true, assert_false
+from ssdb import benchmarks
+from ssdb.fakeserver import FakeServer
+
+
+class TestBenchmarks(object):
+
+    def setUp(self):
+        self.server = FakeServer().start()
+        self.client = self.server.client()
+        print('set UP')
+
+    def tearDown(self):
+        self.server.stop()
+        print('tear down')
+
+    def test_canned_parser(self):
+        parser = benchmarks.canned_parser([b'a', b'bc'])
+        for _ in range(3):
+            assert_equals(parser.read_response(), [b'ok', b'a', b'bc'])
+
+    def test_run(self):
+        results = benchmarks.run(client=self.client, min_time=0.001,
+                                 repeat=1)
+        assert_equals(list(results['results']), list(benchmarks.BENCHMARKS))
+        for result in results['results'].values():
+            assert_true(result['ops_per_sec'] > 0)
+        # the benchmark data is removed
+        assert_equals(self.server.store.execute([b'dbsize']), [b'ok', b'0'])
+
+    def test_micro_only(self):
+        results = benchmarks.run(['pack_command', 'set'], client=None,
+                                 min_time=0.001, repeat=1)
+        assert_equals(list(results['results']), ['pack_command'])
+
+    def test_compare(self):
+        results = {'results': {'a': {'ops_per_sec': 80.0},
+                               'b': {'ops_per_sec': 95.0},
+                               'c': {'ops_per_sec': 1.0}}}
+        baseline = {'results': {'a': {'ops_per_sec': 100.0},
+                                'b': {'ops_per_sec': 100.0}}}
+        rows = benchmarks.compare(results, baseline, threshold=0.1)
+        assert_equals(sorted(rows), [('a', 100.0, 80.0, 0.8, True),
+                                     ('b', 100.0, 95.0, 0.95, False)])
+
+    def test_main(self):
+        fd, path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        try:
+            argv = ['-p', str(self.server.port), '--min-time', '0.001',
+                    '--repeat', '1', '--json', path, 'get', 'parse_status']
+            assert_equals(benchmarks.main(argv), 0)
+            with open(path) as f:
+                saved = json.load(f)
+            assert_equals(sorted(saved['results']), ['get', 'parse_status'])
+            saved['results']['get']['ops_per_sec'] *= 1000
+            with open(path, 'w') as f:
+                json.dump(saved, f)
+            assert_equals(benchmarks.main(argv[:-4] + ['--compare', path,
+                                                       'get']), 1)
+        finally:
+            os.remove(path)
+        assert_false(self.client.exists(benchmarks.PREFIX + 'key'))
@@ -0,0 +1,189 @@
+#coding=utf-8
+from nose.tools import assert_equals, assert_true, assert_false, raises
+from ssdb import bitmap
+from ssdb.bitmap import BitArray, Bitmap, bitop
+from ssdb.exceptions import DataError
+
+
+class BitBatch(object):
+
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, command):
+        return lambda *args: self.commands.append((command, args))
+
+    def execute(self):
+        self.client.round_trips += 1
+        return [getattr(self.client, command)(*args)
+                for command, args in self.commands]
+
+
+class BitClient(object):
+    "String values with the bit numbering of SSDB"
+
+    def __init__(self):
+        self.data = {}
+        self.round_trips = 0
+
+    def batch(self):
+        return BitBatch(self)
+
+    def execute_command(self, command, *args):
+        self.round_trips += 1
+        if command == 'get':
+            return self.data.get(args[0])
+        if command == 'set':
+            self.data[args[0]] = bytes(args[1])
+            return True
+        if command == 'multi_get':
+            return dict((name, self.data[name]) for name in args
+                        if name in self.data)
+        raise NotImplementedError(command)
+
+    def getbit(self, name, offset):
+        value = bytearray(self.data.get(name, b''))
+        if offset >> 3 >= len(value):
+            return False
+        return bool(value[offset >> 3] & (1 << (offset & 7)))
+
+    def setbit(self, name, offset, val):
+        value = bytearray(self.data.get(name, b''))
+        if offset >> 3 >= len(value):
+            value.extend(bytearray(1 + (offset >> 3) - len(value)))
+        previous = bool(value[offset >> 3] & (1 << (offset & 7)))
+        if val:
+            value[offset >> 3] |= 1 << (offset & 7)
+        else:
+            value[offset >> 3] &= ~(1 << (offset & 7)) & 0xff
+        self.data[name] = bytes(value)
+        return previous
+
+    def substr(self, name, start, size):
+        return self.data.get(name, b'')[start:start + size]
+
+    def countbit(self, name):
+        return sum(bin(byte).count('1')
+                   for byte in bytearray(self.data.get(name, b'')))
+
+
+class TestBitmap(object):
+
+    def setUp(self):
+        self.client = BitClient()
+        print('set UP')
+
+    def tearDown(self):
+        bitmap.numpy = self.numpy
+        print('tear down')
+
+    numpy = bitmap.numpy
+
+    def test_setbits_getbits(self):
+        bm = Bitmap(self.client, 'active')
+        assert_equals(bm.setbits([0, 9, 100]), [False, False, False])
+        assert_equals(self.client.round_trips, 1)
+        assert_equals(bm.setbits([9, 10]), [True, False])
+        assert_equals(bm.getbits([0, 1, 9, 10, 100, 5000]),
+                      [True, False, True, True, True, False])
+        assert_equals(bm.count(), 4)
+        assert_equals(bm.getbits([]), [])
+
+    def test_bit_numbering(self):
+        # SSDB: setbit 1 on '1' gives '3'
+        bits = BitArray(b'1')
+        bits[1] = 1
+        assert_equals(bits.tobytes(), b'3')
+        assert_true(bits[0])
+        assert_false(bits[2])
+        assert_false(bits[1000])
+
+    def test_fetch(self):
+        bm = Bitmap(self.client, 'active')
+        bm.setbits([3, 17, 1000])
+        bits = bm.fetch()
+        assert_equals(len(bits), 1008)
+        assert_equals(bits.count(), 3)
+        assert_equals(list(bits.positions()), [3, 17, 1000])
+        assert_equals(list(bm.fetch(2, 1).positions()), [1])
+        assert_equals(len(Bitmap(self.client, 'missing').fetch()), 0)
+
+    def test_find(self):
+        bits = BitArray()
+        for offset in (5, 6, 7, 8, 300):
+            bits[offset] = True
+        assert_equals(bits.find(), 5)
+        assert_equals(bits.find(1, 6), 6)
+        assert_equals(bits.find(1, 9), 300)
+        assert_equals(bits.find(1, 301), -1)
+        assert_equals(bits.find(0), 0)
+        assert_equals(bits.find(0, 5), 9)
+        assert_equals(BitArray(b'\xff\xff').find(0), 16)
+
+    def test_bit_operations(self):
+        a, b = BitArray(b'\x0f\x01'), BitArray(b'\x3c')
+        assert_equals((a & b).tobytes(), b'\x0c\x00')
+        assert_equals((a | b).tobytes(), b'\x3f\x01')
+        assert_equals((a ^ b).tobytes(), b'\x33\x01')
+
+    def test_store_setbits(self):
+        bm = Bitmap(self.client, 'active')
+        bm.setbits(range(0, 80, 2))
+        bits = bm.fetch()
+        bits[0] = False
+        bits[1] = True
+        bits[200] = True
+        # somebody else flips a bit meanwhile
+        self.client.setbit('active', 79, 1)
+        self.client.round_trips = 0
+        assert_equals(bm.store(bits), 3)
+        assert_equals(self.client.round_trips, 1)
+        assert_equals(bm.fetch().find(), 1)
+        assert_true(self.client.getbit('active', 79))
+        assert_true(self.client.getbit('active', 200))
+        assert_equals(bm.store(bits), 0)
+
+    def test_store_set(self):
+        bm = Bitmap(self.client, 'active')
+        bits = BitArray()
+        for offset in range(64):
+            bits[offset] = True
+        assert_equals(bm.store(bits), 64)
+        assert_equals(self.client.data['active'], b'\xff' * 8)
+
+    def test_store_slice(self):
+        bm = Bitmap(self.client, 'active')
+        bm.setbits([0, 17, 40])
+        bits = bm.fetch(2, 2)
+        assert_equals(bits.offset, 2)
+        assert_equals(list(bits.positions()), [1])
+        bits[1] = False
+        bits[9] = True
+        assert_equals(bm.store(bits), 2)
+        assert_equals(list(bm.fetch().positions()), [0, 25, 40])
+        # too many changes for setbit still don't replace the whole value
+        for offset in range(16):
+            bits[offset] = True
+        assert_equals(bm.store(bits, max_setbits=1), 15)
+        assert_equals(list(bm.fetch().positions()),
+                      [0] + list(range(16, 32)) + [40])
+
+    def test_bitop(self):
+        self.client.data.update(a=b'\x0f\x01', b=b'\x3c')
+        assert_equals(bitop(self.client, 'or', 'c', 'a', 'b', 'missing'), 2)
+        assert_equals(self.client.data['c'], b'\x3f\x01')
+        bitop(self.client, 'and', 'c', 'a', 'b')
+        assert_equals(self.client.data['c'], b'\x0c\x00')
+
+    @raises(DataError)
+    def test_unknown_bitop(self):
+        bitop(self.client, 'nand', 'c', 'a')
+
+    def test_without_numpy(self):
+        bitmap.numpy = None
+        self.test_fetch()
+        self.test_bit_operations()
+        bits = BitArray(b'\x81' * 100)
+        assert_equals(bits.count(), 200)
+        assert_equals(list(bits.positions())[:3], [0, 7, 8])
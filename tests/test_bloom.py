@@ -0,0 +1,120 @@
+#coding=utf-8
+from nose.tools import assert_equals, assert_true, assert_false, raises
+from ssdb.bloom import BloomFilter, ScalableBloomFilter
+
+
+class BloomBatch(object):
+
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, command):
+        return lambda *args: self.commands.append((command, args))
+
+    def execute(self):
+        self.client.round_trips += 1
+        return [getattr(self.client, command)(*args)
+                for command, args in self.commands]
+
+
+class BloomClient(object):
+    "Bitmaps as sets of offsets, and hashes of counters"
+
+    def __init__(self):
+        self.bits = {}
+        self.hashes = {}
+        self.round_trips = 0
+
+    def batch(self):
+        return BloomBatch(self)
+
+    def execute_command(self, command, *args):
+        assert command == 'hgetall'
+        return dict(self.hashes.get(args[0], {}))
+
+    def getbit(self, name, offset):
+        return offset in self.bits.get(name, ())
+
+    def setbit(self, name, offset, val):
+        bits = self.bits.setdefault(name, set())
+        previous = offset in bits
+        bits.add(offset)
+        return previous
+
+    def hincr(self, name, key, amount=1):
+        fields = self.hashes.setdefault(name, {})
+        fields[key] = str(int(fields.get(key, 0)) + amount)
+        return int(fields[key])
+
+
+class TestBloom(object):
+
+    def setUp(self):
+        self.client = BloomClient()
+        print('set UP')
+
+    def tearDown(self):
+        print('tear down')
+
+    def test_sizing(self):
+        bloom = BloomFilter(self.client, 'seen', capacity=1000,
+                            error_rate=0.01)
+        assert_equals(bloom.num_bits, 9586)
+        assert_equals(bloom.num_hashes, 7)
+        positions = bloom.positions('event')
+        assert_equals(positions, bloom.positions(u'event'))
+        assert_true(all(0 <= p < bloom.num_bits for p in positions))
+
+    def test_add_contains(self):
+        bloom = BloomFilter(self.client, 'seen', capacity=1000)
+        assert_true(bloom.add('a'))
+        assert_false(bloom.add('a'))
+        assert_true('a' in bloom)
+        assert_false('b' in bloom)
+        assert_equals(self.client.round_trips, 4)
+
+    def test_many(self):
+        bloom = BloomFilter(self.client, 'seen', capacity=1000,
+                            batch_size=100)
+        items = ['event-%d' % i for i in range(1000)]
+        assert_true(all(bloom.add_many(items)))
+        assert_equals(self.client.round_trips, 10)
+        assert_true(all(bloom.contains_many(items)))
+        others = ['other-%d' % i for i in range(1000)]
+        false_positives = sum(bloom.contains_many(others))
+        assert_true(false_positives < 10)
+
+    @raises(ValueError)
+    def test_invalid_error_rate(self):
+        BloomFilter(self.client, 'seen', capacity=10, error_rate=1)
+
+    def test_scalable(self):
+        bloom = ScalableBloomFilter(self.client, 'seen', initial_capacity=10,
+                                    error_rate=0.01)
+        items = ['event-%d' % i for i in range(50)]
+        assert_equals(bloom.add_many(items + items[:5]),
+                      [True] * 50 + [False] * 5)
+        assert_equals(len(bloom), 50)
+        # 10 + 20 + 40 items
+        assert_equals(len(bloom.filters), 3)
+        assert_equals(self.client.hashes['seen'],
+                      {'0': '10', '1': '20', '2': '20'})
+        assert_true(all(bloom.contains_many(items)))
+        assert_false(bloom.add('event-3'))
+        assert_true(bloom.add('event-50'))
+
+    def test_scalable_duplicates_in_batch(self):
+        bloom = ScalableBloomFilter(self.client, 'seen')
+        assert_equals(bloom.add_many(['a', 'b', 'a']), [True, True, False])
+        assert_equals(len(bloom), 2)
+
+    def test_scalable_shared(self):
+        first = ScalableBloomFilter(self.client, 'seen', initial_capacity=5)
+        second = ScalableBloomFilter(self.client, 'seen', initial_capacity=5)
+        first.add_many(['event-%d' % i for i in range(10)])
+        # the second client learns about the new filter in the same lookup
+        assert_true('event-9' in second)
+        assert_equals(len(second.filters), 2)
+        third = ScalableBloomFilter(self.client, 'seen', initial_capacity=5)
+        assert_equals(len(third), 10)
@@ -0,0 +1,147 @@
+#coding=utf-8
+import json
+import os
+import shutil
+import sys
+import tempfile
+from nose.tools import assert_equals, assert_true, raises
+import ssdb
+from ssdb.bulkload import BulkLoader, chunks, main, read_records
+from ssdb.fakeserver import FakeServer
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+def run_main(argv):
+    "Return the exit status of ``main(argv)`` and what it wrote to stderr"
+    stderr, sys.stderr = sys.stderr, StringIO()
+    try:
+        return main(argv), sys.stderr.getvalue()
+    finally:
+        sys.stderr = stderr
+
+
+class TestBulkLoad(object):
+
+    def setUp(self):
+        self.server = FakeServer().start()
+        self.client = self.server.client()
+        self.dir = tempfile.mkdtemp()
+        print('set UP')
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.dir)
+        print('tear down')
+
+    def write(self, name, content):
+        path = os.path.join(self.dir, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def loader(self, **kwargs):
+        kwargs.setdefault('port', self.server.port)
+        kwargs.setdefault('processes', 0)
+        return BulkLoader(**kwargs)
+
+    def test_read_records(self):
+        path = self.write('a.jsonl', '{"key": "a", "value": 1}\n\n'
+                                     '{"key": "b", "value": {"x": 2}}\n')
+        assert_equals(list(read_records(path)),
+                      [{'key': 'a', 'value': 1},
+                       {'key': 'b', 'value': {'x': 2}}])
+        path = self.write('a.tsv', 'key\tvalue\na\t1\n')
+        assert_equals(list(read_records(path)), [{'key': 'a', 'value': '1'}])
+
+    @raises(ValueError)
+    def test_unknown_format(self):
+        list(read_records(self.write('a.xml', '')))
+
+    def test_chunks(self):
+        assert_equals(list(chunks(range(7), 3, skip=set([1]))),
+                      [(0, [0, 1, 2]), (2, [6])])
+
+    def test_kv(self):
+        path = self.write('a.jsonl', ''.join(
+            json.dumps({'id': i, 'doc': {'n': i}}) + '\n' for i in range(25)))
+        stats = self.loader(key='id', value='doc', chunk_size=10,
+                            batch_size=4).load_file(path)
+        assert_equals((stats['records'], stats['chunks']), (25, 3))
+        assert_equals(self.client.get('7'), '{"n": 7}')
+        # chunks of 10 records written as multi_set of up to 4 keys
+        assert_equals(self.server.commands['multi_set'], 3 + 3 + 2)
+
+    def test_hash_processes(self):
+        path = self.write('a.csv', 'user,email\n' + ''.join(
+            'u%d,u%d@example.com\n' % (i, i) for i in range(100)))
+        stats = self.loader(kind='hash', name='users', key='user',
+                            value='email', processes=2,
+                            chunk_size=7).load_file(path)
+        assert_equals(stats['records'], 100)
+        assert_equals(self.client.hsize('users'), 100)
+        assert_equals(self.client.hget('users', 'u42'), 'u42@example.com')
+
+    def test_zset_and_queue(self):
+        records = [{'board': 'b%d' % (i % 2), 'player': 'p%d' % i,
+                    'points': str(i)} for i in range(10)]
+        self.loader(kind='zset', name_field='board', key='player',
+                    score='points').load(records)
+        assert_equals(self.client.zget('b1', 'p9'), 9)
+        assert_equals(self.client.zsize('b0'), 5)
+        self.loader(kind='queue', name='q', value='player',
+                    batch_size=3).load(records)
+        assert_equals(self.client.qsize('q'), 10)
+        assert_equals(self.client.qfront('q'), 'p0')
+
+    def test_any_key(self):
+        records = [{'key': key, 'value': 'v'}
+                   for key in (u'name', u'self', u'kvs', u'caf\xe9')]
+        self.loader(kind='hash', name='h').load(records)
+        self.loader().load(records)
+        assert_equals(sorted(self.client.hkeys('h', '', '', 10)),
+                      ['caf\xc3\xa9', 'kvs', 'name', 'self'])
+        assert_equals(self.client.get('self'), 'v')
+
+    def test_resume(self):
+        checkpoint = os.path.join(self.dir, 'load.checkpoint')
+
+        def failing():
+            for i in range(25):
+                if i == 17:
+                    raise ValueError('truncated file')
+                yield {'key': 'k%02d' % i, 'value': 'v'}
+        loader = self.loader(chunk_size=5, checkpoint=checkpoint)
+        try:
+            loader.load(failing())
+        except ValueError:
+            pass
+        with open(checkpoint) as f:
+            assert_equals(json.load(f), {'chunk_size': 5, 'watermark': 3,
+                                         'done': [], 'records': 15})
+        records = [{'key': 'k%02d' % i, 'value': 'v'} for i in range(25)]
+        stats = loader.load(records)
+        assert_equals(stats['records'], 10)
+        assert_equals(len(self.client.keys('', '', 100)), 25)
+        assert_equals(self.server.commands['multi_set'], 5)
+
+    @raises(ssdb.DataError)
+    def test_write_error(self):
+        self.server.inject('error', command='multi_set')
+        self.loader().load([{'key': 'a', 'value': 'b'}])
+
+    @raises(ValueError)
+    def test_name_required(self):
+        self.loader(kind='hash')
+
+    def test_main(self):
+        path = self.write('a.csv', 'key,value\na,1\nb,2\n')
+        assert_equals(run_main([path, '-p', str(self.server.port), '-q',
+                                '--processes', '0']), (0, ''))
+        assert_equals(self.client.get('b'), '2')
+        status, error = run_main([path + '.xml', '-q'])
+        assert_equals(status, 1)
+        assert_true('Cannot guess the format' in error, error)
+        assert_true(os.path.exists(path))
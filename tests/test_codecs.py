@@ -0,0 +1,185 @@
+#coding=utf-8
+import array
+from nose.tools import (assert_equals, assert_true, assert_false,
+                        assert_is_none, assert_is_instance, raises)
+import ssdb
+from ssdb.codecs import (JSONCodec, PickleCodec, StructCodec, ArrayCodec,
+                         RawCodec, CompressedCodec, LazyDecodedDict,
+                         LazyDecodedList, get_codec, register_codec,
+                         register_compressor)
+from ssdb.fakeserver import FakeServer
+from ssdb.client import (SSDB, parse_value, parse_value_dict,
+                         parse_value_ordereddict, parse_value_list)
+
+
+class CountingCodec(JSONCodec):
+
+    def __init__(self, lazy=True):
+        super(CountingCodec, self).__init__(lazy=lazy)
+        self.decoded = 0
+
+    def decode(self, value):
+        self.decoded += 1
+        return super(CountingCodec, self).decode(value)
+
+
+class TestCodecs(object):
+
+    def setUp(self):
+        print('set UP')
+
+    def tearDown(self):
+        print('tear down')
+
+    def test_json(self):
+        codec = JSONCodec()
+        encoded = codec.encode({'a': [1, 2.5, None]})
+        assert_equals(encoded, b'{"a":[1,2.5,null]}')
+        assert_equals(codec.decode(encoded), {'a': [1, 2.5, None]})
+
+    def test_pickle(self):
+        codec = PickleCodec()
+        value = {'a': (1, 2), 'b': set([3])}
+        assert_equals(codec.decode(codec.encode(value)), value)
+
+    def test_struct(self):
+        codec = StructCodec('<qd')
+        assert_equals(codec.decode(codec.encode((42, 0.5))), (42, 0.5))
+        codec = StructCodec('<q')
+        assert_equals(len(codec.encode(7)), 8)
+        assert_equals(codec.decode(codec.encode(7)), 7)
+
+    def test_array(self):
+        codec = ArrayCodec('l')
+        encoded = codec.encode([1, 2, 3])
+        decoded = codec.decode(encoded)
+        assert_is_instance(decoded, array.array)
+        assert_equals(list(decoded), [1, 2, 3])
+
+    def test_registry(self):
+        assert_is_none(get_codec(None))
+        assert_is_instance(get_codec('json'), JSONCodec)
+        assert_equals(get_codec('struct', fmt='<i').fmt, '<i')
+        assert_equals(get_codec('struct').fmt, '<q')
+        codec = RawCodec()
+        assert_true(get_codec(codec) is codec)
+        register_codec('floats', lambda: ArrayCodec('d'))
+        assert_equals(get_codec('floats').typecode, 'd')
+
+    @raises(ssdb.DataError)
+    def test_unknown_codec(self):
+        get_codec('not_a_codec')
+
+    def test_client_codec(self):
+        client = SSDB(codec='json')
+        assert_is_instance(client.codec, JSONCodec)
+        assert_equals(client.encode_value([1]), b'[1]')
+        assert_true(client.batch().codec is client.codec)
+        assert_is_none(SSDB().encode_value(None))
+
+    def test_round_trip(self):
+        server = FakeServer().start()
+        try:
+            client = server.client(codec='json')
+            doc = {'name': 'ssdb', 'tags': [1, 2]}
+            assert_true(client.set('doc', doc))
+            assert_equals(client.get('doc'), doc)
+            client.multi_set(a=[1], b={'c': None})
+            assert_equals(dict(client.multi_get('a', 'b', 'missing')),
+                          {'a': [1], 'b': {'c': None}})
+            client.hset('h', 'k', 2.5)
+            assert_equals(dict(client.hgetall('h')), {'k': 2.5})
+            client.qpush_back('q', {'i': 1}, {'i': 2})
+            assert_equals(list(client.qrange('q', 0, 10)),
+                          [{'i': 1}, {'i': 2}])
+            # the raw value on the server is the JSON document
+            assert_equals(server.client().get('a'), '[1]')
+            counters = server.client(codec='struct')
+            counters.set('n', 42)
+            assert_equals(counters.get('n'), 42)
+        finally:
+            server.stop()
+
+    def test_parse_value(self):
+        codec = JSONCodec()
+        assert_equals(parse_value(['[1]'], codec=codec), [1])
+        assert_equals(parse_value(['[1]']), '[1]')
+
+    def test_lazy_dict(self):
+        codec = CountingCodec()
+        result = parse_value_dict(['a', '1', 'b', '[2]'], codec=codec)
+        assert_is_instance(result, LazyDecodedDict)
+        assert_equals(codec.decoded, 0)
+        assert_equals(result['b'], [2])
+        assert_equals(result['b'], [2])
+        assert_equals(codec.decoded, 1)
+        assert_true('a' in result)
+        assert_false('c' in result)
+        assert_equals(dict(result), {'a': 1, 'b': [2]})
+
+    def test_lazy_ordereddict(self):
+        result = parse_value_ordereddict(['b', '1', 'a', '2', 'c', '3'],
+                                         codec=JSONCodec())
+        assert_equals(list(result), ['b', 'a', 'c'])
+        assert_equals(list(result.values()), [1, 2, 3])
+
+    def test_eager_dict(self):
+        codec = CountingCodec(lazy=False)
+        result = parse_value_dict(['a', '1', 'b', '2'], codec=codec)
+        assert_is_instance(result, dict)
+        assert_equals(codec.decoded, 2)
+        assert_equals(result, {'a': 1, 'b': 2})
+
+    def test_lazy_list(self):
+        codec = CountingCodec()
+        result = parse_value_list(['1', '2', '3'], codec=codec)
+        assert_is_instance(result, LazyDecodedList)
+        assert_equals(result[-1], 3)
+        assert_equals(codec.decoded, 1)
+        assert_equals(result[:2], [1, 2])
+        assert_equals(result, [1, 2, 3])
+        assert_equals(len(result), 3)
+
+    def test_compressed_threshold(self):
+        codec = CompressedCodec(threshold=64)
+        assert_equals(codec.encode('short'), b'short')
+        assert_equals(codec.decode(b'short'), b'short')
+        value = b'x' * 1000
+        encoded = codec.encode(value)
+        assert_true(encoded.startswith(CompressedCodec.MAGIC + b'z'))
+        assert_true(len(encoded) < len(value))
+        assert_equals(codec.decode(encoded), value)
+
+    def test_compressed_json(self):
+        codec = CompressedCodec('json', threshold=16)
+        doc = {'items': list(range(100))}
+        encoded = codec.encode(doc)
+        assert_true(encoded.startswith(CompressedCodec.MAGIC))
+        assert_equals(codec.decode(encoded), doc)
+        # uncompressed values written before are still readable
+        assert_equals(codec.decode(b'[1,2]'), [1, 2])
+
+    def test_compressed_mixed_compressors(self):
+        register_compressor('repeat', 'r', lambda v: v[:3],
+                            lambda v: v * 10)
+        writer = CompressedCodec(compressor='repeat', threshold=0)
+        reader = CompressedCodec(threshold=0)
+        encoded = writer.encode(b'abc' * 10)
+        assert_equals(encoded, CompressedCodec.MAGIC + b'rabc')
+        assert_equals(reader.decode(encoded), b'abc' * 10)
+
+    def test_compressed_magic_values(self):
+        codec = CompressedCodec(StructCodec('<i'))
+        encoded = codec.encode(4413952)
+        assert_equals(encoded, CompressedCodec.MAGIC + b'\x00\x00ZC\x00')
+        assert_equals(codec.decode(encoded), 4413952)
+        raw = CompressedCodec()
+        assert_equals(raw.decode(raw.encode(b'\x00ZCz')), b'\x00ZCz')
+
+    @raises(ssdb.DataError)
+    def test_reserved_compressor_id(self):
+        register_compressor('none', '\x00', None, None)
+
+    @raises(ssdb.DataError)
+    def test_unknown_compressor(self):
+        CompressedCodec(compressor='not_a_compressor')
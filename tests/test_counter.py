@@ -0,0 +1,130 @@
+#coding=utf-8
+import gc
+import time
+import weakref
+from nose.tools import assert_equals, assert_true, raises
+from ssdb import SSDB
+from ssdb.counter import CounterBuffer
+from ssdb.exceptions import ConnectionError, TimeoutError
+from ssdb.fakeserver import FakeServer
+
+
+class TestCounterBuffer(object):
+
+    def setUp(self):
+        self.server = FakeServer().start()
+        self.client = self.server.client()
+        print('set UP')
+
+    def tearDown(self):
+        self.server.stop()
+        print('tear down')
+
+    def test_aggregate(self):
+        counters = CounterBuffer(self.client, interval=None,
+                                 flush_on_exit=False)
+        counters.incr('a')
+        counters.incr('a', 4)
+        counters.decr('b', 2)
+        counters.hincr('h', 'k', 3)
+        counters.hincr('h', 'k')
+        counters.zincr('z', 'm', 10)
+        counters.zdecr('z', 'm', 10)
+        assert_equals(counters.pending('a'), 5)
+        assert_equals(counters.pending('h', 'k'), 4)
+        assert_equals(counters.flush(), 3)
+        assert_equals(self.server.commands['incr'], 2)
+        assert_equals(self.server.commands['hincr'], 1)
+        assert_equals(self.server.commands['zincr'], 0)
+        assert_equals(self.server.stats['round_trips'], 1)
+        assert_equals(int(self.client.get('a')), 5)
+        assert_equals(int(self.client.get('b')), -2)
+        assert_equals(int(self.client.hget('h', 'k')), 4)
+        assert_equals(len(counters), 0)
+        assert_equals(counters.flush(), 0)
+
+    def test_max_ops(self):
+        counters = CounterBuffer(self.client, interval=None, max_ops=3,
+                                 flush_on_exit=False)
+        counters.incr('a')
+        counters.incr('a')
+        assert_equals(self.server.commands['incr'], 0)
+        counters.incr('a')
+        assert_equals(self.server.commands['incr'], 1)
+        assert_equals(int(self.client.get('a')), 3)
+
+    def test_interval(self):
+        counters = CounterBuffer(self.client, interval=0.01,
+                                 flush_on_exit=False)
+        counters.incr('a')
+        time.sleep(0.2)
+        counters.close()
+        assert_equals(self.server.commands['incr'], 1)
+        assert_equals(int(self.client.get('a')), 1)
+
+    def test_collected(self):
+        counters = CounterBuffer(self.client, interval=0.01)
+        thread, ref = counters._thread, weakref.ref(counters)
+        del counters
+        gc.collect()
+        assert_true(ref() is None)
+        thread.join(1)
+        assert_true(not thread.is_alive())
+
+    def test_context_manager(self):
+        with CounterBuffer(self.client, interval=None,
+                           flush_on_exit=False) as counters:
+            counters.hincr('h', 'k', 2)
+        assert_equals(int(self.client.hget('h', 'k')), 2)
+
+    def test_unreachable_is_retried(self):
+        server = FakeServer().start()
+        port = server.port
+        server.stop()
+        counters = CounterBuffer(SSDB(port=port), interval=None,
+                                 flush_on_exit=False)
+        counters.incr('a', 2)
+        try:
+            counters.flush()
+        except ConnectionError:
+            pass
+        counters.incr('a', 1)
+        assert_equals(counters.pending('a'), 3)
+        counters.ssdb = self.client
+        assert_equals(counters.flush(), 1)
+        assert_equals(int(self.client.get('a')), 3)
+
+    def test_lost_reply_is_not_retried(self):
+        counters = CounterBuffer(self.server.client(socket_timeout=0.05),
+                                 interval=None, flush_on_exit=False)
+        counters.incr('a', 2)
+        self.server.inject('slow', command='incr', delay=0.2)
+        try:
+            counters.flush()
+        except TimeoutError:
+            pass
+        assert_equals(counters.pending('a'), 0)
+        time.sleep(0.3)
+        assert_equals(counters.flush(), 0)
+        assert_equals(int(self.client.get('a')), 2)
+
+    def test_dropped_reply_is_not_resent(self):
+        counters = CounterBuffer(self.client, interval=None,
+                                 flush_on_exit=False)
+        counters.incr('a', 2)
+        self.server.inject('disconnect', command='incr')
+        try:
+            counters.flush()
+        except ConnectionError:
+            pass
+        assert_equals(counters.pending('a'), 0)
+        assert_equals(self.server.commands['incr'], 1)
+        assert_equals(int(self.client.get('a')), 2)
+        counters.incr('a', 1)
+        assert_equals(counters.flush(), 1)
+        assert_equals(int(self.client.get('a')), 3)
+
+    @raises(ValueError)
+    def test_integer_amount(self):
+        CounterBuffer(self.client, interval=None,
+                      flush_on_exit=False).incr('a', 1.5)
@@ -0,0 +1,132 @@
+#coding=utf-8
+import os
+import shutil
+import sys
+import tempfile
+from nose.tools import assert_equals, assert_true, raises
+import ssdb
+from ssdb.dump import dump, main, part_path, read_dump, restore
+from ssdb.fakeserver import FakeServer
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+def run_main(argv):
+    "Return the exit status of ``main(argv)`` and what it wrote to stderr"
+    stderr, sys.stderr = sys.stderr, StringIO()
+    try:
+        return main(argv), sys.stderr.getvalue()
+    finally:
+        sys.stderr = stderr
+
+
+class TestDump(object):
+
+    def setUp(self):
+        self.source = FakeServer().start()
+        self.target = FakeServer().start()
+        self.client = self.source.client()
+        self.dir = tempfile.mkdtemp()
+        self.client.multi_set(**dict(('key%03d' % i, 'v%d' % i)
+                                     for i in range(25)))
+        self.client.set('bin', b'\xff\x00\xfe')
+        self.client.multi_hset('h1', **dict(('f%d' % i, 'x' * i)
+                                            for i in range(12)))
+        self.client.hset('h2', 'a', 'b')
+        self.client.multi_zset('z', **dict(('m%d' % i, i % 3 - 1)
+                                           for i in range(11)))
+        self.client.qpush_back('q', *['item%d' % i for i in range(7)])
+        print('set UP')
+
+    def tearDown(self):
+        self.source.stop()
+        self.target.stop()
+        shutil.rmtree(self.dir)
+        print('tear down')
+
+    def path(self, name):
+        return os.path.join(self.dir, name)
+
+    def dump_all(self):
+        execute = self.target.store.execute
+        return (execute([b'scan', b'', b'', b'1000']),
+                [execute([b'hgetall', name]) for name in (b'h1', b'h2')],
+                execute([b'zscan', b'z', b'', b'', b'', b'100']),
+                execute([b'qslice', b'q', b'0', b'-1']))
+
+    def check_round_trip(self, name, **kwargs):
+        stats = dump(self.client, self.path(name), page_size=4, **kwargs)
+        assert_equals(stats['items'], 26 + 13 + 11 + 7)
+        restored = restore(self.target.client(), stats['files'],
+                           batch_size=3)
+        assert_equals(restored['items'], stats['items'])
+        self.source, self.target = self.target, self.source
+        expected = self.dump_all()
+        self.source, self.target = self.target, self.source
+        assert_equals(self.dump_all(), expected)
+        return stats
+
+    def test_jsonl(self):
+        stats = self.check_round_trip('backup.jsonl')
+        # pages of 4 items: 7 of keys, 3 + 1 of hashes, 3 of zset, 2 of queue
+        assert_equals(stats['records'], 16)
+        records = list(read_dump(stats['files'][0]))
+        assert_equals(records[-1], ('queue', b'q', [b'item4', b'item5',
+                                                    b'item6']))
+        assert_true((b'bin', b'\xff\x00\xfe') in records[0][2])
+
+    def test_binary_gzip(self):
+        stats = self.check_round_trip('backup.dump.gz')
+        with open(stats['files'][0], 'rb') as f:
+            assert_equals(f.read(2), b'\x1f\x8b')
+
+    def test_partitions_bz2(self):
+        stats = self.check_round_trip('backup.jsonl', partitions=3,
+                                      compression='bz2')
+        assert_equals(stats['files'], [self.path('backup.part%d.jsonl' % i)
+                                       for i in range(3)])
+
+    def test_prefix_and_types(self):
+        stats = dump(self.client, self.path('keys.dump'), prefix='key01',
+                     types=['kv'])
+        assert_equals(stats['items'], 10)
+
+    def test_prefix_bounds(self):
+        for name in (b'pr', b'pre', b'pre\xff', b'pre\xff\x01', b'prf'):
+            self.client.set(name, 'v')
+            self.client.hset(name, 'k', 'v')
+        stats = dump(self.client, self.path('pre.dump'), prefix='pre',
+                     types=['kv', 'hash'], page_size=2)
+        records = list(read_dump(stats['files'][0]))
+        assert_equals([key for type, name, items in records
+                       for key, value in items if type == 'kv'],
+                      [b'pre', b'pre\xff', b'pre\xff\x01'])
+        assert_equals([name for type, name, items in records
+                       if type == 'hash'],
+                      [b'pre', b'pre\xff', b'pre\xff\x01'])
+
+    @raises(ssdb.DataError)
+    def test_truncated(self):
+        stats = dump(self.client, self.path('backup.dump'))
+        path = stats['files'][0]
+        with open(path, 'rb') as f:
+            data = f.read()
+        with open(path, 'wb') as f:
+            f.write(data[:-3])
+        list(read_dump(path))
+
+    def test_part_path(self):
+        assert_equals(part_path('/tmp/b.jsonl.gz', 2), '/tmp/b.part2.jsonl.gz')
+
+    def test_main(self):
+        path = self.path('cli.dump')
+        assert_equals(run_main(['dump', path, '-p', str(self.source.port),
+                                '-t', 'hash']), (0, ''))
+        assert_equals(run_main(['restore', path, '-p',
+                                str(self.target.port)]), (0, ''))
+        assert_equals(self.target.client().hget('h1', 'f3'), 'xxx')
+        status, error = run_main(['restore', path + '.missing'])
+        assert_equals(status, 1)
+        assert_true('No such file' in error, error)
@@ -0,0 +1,149 @@
+#coding=utf-8
+import threading
+import time
+from nose.tools import (assert_equals, assert_true, assert_is_none, raises)
+import ssdb
+from ssdb.exceptions import TimeoutError
+from ssdb.fakeserver import (FakeServer, FakeStore, parse_requests,
+                             pack_reply)
+
+
+class BrokenStore(FakeStore):
+
+    def cmd_get(self, name):
+        return len(None)
+
+
+class TestFakeServer(object):
+
+    def setUp(self):
+        self.server = FakeServer().start()
+        self.client = self.server.client(socket_timeout=1)
+        print('set UP')
+
+    def tearDown(self):
+        self.server.stop()
+        print('tear down')
+
+    def test_protocol(self):
+        buf = bytearray(pack_reply([b'set', b'a', b'1']) +
+                        pack_reply([b'get', b'a']) + b'3\nget\n')
+        assert_equals(parse_requests(buf), [[b'set', b'a', b'1'],
+                                            [b'get', b'a']])
+        assert_equals(bytes(buf), b'3\nget\n')
+
+    def test_kv(self):
+        assert_true(self.client.set('b', 'x'))
+        self.client.multi_set(a='1', c='3', d='4')
+        assert_equals(self.client.get('b'), 'x')
+        assert_is_none(self.client.get('z'))
+        assert_equals(self.client.keys('a', 'c', 10), ['b', 'c'])
+        assert_equals(list(self.client.rscan('', '', 2)), ['d', 'c'])
+        assert_equals(self.client.incr('a', 2), 3)
+        assert_equals(self.client.substr('b', 0, 1), 'x')
+
+    def test_expiry(self):
+        self.client.setx('a', '1', 10)
+        assert_equals(self.client.ttl('a'), 10)
+        self.server.store._time = lambda: time.time() + 11
+        assert_is_none(self.client.get('a'))
+        assert_equals(self.client.keys('', '', 10), [])
+
+    def test_hash_zset_queue(self):
+        self.client.multi_hset('h', b='2', a='1')
+        assert_equals(list(self.client.hgetall('h').items()),
+                      [('a', '1'), ('b', '2')])
+        self.client.multi_zset('z', a=3, b=1, c=2, d=2)
+        assert_equals(list(self.client.zscan('z', 'c', 2, '', 10)),
+                      ['d', 'a'])
+        assert_equals(list(self.client.zrrange('z', 0, 2)), ['a', 'd'])
+        assert_equals(self.client.zrank('z', 'c'), 1)
+        assert_equals(self.client.zsum('z', 2, 3), 7)
+        self.client.qpush_back('q', '1', '2', '3')
+        self.client.qpush_front('q', '0')
+        assert_equals(self.client.qslice('q', 1, -1), ['1', '2', '3'])
+        assert_equals(self.client.qpop_back('q', 2), ['3', '2'])
+        assert_equals(self.client.qlist('', '', 10), ['q'])
+
+    def test_pipeline_round_trips(self):
+        batch = self.client.batch()
+        for i in range(100):
+            batch.set('key%d' % i, i)
+        batch.execute()
+        assert_equals(self.server.stats['requests'], 100)
+        assert_true(self.server.stats['round_trips'] < 5)
+        assert_equals(self.server.commands['set'], 100)
+
+    def test_latency(self):
+        self.server.latency = 0.05
+        start = time.time()
+        self.client.get('a')
+        self.client.get('a')
+        assert_true(time.time() - start >= 0.1)
+
+    def test_bandwidth(self):
+        self.client.set('big', 'x' * 10000)
+        self.server.bandwidth = 100000
+        start = time.time()
+        assert_equals(len(self.client.get('big')), 10000)
+        assert_true(time.time() - start >= 0.09)
+
+    @raises(ssdb.DataError)
+    def test_error_fault(self):
+        self.server.inject('error', command='get')
+        self.client.set('a', '1')
+        self.client.get('a')
+
+    @raises(TimeoutError)
+    def test_slow_fault(self):
+        self.server.inject('slow', delay=1.5)
+        self.client.get('a')
+
+    def test_close_fault_retried(self):
+        self.server.inject('close')
+        assert_true(self.client.set('a', '1'))
+        assert_equals(self.server.stats['connections'], 2)
+
+    @raises(ssdb.ConnectionError)
+    def test_disconnect_fault(self):
+        self.client.set('a', '1' * 1000)
+        self.server.inject('disconnect', count=2)
+        self.client.get('a')
+
+    @raises(ssdb.DataError)
+    def test_unknown_fault(self):
+        self.server.inject('crash')
+
+    def test_flush(self):
+        self.client.set('a', '1')
+        self.server.store.flush()
+        assert_is_none(self.client.get('a'))
+
+    def test_arity(self):
+        execute = self.server.store.execute
+        assert_equals(execute([b'get']), [b'client_error',
+                                          b'wrong number of arguments'])
+        assert_equals(execute([b'get', b'a', b'b']),
+                      [b'client_error', b'wrong number of arguments'])
+        assert_equals(execute([b'multi_get']), [b'ok'])
+        assert_equals(execute([b'multi_hset']),
+                      [b'client_error', b'wrong number of arguments'])
+
+    @raises(TypeError)
+    def test_type_error_not_hidden(self):
+        BrokenStore().execute([b'get', b'a'])
+
+    def test_concurrent_counts(self):
+        clients = [self.server.client() for i in range(8)]
+
+        def run(client):
+            for i in range(200):
+                client.get('a')
+        threads = [threading.Thread(target=run, args=(client,))
+                   for client in clients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert_equals(self.server.commands['get'], 8 * 200)
+        assert_equals(self.server.stats['requests'], 8 * 200)
@@ -0,0 +1,91 @@
+#coding=utf-8
+from nose.tools import assert_equals, assert_true, assert_false, raises
+from ssdb import SSDB
+from ssdb.exceptions import DataError
+from ssdb.fakeserver import FakeServer
+from ssdb.hyperloglog import HyperLogLog, estimate, pfcount
+
+
+class InterleavedSSDB(SSDB):
+    "Runs ``hook`` once, right before its next ``getset``"
+
+    hook = None
+
+    def execute_command(self, *args, **options):
+        if args[0] == 'getset' and self.hook is not None:
+            hook, self.hook = self.hook, None
+            hook()
+        return SSDB.execute_command(self, *args, **options)
+
+
+def within(value, expected, error):
+    return abs(value - expected) <= expected * error
+
+
+class TestHyperLogLog(object):
+
+    def setUp(self):
+        self.server = FakeServer().start()
+        self.client = InterleavedSSDB(port=self.server.port)
+        print('set UP')
+
+    def tearDown(self):
+        self.server.stop()
+        print('tear down')
+
+    def test_estimate(self):
+        assert_equals(estimate(bytearray(1 << 14)), 0)
+        hll = HyperLogLog(self.client, 'visitors')
+        hll.add_many(range(20000))
+        assert_true(within(hll.count(), 20000, 0.03))
+        assert_equals(self.client.strlen('visitors'), 1 << 14)
+
+    def test_small_counts(self):
+        hll = HyperLogLog(self.client, 'visitors', precision=10)
+        hll.add_many(['a', 'b', 'c', 'a'])
+        assert_equals(hll.count(), 3)
+
+    def test_local_aggregation(self):
+        hll = HyperLogLog(self.client, 'visitors')
+        for i in range(1000):
+            hll.add('user-%d' % i)
+        assert_equals(sum(self.server.commands.values()), 0)
+        assert_true(within(hll.count(), 1000, 0.03))
+        assert_true(hll.flush())
+        assert_equals(dict(self.server.commands), {'get': 2, 'getset': 1})
+        assert_false(hll.flush())
+
+    def test_flush_merges(self):
+        first = HyperLogLog(self.client, 'visitors')
+        first.add_many(range(0, 1000))
+        second = HyperLogLog(self.client, 'visitors')
+        second.add_many(range(500, 1500))
+        assert_true(within(first.count(), 1500, 0.03))
+
+    def test_concurrent_flush(self):
+        first = HyperLogLog(self.client, 'visitors')
+        second = HyperLogLog(self.client, 'visitors')
+        first.add(*range(1000))
+        second.add(*range(1000, 2000))
+        # second flushes between the get and the getset of first
+        self.client.hook = second.flush
+        first.flush()
+        assert_true(within(first.count(), 2000, 0.03))
+
+    def test_merge_and_pfcount(self):
+        for day, start in (('d1', 0), ('d2', 1000), ('d3', 1500)):
+            HyperLogLog(self.client, day).add_many(range(start, start + 1000))
+        assert_true(within(pfcount(self.client, 'd1', 'd2', 'd3', 'none'),
+                           2500, 0.03))
+        week = HyperLogLog(self.client, 'week')
+        week.merge('d1', 'd2')
+        assert_true(within(week.count(), 2000, 0.03))
+
+    @raises(DataError)
+    def test_precision_mismatch(self):
+        HyperLogLog(self.client, 'visitors', precision=10).add_many(['a'])
+        HyperLogLog(self.client, 'visitors').count()
+
+    @raises(ValueError)
+    def test_invalid_precision(self):
+        HyperLogLog(self.client, 'visitors', precision=20)
@@ -0,0 +1,145 @@
+#coding=utf-8
+import gc
+import time
+import weakref
+from nose.tools import assert_equals, assert_false, assert_is_none
+from ssdb.leaderboard import Leaderboard
+
+
+class BoardBatch(object):
+
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, command):
+        return lambda *args: self.commands.append((command, args))
+
+    def execute(self):
+        self.client.round_trips += 1
+        return [getattr(self.client, command)(*args)
+                for command, args in self.commands]
+
+
+class BoardClient(object):
+    "One zset, with the commands counted as round trips"
+
+    def __init__(self):
+        self.zset = {}
+        self.round_trips = 0
+
+    def batch(self):
+        return BoardBatch(self)
+
+    def _ordered(self, reverse=False):
+        return sorted(self.zset.items(), key=lambda item: (item[1], item[0]),
+                      reverse=reverse)
+
+    def multi_zset(self, name, **kvs):
+        self.round_trips += 1
+        self.zset.update(kvs)
+        return len(kvs)
+
+    def zincr(self, name, key, amount=1):
+        self.round_trips += 1
+        self.zset[key] = self.zset.get(key, 0) + amount
+        return self.zset[key]
+
+    def multi_zget(self, name, *keys):
+        return dict((key, self.zset[key]) for key in keys if key in self.zset)
+
+    def zrank(self, name, key, reverse=False):
+        for rank, (member, score) in enumerate(self._ordered(reverse)):
+            if member == key:
+                return rank
+        return -1
+
+    def zrrank(self, name, key):
+        return self.zrank(name, key, reverse=True)
+
+    def zrange(self, name, offset, limit, result_format=None, reverse=False):
+        self.round_trips += 1
+        items = self._ordered(reverse)[offset:offset + limit]
+        return [k for k, v in items], [v for k, v in items]
+
+    def zrrange(self, name, offset, limit, result_format=None):
+        return self.zrange(name, offset, limit, reverse=True)
+
+
+class TestLeaderboard(object):
+
+    def setUp(self):
+        self.client = BoardClient()
+        self.client.zset.update(('player%d' % i, i * 10) for i in range(20))
+        self.board = Leaderboard(self.client, 'game', top_size=5,
+                                 cache_ttl=0.2)
+        print('set UP')
+
+    def tearDown(self):
+        self.board.close()
+        print('tear down')
+
+    def test_ranks_and_scores(self):
+        assert_equals(self.board.ranks(['player19', 'player0', 'nobody']),
+                      {'player19': 0, 'player0': 19, 'nobody': None})
+        assert_equals(self.client.round_trips, 1)
+        assert_equals(self.board.scores(['player3', 'nobody']),
+                      {'player3': 30, 'nobody': None})
+        assert_equals(self.board.entries(['player18', 'nobody']),
+                      {'player18': (1, 180), 'nobody': None})
+        assert_equals(self.client.round_trips, 2)
+        assert_equals(self.board.ranks([]), {})
+
+    def test_rank_not_found(self):
+        # the client answers ``None`` rather than -1 for a missing member
+        self.client.zrrank = lambda name, key: None
+        assert_equals(self.board.ranks(['nobody']), {'nobody': None})
+        assert_equals(self.board.entries(['nobody']), {'nobody': None})
+
+    def test_ascending(self):
+        board = Leaderboard(self.client, 'game', reverse=False,
+                            cache_ttl=None)
+        assert_equals(board.ranks(['player0'])['player0'], 0)
+        assert_equals(board.top(2), [('player0', 0), ('player1', 10)])
+
+    def test_around(self):
+        assert_equals(self.board.around('player10', 2),
+                      [(7, 'player12', 120), (8, 'player11', 110),
+                       (9, 'player10', 100), (10, 'player9', 90),
+                       (11, 'player8', 80)])
+        assert_equals([rank for rank, _, _ in
+                       self.board.around('player18', 2)], [0, 1, 2, 3])
+        assert_equals(self.board.around('nobody'), [])
+
+    def test_top_cached(self):
+        assert_equals(self.board.top(2), [('player19', 190),
+                                          ('player18', 180)])
+        assert_equals(self.client.round_trips, 1)
+        for _ in range(100):
+            self.board.top()
+        assert_equals(self.client.round_trips, 1)
+        self.board.incr('player0', 1000)
+        # refreshed in the background within cache_ttl / 2
+        time.sleep(0.3)
+        assert_equals(self.board.top(1), [('player0', 1000)])
+
+    def test_dropped_board(self):
+        board = Leaderboard(self.client, 'game', top_size=5, cache_ttl=0.02)
+        board.top()
+        thread, ref = board._thread, weakref.ref(board)
+        del board
+        gc.collect()
+        assert_is_none(ref())
+        thread.join(1)
+        assert_false(thread.is_alive())
+
+    def test_top_beyond_cache(self):
+        assert_equals(len(self.board.top(10)), 10)
+        assert_is_none(self.board._thread)
+
+    def test_stale_cache(self):
+        self.board.top()
+        self.board.close()
+        self.board._top_time -= 1
+        self.board.set_scores(newcomer=5000)
+        assert_equals(self.board.top(1), [('newcomer', 5000)])
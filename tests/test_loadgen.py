@@ -0,0 +1,84 @@
+#coding=utf-8
+import json
+import os
+import tempfile
+from nose.tools import assert_equals, assert_true, raises
+from ssdb import loadgen
+from ssdb.fakeserver import FakeServer
+
+
+class TestLoadgen(object):
+
+    def setUp(self):
+        self.server = FakeServer().start()
+        self.connection = {'host': self.server.host, 'port': self.server.port}
+        print('set UP')
+
+    def tearDown(self):
+        self.server.stop()
+        print('tear down')
+
+    def test_parse_mix(self):
+        assert_equals(loadgen.parse_mix('get=9, set'),
+                      [('get', 9.0), ('set', 1.0)])
+
+    @raises(ValueError)
+    def test_unknown_command(self):
+        loadgen.parse_mix('get,flushdb')
+
+    def test_zipfian(self):
+        workload = loadgen.Workload('get', keyspace=1000,
+                                    distribution='zipfian', seed=1)
+        indexes = [workload.index() for _ in range(10000)]
+        assert_true(all(0 <= i < 1000 for i in indexes))
+        # the hottest key is drawn far more often than under uniform
+        assert_true(indexes.count(0) > 500)
+
+    def test_scan_within_prefix(self):
+        client = self.server.client()
+        workload = loadgen.Workload('scan', keyspace=3, seed=1)
+        client.multi_set(**dict((workload.key(), '1') for _ in range(20)))
+        client.multi_set(unrelated='1', zzz='1')
+        scanned = loadgen.COMMANDS['scan'](client, workload, workload.prefix)
+        assert_true(scanned)
+        assert_true(all(key.startswith(workload.prefix) for key in scanned))
+
+    def test_percentile(self):
+        latencies = list(range(1, 1001))
+        assert_equals(loadgen.percentile(latencies, 0.5), 500)
+        assert_equals(loadgen.percentile(latencies, 0.999), 999)
+        assert_equals(loadgen.percentile([], 0.5), 0.0)
+
+    def test_run(self):
+        workload = {'mix': 'set=1,get=1,hset=1,zset=1,qpush=1,scan=1',
+                    'keyspace': 100, 'seed': 7}
+        report = loadgen.run(self.connection, workload, clients=3,
+                             requests=301, pipeline=8)
+        summary = report.summary()
+        assert_equals(summary['total']['requests'], 301)
+        assert_equals(summary['errors'], 0)
+        assert_equals(sum(stats['requests'] for stats in
+                          summary['commands'].values()), 301)
+        # batches of up to 8 commands per round trip
+        assert_true(self.server.stats['round_trips'] < 60)
+        assert_true(self.server.store.execute([b'dbsize'])[1] != b'0')
+
+    def test_errors_counted(self):
+        self.server.inject('error', count=5, command='get')
+        report = loadgen.run(self.connection, {'mix': 'get'}, clients=1,
+                             requests=10)
+        assert_equals(report.summary()['errors'], 5)
+
+    def test_main(self):
+        fd, path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        try:
+            assert_equals(loadgen.main(
+                ['-p', str(self.server.port), '-c', '2', '-n', '50',
+                 '--mix', 'incr', '--json', path]), 0)
+            with open(path) as f:
+                summary = json.load(f)
+        finally:
+            os.remove(path)
+        assert_equals(summary['commands']['incr']['requests'], 50)
+        assert_true(summary['total']['p999'] >= summary['total']['p50'])
@@ -0,0 +1,171 @@
+#coding=utf-8
+import time
+from threading import Thread
+from nose.tools import (assert_equals, assert_true, assert_false,
+                        assert_is_none, raises)
+from ssdb.exceptions import LockError
+from ssdb.lock import Lock
+from ssdb.client import SSDB
+
+
+class KVBatch(object):
+
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, command):
+        return lambda *args: self.commands.append((command, args))
+
+    def execute(self):
+        return [getattr(self.client, command)(*args)
+                for command, args in self.commands]
+
+
+class KVClient(object):
+    "Just enough of StrictSSDB to drive a Lock, ttl are kept not enforced"
+
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+
+    def batch(self):
+        return KVBatch(self)
+
+    def setnx(self, name, value):
+        if name in self.data:
+            return False
+        self.data[name] = value
+        return True
+
+    def get(self, name):
+        return self.data.get(name)
+
+    def delete(self, name):
+        self.ttls.pop(name, None)
+        return self.data.pop(name, None) is not None
+
+    def exists(self, name):
+        return name in self.data
+
+    def expire(self, name, ttl):
+        if name not in self.data:
+            return False
+        self.ttls[name] = ttl
+        return True
+
+    def ttl(self, name):
+        return self.ttls.get(name, -1)
+
+    def incr(self, name, amount=1):
+        self.data[name] = int(self.data.get(name, 0)) + amount
+        return self.data[name]
+
+
+class TestLock(object):
+
+    def setUp(self):
+        self.client = KVClient()
+        print('set UP')
+
+    def tearDown(self):
+        print('tear down')
+
+    def test_acquire_release(self):
+        lock = Lock(self.client, 'foo', timeout=10)
+        assert_true(lock.acquire(blocking=False))
+        assert_true(lock.locked())
+        assert_true(lock.owned())
+        assert_equals(self.client.ttls['foo'], 10)
+        lock.release()
+        assert_false(lock.locked())
+
+    def test_competing_locks(self):
+        lock1 = Lock(self.client, 'foo')
+        lock2 = Lock(self.client, 'foo')
+        assert_true(lock1.acquire(blocking=False))
+        assert_false(lock2.acquire(blocking=False))
+        assert_false(lock2.acquire(blocking_timeout=0.05))
+        lock1.release()
+        assert_true(lock2.acquire(blocking=False))
+        lock2.release()
+
+    def test_fencing_tokens(self):
+        lock = Lock(self.client, 'foo')
+        with lock:
+            first = lock.fence
+        with lock:
+            second = lock.fence
+        assert_equals(first, 1)
+        assert_equals(second, 2)
+
+    def test_context_manager(self):
+        with Lock(self.client, 'foo', timeout=5) as lock:
+            assert_true(lock.locked())
+        assert_false(lock.locked())
+
+    @raises(LockError)
+    def test_context_manager_timeout(self):
+        Lock(self.client, 'foo').acquire()
+        with Lock(self.client, 'foo', blocking_timeout=0.05):
+            pass
+
+    @raises(LockError)
+    def test_release_unlocked(self):
+        Lock(self.client, 'foo').release()
+
+    @raises(LockError)
+    def test_release_not_owned(self):
+        lock = Lock(self.client, 'foo', timeout=1)
+        lock.acquire()
+        # the lease ran out and somebody else took the lock
+        self.client.delete('foo')
+        Lock(self.client, 'foo').acquire()
+        lock.release()
+
+    def test_extend(self):
+        lock = Lock(self.client, 'foo', timeout=10)
+        lock.acquire()
+        lock.extend(60)
+        assert_equals(self.client.ttls['foo'], 60)
+        lock.release()
+
+    def test_stale_lock_gets_a_ttl(self):
+        self.client.setnx('foo', 'dead client')
+        assert_false(Lock(self.client, 'foo', timeout=7).acquire(
+            blocking=False))
+        assert_equals(self.client.ttls['foo'], 7)
+
+    def test_blocking_acquire(self):
+        holder = Lock(self.client, 'foo', thread_local=False)
+        holder.acquire()
+        Thread(target=lambda: (time.sleep(0.1), holder.release())).start()
+        start = time.time()
+        assert_true(Lock(self.client, 'foo', sleep=0.01).acquire(
+            blocking_timeout=2))
+        assert_true(time.time() - start >= 0.09)
+
+    def test_auto_renewal(self):
+        lock = Lock(self.client, 'foo', timeout=1, auto_renewal=True)
+        lock.acquire()
+        self.client.ttls['foo'] = 0
+        time.sleep(0.5)
+        assert_equals(self.client.ttls['foo'], 1)
+        lock.release()
+        assert_equals(lock._renewals, {})
+
+    def test_thread_local(self):
+        lock = Lock(self.client, 'foo')
+        lock.acquire()
+        tokens = []
+        thread = Thread(target=lambda: tokens.append(lock.token))
+        thread.start()
+        thread.join()
+        assert_is_none(tokens[0])
+        lock.release()
+
+    def test_client_lock(self):
+        lock = SSDB().lock('foo', timeout=3, blocking_timeout=1)
+        assert_true(isinstance(lock, Lock))
+        assert_equals(lock.timeout, 3)
+        assert_equals(lock.blocking_timeout, 1)
@@ -0,0 +1,113 @@
+#coding=utf-8
+from nose.tools import assert_equals, assert_true, raises
+import ssdb
+from ssdb.fakeserver import FakeServer
+from ssdb.namespace import Namespace, NamespacedSSDB, NamespacedStrictSSDB
+
+
+class TestNamespace(object):
+
+    def setUp(self):
+        self.server = FakeServer().start()
+        self.client = self.server.client()
+        self.client.multi_set(a='0', z='0')
+        self.client.multi_hset('h', a='0')
+        self.tenant = NamespacedSSDB(
+            't1:', connection_pool=self.client.connection_pool)
+        self.other = NamespacedStrictSSDB(
+            't2:', connection_pool=self.client.connection_pool)
+        print('set UP')
+
+    def tearDown(self):
+        self.server.stop()
+        print('tear down')
+
+    def test_args(self):
+        namespace = Namespace(u't1:')
+        assert_equals(namespace.args(('get', 'a')), ('get', b't1:a'))
+        assert_equals(namespace.args(('hset', u'h', 'k', 'v')),
+                      ('hset', b't1:h', 'k', 'v'))
+        assert_equals(namespace.args(('multi_set', 'a', '1', 2, '2')),
+                      ('multi_set', b't1:a', '1', b't1:2', '2'))
+        assert_equals(namespace.args(('keys', '', 'b', 10)),
+                      ('keys', b't1:', b't1:b', 10))
+        assert_equals(namespace.args(('rscan', '', '', 10)),
+                      ('rscan', b't1;', b't1:', 10))
+        assert_equals(namespace.strip([b't1:a', b't1:bc']), [b'a', b'bc'])
+
+    @raises(ssdb.DataError)
+    def test_unknown_command(self):
+        self.tenant.execute_command('flushdb')
+
+    @raises(ValueError)
+    def test_empty_prefix(self):
+        Namespace('')
+
+    @raises(ssdb.DataError)
+    def test_empty_name(self):
+        self.tenant.set('', '1')
+
+    def test_bounds(self):
+        for name in (b't1', b't1:', b't1:\xff', b't1:\xff\x01', b't1;'):
+            self.client.set(name, '1')
+            self.client.hset(name, 'k', '1')
+        names = [b'\xff', b'\xff\x01']
+        assert_equals(self.tenant.keys('', '', 10), names)
+        assert_equals(self.tenant.hlist('', '', 10), names)
+        assert_equals(self.tenant.hrlist('', '', 10), names[::-1])
+        assert_equals(list(self.tenant.scan('', '', 10).keys()), names)
+        assert_equals(list(self.tenant.rscan('', '', 10).keys()),
+                      names[::-1])
+
+    def test_kv(self):
+        assert_true(self.tenant.set('a', '1'))
+        self.tenant.multi_set(b='2', c='3')
+        self.other.set('a', 'other')
+        assert_equals(self.client.get('t1:a'), '1')
+        assert_equals(self.tenant.get('a'), '1')
+        assert_equals(self.other.get('a'), 'other')
+        assert_equals(self.tenant.multi_get('a', 'c', 'x'),
+                      {'a': '1', 'c': '3'})
+        assert_equals(self.tenant.keys('', '', 10), ['a', 'b', 'c'])
+        assert_equals(self.tenant.keys('a', '', 10), ['b', 'c'])
+        assert_equals(list(self.tenant.scan('', '', 10).items()),
+                      [('a', '1'), ('b', '2'), ('c', '3')])
+        assert_equals(list(self.tenant.rscan('', '', 2).keys()), ['c', 'b'])
+        assert_equals(self.tenant.scan('', '', 10, result_format='pairs')[0],
+                      ['a', 'b', 'c'])
+        assert_equals(self.tenant.multi_del('a', 'b'), 2)
+        assert_equals(self.client.keys('', '', 10),
+                      ['a', 't1:c', 't2:a', 'z'])
+
+    def test_structures(self):
+        self.tenant.multi_hset('h', a='1')
+        self.tenant.hset('g', 'a', '1')
+        self.tenant.zset('z', 'm', 5)
+        self.tenant.qpush_back('q', 'x')
+        self.other.zset('y', 'm', 1)
+        assert_equals(self.tenant.hgetall('h'), {'a': '1'})
+        assert_equals(self.tenant.hlist('', '', 10), ['g', 'h'])
+        assert_equals(self.tenant.hrlist('', '', 10), ['h', 'g'])
+        assert_equals(self.tenant.zlist('', '', 10), ['z'])
+        assert_equals(self.other.zrlist('', '', 10), ['y'])
+        assert_equals(self.tenant.qlist('', '', 10), ['q'])
+        assert_equals(self.tenant.qpop_front('q'), ['x'])
+        assert_equals(self.client.hlist('', '', 10), ['h', 't1:g', 't1:h'])
+
+    def test_batch(self):
+        with self.tenant.batch() as batch:
+            batch.set('a', '1')
+            batch.zset('z', 'm', 2)
+            batch.keys('', '', 10)
+            batch.setx('b', '2', 60)
+            assert_equals(batch.execute(), [True, True, ['a'], True])
+        batch = self.other.batch()
+        batch.set('a', '2')
+        batch.get('a')
+        assert_equals(batch.execute(), [True, '2'])
+        assert_equals(self.client.zget('t1:z', 'm'), 2)
+
+    def test_lock(self):
+        with self.tenant.lock('job'):
+            assert_true(self.client.exists('t1:job'))
+        assert_true(not self.client.exists('t1:job'))
@@ -0,0 +1,125 @@
+#coding=utf-8
+from nose.tools import assert_equals, assert_true, assert_false, raises
+from ssdb.bloom import LocalBloomFilter
+from ssdb.fakeserver import FakeServer
+from ssdb.namespace import NamespacedSSDB
+from ssdb.negativecache import ABSENT, NegativeCache
+
+
+class TestNegativeCache(object):
+
+    def setUp(self):
+        self.server = FakeServer().start()
+        self.client = self.server.client()
+        self.client.multi_set(a='1', b='2')
+        self.client.multi_hset('users', alice='1')
+        print('set UP')
+
+    def tearDown(self):
+        self.server.stop()
+        print('tear down')
+
+    def cached(self, cache):
+        return self.server.client(negative_cache=cache)
+
+    def test_local_bloom(self):
+        bloom = LocalBloomFilter(1000, 0.01)
+        assert_true(bloom.add('a'))
+        assert_false(bloom.add('a'))
+        assert_true('a' in bloom)
+        assert_false('b' in bloom)
+        assert_equals(len(bloom), 1)
+
+    def test_misses(self):
+        cache = NegativeCache(ttl=10)
+        now = [100.0]
+        cache._time = lambda: now[0]
+        client = self.cached(cache)
+        assert_equals(client.get('x'), None)
+        assert_equals(client.get('x'), None)
+        assert_false(client.hexists('users', 'bob'))
+        assert_false(client.hexists('users', 'bob'))
+        assert_equals(self.server.commands['get'], 1)
+        assert_equals(self.server.commands['hexists'], 1)
+        assert_equals(cache.stats, {'filtered': 0, 'cached': 2, 'misses': 2})
+        # a write through the client forgets the miss
+        client.set('x', '1')
+        assert_equals(client.get('x'), '1')
+        now[0] += 11
+        assert_equals(client.get('y'), None)
+        now[0] += 11
+        assert_equals(client.get('y'), None)
+        assert_equals(self.server.commands['get'], 4)
+
+    def test_max_size(self):
+        cache = NegativeCache(max_size=2)
+        client = self.cached(cache)
+        for name in ('x', 'y', 'z', 'x'):
+            client.get(name)
+        assert_equals(self.server.commands['get'], 4)
+        assert_equals(len(cache.misses), 2)
+
+    def test_filter(self):
+        cache = NegativeCache(ttl=None, capacity=1000)
+        client = self.cached(cache)
+        assert_equals(client.get('x'), None)
+        cache.rebuild(client, hashes=['users'], page_size=1)
+        assert_equals(client.get('a'), '1')
+        assert_equals(client.get('x'), None)
+        assert_false(client.exists('y'))
+        assert_equals(client.hget('users', 'alice'), '1')
+        assert_equals(client.hget('users', 'bob'), None)
+        # hashes not rebuilt are asked to the server
+        assert_equals(client.hget('other', 'bob'), None)
+        assert_equals(cache.stats['filtered'], 3)
+        assert_equals(self.server.commands['get'], 2)
+        assert_equals(self.server.commands['hget'], 2)
+        with client.batch() as batch:
+            batch.set('x', '3')
+            batch.hset('users', 'bob', '2')
+            batch.execute()
+        assert_equals(client.get('x'), '3')
+        assert_equals(client.hget('users', 'bob'), '2')
+        cache.clear()
+        assert_equals(client.get('y'), None)
+        assert_equals(self.server.commands['get'], 4)
+
+    @raises(ValueError)
+    def test_rebuild_needs_capacity(self):
+        NegativeCache().rebuild(self.client)
+
+    def test_write_during_lookup(self):
+        cache = NegativeCache(ttl=10)
+        lookup = ('get', 'x')
+        generation = cache.lookup(lookup)
+        # the miss comes back after a write of the key went out
+        cache.write(('set', 'x', '1'))
+        cache.record(lookup, None, generation)
+        assert_true(cache.lookup(lookup) is not ABSENT)
+        cache.record(lookup, None, cache.lookup(lookup))
+        assert_true(cache.lookup(lookup) is ABSENT)
+
+    def test_forgotten_writes(self):
+        cache = NegativeCache(ttl=10, max_size=1)
+        generation = cache.lookup(('get', 'x'))
+        cache.write(('set', 'x', '1'))
+        cache.write(('set', 'y', '1'))
+        cache.record(('get', 'x'), None, generation)
+        assert_equals(len(cache.misses), 0)
+
+    def test_namespace(self):
+        cache = NegativeCache(ttl=None, capacity=1000)
+        tenant = NamespacedSSDB('t1:', port=self.server.port,
+                                negative_cache=cache)
+        tenant.set('a', '1')
+        tenant.hset('h', 'f', '1')
+        cache.rebuild(tenant, hashes=['h'])
+        assert_equals(tenant.get('a'), '1')
+        assert_equals(tenant.hget('h', 'f'), '1')
+        assert_equals(tenant.get('b'), None)
+        assert_equals(tenant.hget('h', 'g'), None)
+        assert_equals(cache.stats['filtered'], 2)
+        with tenant.batch() as batch:
+            batch.set('b', '2')
+            batch.execute()
+        assert_equals(tenant.get('b'), '2')
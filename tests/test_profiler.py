@@ -0,0 +1,75 @@
+#coding=utf-8
+from nose.tools import assert_equals, assert_true, assert_false
+from ssdb import profiler
+from ssdb.client import StrictSSDB
+from ssdb.connection import Connection
+from ssdb.fakeserver import FakeServer
+
+ORIGINAL_PACK = Connection.__dict__['pack_command']
+
+
+class TestProfiler(object):
+
+    def setUp(self):
+        self.server = FakeServer().start()
+        self.client = self.server.client()
+        profiler.reset()
+        print('set UP')
+
+    def tearDown(self):
+        profiler.disable()
+        profiler.reset()
+        self.server.stop()
+        print('tear down')
+
+    def test_disabled_is_untouched(self):
+        assert_false(profiler.enabled())
+        self.client.set('a', '1')
+        assert_equals(profiler.stats(by_command=True), {})
+        profiler.enable()
+        assert_true(Connection.__dict__['pack_command'] is not ORIGINAL_PACK)
+        profiler.disable()
+        assert_true(Connection.__dict__['pack_command'] is ORIGINAL_PACK)
+
+    def test_phases(self):
+        with profiler.profile():
+            self.client.set('a', '1')
+            self.client.multi_get('a', 'b')
+        assert_false(profiler.enabled())
+        by_command = profiler.stats(by_command=True)
+        for command in ('set', 'multi_get'):
+            assert_equals(sorted(by_command[command]),
+                          sorted(profiler.PHASES))
+            assert_true(all(calls == 1 for calls, seconds in
+                            by_command[command].values()))
+        totals = profiler.stats()
+        assert_equals(totals['pack'][0], 2)
+        assert_true(totals['recv'][1] > 0)
+
+    def test_batch(self):
+        profiler.enable()
+        batch = self.client.batch()
+        batch.get('a')
+        batch.hgetall('h')
+        batch.execute()
+        strict = StrictSSDB(port=self.server.port).batch()
+        strict.get('a')
+        strict.execute()
+        by_command = profiler.stats(by_command=True)
+        assert_equals(by_command['batch']['send'][0], 2)
+        assert_equals(by_command['get']['callback'][0], 2)
+        assert_equals(by_command['hgetall']['parse'][0], 1)
+        assert_true('send' not in by_command['get'])
+
+    def test_reset(self):
+        profiler.enable()
+        self.client.get('a')
+        assert_true(profiler.stats()['pack'][0])
+        profiler.reset()
+        assert_equals(profiler.stats()['pack'], (0, 0.0))
+        self.client.get('a')
+        lines = profiler.report().split('\n')
+        assert_equals(lines[0].split(), ['phase', 'command', 'calls',
+                                         'seconds'])
+        assert_equals([line.split()[:3] for line in lines[1:]],
+                      [[phase, 'get', '1'] for phase in profiler.PHASES])
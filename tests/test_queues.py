@@ -0,0 +1,226 @@
+#coding=utf-8
+import time
+from nose.tools import assert_equals, assert_true, assert_is_none, raises
+from ssdb._compat import Full
+from ssdb.exceptions import DataError
+from ssdb.fakeserver import FakeServer
+from ssdb.queues import QueueConsumer, QueueProducer, ReliableQueue
+
+
+def drain(consumer, count, timeout=2):
+    result = []
+    deadline = time.time() + timeout
+    while len(result) < count and time.time() < deadline:
+        item = consumer.get(timeout=0.05)
+        if item is not None:
+            result.append(item)
+    return result
+
+
+class TestQueueConsumer(object):
+
+    def setUp(self):
+        self.server = FakeServer().start()
+        self.client = self.server.client()
+        print('set UP')
+
+    def tearDown(self):
+        self.server.stop()
+        print('tear down')
+
+    def test_consume_in_batches(self):
+        self.client.qpush_back('jobs', *range(100))
+        consumer = QueueConsumer(self.client, 'jobs', max_batch=50)
+        items = drain(consumer, 100)
+        consumer.close()
+        assert_equals(items, [('jobs', str(i)) for i in range(100)])
+        # one single item pop learns the backlog, then two full batches
+        assert_true(self.server.commands['qpop_front'] < 10)
+
+    def test_pop_back(self):
+        self.client.qpush_back('jobs', 1, 2, 3)
+        consumer = QueueConsumer(self.client, 'jobs', end='back')
+        items = drain(consumer, 3)
+        consumer.close()
+        assert_equals([item for name, item in items], ['3', '2', '1'])
+
+    def test_buffer_is_bounded(self):
+        self.client.qpush_back('jobs', *range(100))
+        consumer = QueueConsumer(self.client, 'jobs', buffer_size=10)
+        time.sleep(0.1)
+        assert_equals(len(consumer), 10)
+        assert_equals(self.client.qsize('jobs'), 90)
+        consumer.close(requeue=False)
+
+    def test_close_requeues(self):
+        self.client.qpush_back('jobs', *range(20))
+        consumer = QueueConsumer(self.client, 'jobs', buffer_size=5)
+        assert_equals(drain(consumer, 2), [('jobs', '0'), ('jobs', '1')])
+        consumer.close()
+        assert_equals(self.client.qrange('jobs', 0, 100),
+                      [str(i) for i in range(2, 20)])
+
+    def test_weighted_fairness(self):
+        self.client.qpush_back('high', *['h'] * 300)
+        self.client.qpush_back('low', *['l'] * 300)
+        consumer = QueueConsumer(self.client, ['high', 'low'],
+                                 weights={'high': 3}, max_batch=1,
+                                 buffer_size=1)
+        items = drain(consumer, 200, timeout=10)
+        consumer.close()
+        highs = len([1 for name, item in items if name == 'high'])
+        assert_true(140 <= highs <= 160, highs)
+
+    def test_empty_queue_backs_off(self):
+        consumer = QueueConsumer(self.client, 'jobs', min_wait=0.05,
+                                 max_wait=0.2)
+        time.sleep(0.5)
+        assert_is_none(consumer.get(block=False))
+        consumer.close()
+        # 0.05 + 0.1 + 0.2 + 0.2 ... instead of spinning
+        pops = self.server.commands['qpop_front']
+        assert_true(pops <= 6, pops)
+
+
+class TestQueueProducer(object):
+
+    def setUp(self):
+        self.server = FakeServer().start()
+        self.client = self.server.client()
+        print('set UP')
+
+    def tearDown(self):
+        self.server.stop()
+        print('tear down')
+
+    def queue(self, name):
+        return self.client.qrange(name, 0, 100)
+
+    def test_chunk_size(self):
+        producer = QueueProducer(self.client, chunk_size=10)
+        for i in range(25):
+            producer.put('jobs', i)
+        assert_equals(self.queue('jobs'), [str(i) for i in range(20)])
+        assert_equals(len(producer), 5)
+        producer.close()
+        assert_equals(self.queue('jobs'), [str(i) for i in range(25)])
+        assert_equals(self.server.commands['qpush_back'], 3)
+
+    def test_chunk_bytes(self):
+        producer = QueueProducer(self.client, chunk_size=100, chunk_bytes=10)
+        producer.put('jobs', 'abcd', 'efgh', 'ijkl')
+        producer.close()
+        assert_equals(self.queue('jobs'), ['abcd', 'efgh', 'ijkl'])
+        assert_equals(self.server.commands['qpush_back'], 2)
+
+    def test_pipelined_flush(self):
+        with QueueProducer(self.client) as producer:
+            producer.put('a', 1, 2)
+            producer.put('b', 3)
+            producer.put('c', 4)
+            round_trips = self.server.stats['round_trips']
+        assert_equals(self.server.stats['round_trips'] - round_trips, 1)
+        assert_equals([self.queue(name) for name in 'abc'],
+                      [['1', '2'], ['3'], ['4']])
+
+    def test_failed_chunk_kept(self):
+        producer = QueueProducer(self.client, chunk_size=2)
+        self.server.inject('error', command='qpush_back')
+        try:
+            producer.put('jobs', 0, 1, 2, 3)
+        except DataError:
+            pass
+        else:
+            raise AssertionError('the refused chunk was not reported')
+        # only the refused chunk is pushed again
+        assert_equals(len(producer), 2)
+        assert_equals(self.queue('jobs'), ['2', '3'])
+        producer.close()
+        assert_equals(self.queue('jobs'), ['2', '3', '0', '1'])
+
+    def test_push_front(self):
+        self.client.qpush_back('jobs', 9)
+        with QueueProducer(self.client, end='front') as producer:
+            producer.put('jobs', 1, 2)
+        assert_equals(self.queue('jobs'), ['2', '1', '9'])
+
+    @raises(Full)
+    def test_high_water(self):
+        producer = QueueProducer(self.client, chunk_size=5, high_water=5,
+                                 min_wait=0.01, max_wait=0.01)
+        producer.put('jobs', *range(5))
+        producer.put('jobs', 5, timeout=0.05)
+
+    def test_high_water_drained(self):
+        producer = QueueProducer(self.client, chunk_size=5, high_water=5,
+                                 low_water=2)
+        producer.put('jobs', *range(5))
+        self.client.qpop_front('jobs', 4)
+        producer.put('jobs', 5, timeout=0.05)
+        producer.close()
+        assert_equals(self.queue('jobs'), ['4', '5'])
+
+
+class TestReliableQueue(object):
+
+    def setUp(self):
+        self.server = FakeServer().start()
+        self.client = self.server.client()
+        self.client.qpush_back('jobs', 'a', 'b', 'c', 'd')
+        print('set UP')
+
+    def tearDown(self):
+        self.server.stop()
+        print('tear down')
+
+    def queue(self):
+        return self.client.qrange('jobs', 0, 100)
+
+    def test_pop_records_in_flight(self):
+        queue = ReliableQueue(self.client, 'jobs')
+        popped = queue.pop(3)
+        assert_equals([item for item_id, item in popped], ['a', 'b', 'c'])
+        ids = [item_id for item_id, item in popped]
+        assert_equals(len(set(ids)), 3)
+        assert_equals(dict(self.client.hgetall('jobs:inflight')),
+                      dict(popped))
+        assert_equals(sorted(self.client.zkeys('jobs:deadlines', '', '',
+                                               '', 10)),
+                      sorted(ids))
+        assert_equals(queue.pop(10)[0][1], 'd')
+        assert_equals(queue.pop(10), [])
+
+    def test_ack(self):
+        queue = ReliableQueue(self.client, 'jobs')
+        popped = queue.pop(4)
+        round_trips = self.server.stats['round_trips']
+        queue.ack(*[item_id for item_id, item in popped[:3]])
+        assert_equals(self.server.stats['round_trips'] - round_trips, 1)
+        assert_equals(list(self.client.hgetall('jobs:inflight').values()),
+                      ['d'])
+        assert_equals(self.client.zsize('jobs:deadlines'), 1)
+        assert_equals(queue.ack(), 0)
+
+    def test_requeue_expired(self):
+        queue = ReliableQueue(self.client, 'jobs', visibility_timeout=-1,
+                              requeue_limit=2)
+        popped = queue.pop(3)
+        queue.ack(popped[1][0])
+        assert_equals(queue.requeue_expired(), 2)
+        assert_equals(self.queue(), ['d', 'a', 'c'])
+        assert_equals(self.client.hsize('jobs:inflight'), 0)
+        assert_equals(self.client.zsize('jobs:deadlines'), 0)
+
+    def test_not_expired(self):
+        queue = ReliableQueue(self.client, 'jobs', visibility_timeout=60)
+        queue.pop(2)
+        assert_equals(queue.requeue_expired(), 0)
+        assert_equals(self.queue(), ['c', 'd'])
+
+    def test_background_requeue(self):
+        queue = ReliableQueue(self.client, 'jobs', visibility_timeout=-1,
+                              requeue_interval=0.01)
+        queue.pop(4)
+        time.sleep(0.2)
+        queue.close()
+        assert_equals(sorted(self.queue()), ['a', 'b', 'c', 'd'])
@@ -0,0 +1,146 @@
+#coding=utf-8
+from nose.tools import assert_equals, assert_true, assert_false, raises
+from ssdb import SSDB
+from ssdb.fakeserver import FakeServer
+from ssdb.ratelimit import (FixedWindowRateLimiter, SlidingWindowRateLimiter,
+                            TokenBucketRateLimiter)
+
+
+class InterleavedSSDB(SSDB):
+    "Runs ``hook`` once, right after its next ``get``"
+
+    hook = None
+
+    def get(self, name):
+        value = SSDB.get(self, name)
+        hook, self.hook = self.hook, None
+        if hook is not None:
+            hook()
+        return value
+
+
+class Clock(object):
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestRateLimit(object):
+
+    def setUp(self):
+        self.server = FakeServer().start()
+        self.client = self.server.client()
+        self.clock = Clock()
+        print('set UP')
+
+    def tearDown(self):
+        self.server.stop()
+        print('tear down')
+
+    def limiter(self, cls, *args, **kwargs):
+        client = kwargs.pop('client', self.client)
+        limiter = cls(client, 'api', *args, **kwargs)
+        limiter._time = self.clock
+        return limiter
+
+    def test_fixed_window(self):
+        limiter = self.limiter(FixedWindowRateLimiter, limit=3, window=60)
+        assert_equals([limiter.check('a') for _ in range(4)],
+                      [True, True, True, False])
+        assert_true(limiter.check('b'))
+        assert_equals(self.client.ttl('api:a:16'), 60)
+        self.clock.now += 60
+        assert_true(limiter.check('a'))
+
+    def test_fixed_window_refund(self):
+        limiter = self.limiter(FixedWindowRateLimiter, limit=3, window=60)
+        assert_true(limiter.check('a', 2))
+        assert_false(limiter.check('a', 2))
+        # the denied request gave its tokens back
+        assert_true(limiter.check('a'))
+        assert_false(limiter.check('a'))
+
+    def test_sliding_window(self):
+        limiter = self.limiter(SlidingWindowRateLimiter, limit=2, window=10)
+        assert_true(limiter.check('a'))
+        self.clock.now += 5
+        assert_true(limiter.check('a'))
+        assert_false(limiter.check('a'))
+        assert_equals(self.client.zsize('api:a'), 2)
+        # the first request slid out of the window
+        self.clock.now += 5
+        assert_true(limiter.check('a'))
+        assert_false(limiter.check('a'))
+        assert_equals(self.client.zsize('api:a'), 2)
+
+    def test_sliding_window_cost(self):
+        limiter = self.limiter(SlidingWindowRateLimiter, limit=5, window=1)
+        assert_true(limiter.check('a', 3))
+        assert_false(limiter.check('a', 3))
+        assert_true(limiter.check('a', 2))
+
+    def test_token_bucket(self):
+        limiter = self.limiter(TokenBucketRateLimiter, rate=10, capacity=5)
+        assert_equals([limiter.check('a') for _ in range(6)],
+                      [True] * 5 + [False])
+        # one token every 100ms
+        self.clock.now += 0.1
+        assert_true(limiter.check('a'))
+        assert_false(limiter.check('a'))
+        self.clock.now += 10
+        assert_true(limiter.check('a', 5))
+        assert_false(limiter.check('a'))
+        assert_false(limiter.check('b', 6))
+
+    def test_token_bucket_race(self):
+        client = InterleavedSSDB(port=self.server.port)
+        first = self.limiter(TokenBucketRateLimiter, rate=10, capacity=5,
+                             client=client)
+        second = self.limiter(TokenBucketRateLimiter, rate=10, capacity=5)
+        results = []
+        # both read the bucket before either writes, on a new key and
+        # after the bucket sat idle for an hour
+        for idle in (0, 3600):
+            self.clock.now += idle
+            client.hook = lambda: results.append(second.check('a'))
+            results.append(first.check('a'))
+            now = int(self.clock.now * 1000000)
+            assert_equals(int(self.client.get('api:a')), now + 2 * 100000)
+        assert_equals(results, [True] * 4)
+        # the 3 tokens left are still there
+        assert_equals([second.check('a') for _ in range(4)],
+                      [True] * 3 + [False])
+
+    def test_round_trips(self):
+        for cls, kwargs, command in (
+                (FixedWindowRateLimiter, dict(limit=5, window=1), 'incr'),
+                (SlidingWindowRateLimiter, dict(limit=5, window=1), 'zcount'),
+                (TokenBucketRateLimiter, dict(rate=5, capacity=5), 'getset')):
+            self.limiter(cls, **kwargs).check('a')
+            assert_equals(self.server.commands[command], 1)
+
+    def test_prefetch(self):
+        limiter = self.limiter(FixedWindowRateLimiter, limit=25, window=60,
+                               prefetch=10, prefetch_ttl=1)
+        assert_true(all(limiter.check('a') for _ in range(10)))
+        assert_equals(self.server.commands['incr'], 1)
+        assert_equals(self.client.get('api:a:16'), '10')
+        assert_true(all(limiter.check('a') for _ in range(10)))
+        assert_equals(self.server.commands['incr'], 2)
+        # less than a prefetch is left, fall back to single tokens
+        assert_true(all(limiter.check('a') for _ in range(5)))
+        assert_false(limiter.check('a'))
+        # and prefetched tokens expire
+        limiter = self.limiter(TokenBucketRateLimiter, rate=1, capacity=10,
+                               prefetch=5, prefetch_ttl=1)
+        assert_true(limiter.check('b'))
+        self.clock.now += 2
+        assert_true(limiter.check('b'))
+        assert_equals(self.server.commands['getset'], 2)
+
+    @raises(ValueError)
+    def test_invalid_cost(self):
+        self.limiter(FixedWindowRateLimiter, limit=1, window=1).check('a', 0)
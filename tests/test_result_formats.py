@@ -0,0 +1,62 @@
+#coding=utf-8
+from nose.tools import (assert_equals, assert_true, assert_false,
+                        assert_is_instance, raises)
+from ssdb.codecs import JSONCodec
+from ssdb.utils import ResponseView
+from ssdb.client import SSDB, parse_value_ordereddict, parse_scores
+
+
+class TestResultFormats(object):
+
+    def setUp(self):
+        self.response = ['b', '1', 'a', '2', 'c', '3']
+        print('set UP')
+
+    def tearDown(self):
+        print('tear down')
+
+    def test_response_view(self):
+        view = ResponseView(self.response)
+        assert_equals(len(view), 3)
+        assert_equals(list(view), ['b', 'a', 'c'])
+        assert_equals(view['a'], '2')
+        assert_true('c' in view)
+        assert_false('d' in view)
+        assert_equals(view.items(), [('b', '1'), ('a', '2'), ('c', '3')])
+        assert_equals(dict(view), {'a': '2', 'b': '1', 'c': '3'})
+
+    def test_response_view_convert(self):
+        view = ResponseView(self.response, int)
+        assert_equals(view['c'], 3)
+        assert_equals(view.values(), [1, 2, 3])
+
+    def test_parse_value_ordereddict(self):
+        result = parse_value_ordereddict(self.response, result_format='dict')
+        assert_equals(list(result.items()),
+                      [('b', '1'), ('a', '2'), ('c', '3')])
+        keys, values = parse_value_ordereddict(self.response,
+                                               result_format='pairs')
+        assert_equals(keys, ['b', 'a', 'c'])
+        assert_equals(values, ['1', '2', '3'])
+        view = parse_value_ordereddict(self.response, codec=JSONCodec(),
+                                       result_format='view')
+        assert_is_instance(view, ResponseView)
+        assert_equals(view['b'], 1)
+
+    def test_parse_scores(self):
+        keys, scores = parse_scores(self.response, result_format='pairs')
+        assert_equals(keys, ['b', 'a', 'c'])
+        assert_equals(scores, [1, 2, 3])
+        view = parse_scores(self.response, result_format='view')
+        assert_equals(view['a'], 2)
+
+    def test_client_result_format(self):
+        client = SSDB(result_format='pairs')
+        assert_equals(client._result_format(None), 'pairs')
+        assert_equals(client._result_format('view'), 'view')
+        assert_equals(client.batch().result_format, 'pairs')
+        assert_equals(SSDB()._result_format(None), 'dict')
+
+    @raises(ValueError)
+    def test_invalid_result_format(self):
+        SSDB(result_format='list')
@@ -0,0 +1,99 @@
+#coding=utf-8
+import warnings
+from nose.tools import assert_equals, assert_true, raises
+import ssdb
+from ssdb.fakeserver import FakeServer
+from ssdb.slowlog import SlowLog, SlowLimitWarning, reply_size
+
+
+class TestSlowLog(object):
+
+    def setUp(self):
+        self.server = FakeServer().start()
+        self.logged = []
+        self.slowlog = SlowLog(slower_than=0.05, larger_than=1000,
+                               max_len=3, callback=self.logged.append,
+                               limit_cap=100)
+        self.client = self.server.client(slowlog=self.slowlog)
+        print('set UP')
+
+    def tearDown(self):
+        self.server.stop()
+        print('tear down')
+
+    def test_fast_commands_not_logged(self):
+        self.client.set('a', '1')
+        self.client.get('a')
+        assert_equals(len(self.slowlog), 0)
+
+    def test_slow_command(self):
+        self.server.inject('slow', command='get', delay=0.1)
+        self.client.get('a')
+        entry, = self.slowlog.get()
+        assert_equals((entry.command, entry.args, entry.bytes,
+                       entry.elements), ('get', ['a'], 0, 0))
+        assert_true(entry.duration >= 0.1)
+        assert_equals(self.logged, [entry])
+
+    def test_large_reply(self):
+        self.client.multi_hset('h', **dict(('key%03d' % i, 'x' * 10)
+                                           for i in range(100)))
+        self.client.hgetall('h')
+        entry = self.slowlog.get(1)[0]
+        assert_equals(entry.command, 'hgetall')
+        assert_equals(entry.elements, 200)
+        assert_equals(entry.bytes, 100 * 6 + 100 * 10)
+
+    def test_ring_buffer(self):
+        self.slowlog.slower_than = 0
+        for i in range(5):
+            self.client.set('key%d' % i, i)
+        assert_equals([entry.args[0] for entry in self.slowlog],
+                      ['key4', 'key3', 'key2'])
+        assert_equals(self.slowlog.get(1)[0].id, 4)
+        self.slowlog.reset()
+        assert_equals(self.slowlog.get(), [])
+
+    def test_truncated_args(self):
+        self.slowlog.slower_than = 0
+        self.client.multi_set(**dict(('k%02d' % i, 'v' * 40)
+                                     for i in range(10)))
+        args = self.slowlog.get(1)[0].args
+        assert_equals(len(args), 9)
+        assert_equals(args[-1], '... (12 more arguments)')
+        assert_true('v' * 32 + '... (8 more)' in args)
+
+    def test_batch(self):
+        self.client.multi_hset('h', **dict(('key%03d' % i, 'x' * 10)
+                                           for i in range(100)))
+        batch = self.client.batch()
+        batch.set('a', '1')
+        batch.hgetall('h')
+        assert_equals(batch.execute()[0], True)
+        entry = self.slowlog.get(1)[0]
+        assert_equals((entry.command, entry.args),
+                      ('batch', ['set', 'hgetall']))
+        assert_equals((entry.bytes, entry.elements), (1 + 1600, 1 + 200))
+
+    def test_reply_size(self):
+        assert_equals(reply_size([]), (0, 0))
+        assert_equals(reply_size(['ok', 'abc']), (3, 1))
+
+    @raises(ssdb.DataError)
+    def test_limit_cap(self):
+        self.client.scan('', '', 1000)
+
+    @raises(ssdb.DataError)
+    def test_limit_cap_batch(self):
+        batch = self.client.batch()
+        batch.zscan('z', '', '', '', 101)
+
+    def test_limit_warning(self):
+        self.slowlog.limit_action = 'warn'
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            self.client.qpop_front('q', 500)
+            self.client.keys('', '', 100)
+        assert_equals(len(caught), 1)
+        assert_true(issubclass(caught[0].category, SlowLimitWarning))
+        assert_true(caught[0].filename.endswith('test_slowlog.py'))
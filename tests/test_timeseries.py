@@ -0,0 +1,140 @@
+#coding=utf-8
+from nose.tools import assert_equals, assert_is_none, raises
+from ssdb.timeseries import TimeSeries
+
+
+class ZsetBatch(object):
+
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, command):
+        return lambda *args, **kwargs: self.commands.append(
+            (command, args, kwargs))
+
+    def execute(self):
+        self.client.round_trips += 1
+        return [getattr(self.client, command)(*args, **kwargs)
+                for command, args, kwargs in self.commands]
+
+
+def in_range(score, start, end):
+    return (start == '' or score >= start) and (end == '' or score <= end)
+
+
+class ZsetClient(object):
+    "Zsets ordered by score then key, like SSDB"
+
+    def __init__(self):
+        self.zsets = {}
+        self.round_trips = 0
+        self.scans = 0
+
+    def batch(self):
+        return ZsetBatch(self)
+
+    def _sorted(self, name):
+        return sorted((score, key) for key, score in
+                      self.zsets.get(name, {}).items())
+
+    def multi_zset(self, name, **kvs):
+        self.zsets.setdefault(name, {}).update(kvs)
+        return len(kvs)
+
+    def zsize(self, name):
+        return len(self.zsets.get(name, {}))
+
+    def zscan(self, name, key_start, score_start, score_end, limit=10,
+              result_format=None):
+        self.scans += 1
+        items = [(score, key) for score, key in self._sorted(name)
+                 if in_range(score, score_start, score_end) and
+                 (score != score_start or key > key_start)][:limit]
+        return [key for score, key in items], [score for score, key in items]
+
+    def zcount(self, name, score_start, score_end):
+        return len([score for score, key in self._sorted(name)
+                    if in_range(score, score_start, score_end)])
+
+    def zremrangebyscore(self, name, score_start, score_end):
+        zset = self.zsets.get(name, {})
+        removed = [key for key, score in zset.items()
+                   if in_range(score, score_start, score_end)]
+        for key in removed:
+            del zset[key]
+        return len(removed)
+
+
+class TestTimeSeries(object):
+
+    def setUp(self):
+        self.client = ZsetClient()
+        print('set UP')
+
+    def tearDown(self):
+        print('tear down')
+
+    def test_add_flush(self):
+        series = TimeSeries(self.client, 'cpu', chunk_size=2)
+        with series:
+            series.add(10, 0.5)
+            series.add(20, 1)
+            series.add(30, 2.25)
+        assert_equals(self.client.round_trips, 1)
+        assert_equals(len(series), 3)
+        assert_equals([score for key, score in self.client.zsets['cpu'].items()
+                       if key.startswith('30:2.25:')], [30])
+        assert_equals(series.flush(), 0)
+
+    def test_range_pages(self):
+        series = TimeSeries(self.client, 'cpu', page_size=3)
+        # several points share a timestamp across page boundaries
+        series.add_many([(ts // 2, ts) for ts in range(20)])
+        timestamps, values = series.range()
+        assert_equals(list(timestamps), [ts // 2 for ts in range(20)])
+        assert_equals(sorted(values), [float(ts) for ts in range(20)])
+        assert_equals(self.client.scans, 7)
+        timestamps, values = series.range(3, 4)
+        assert_equals(list(timestamps), [3, 3, 4, 4])
+        assert_equals(series.count(3, 4), 4)
+
+    def test_aggregate(self):
+        series = TimeSeries(self.client, 'cpu')
+        series.add_many([(1, 1), (2, 2), (3, 6)])
+        assert_equals(series.aggregate(), 3.0)
+        assert_equals(series.aggregate(2, '', 'sum'), 8.0)
+        assert_equals(series.aggregate(aggregation='max'), 6.0)
+        assert_equals(series.aggregate(aggregation='count'), 3)
+        assert_is_none(series.aggregate(10, 20))
+
+    def test_same_point_twice(self):
+        series = TimeSeries(self.client, 'cpu')
+        series.add_many([(1, 0.5), (1, 0.5)])
+        TimeSeries(self.client, 'cpu').add_many([(1, 0.5)])
+        assert_equals(series.count(), 3)
+        assert_equals(series.aggregate(aggregation='sum'), 1.5)
+        assert_equals(list(series.range()[1]), [0.5, 0.5, 0.5])
+
+    @raises(ValueError)
+    def test_unknown_aggregation(self):
+        TimeSeries(self.client, 'cpu').aggregate(aggregation='median')
+
+    def test_downsample_rollup(self):
+        series = TimeSeries(self.client, 'cpu')
+        series.add_many([(ts, ts) for ts in range(0, 180, 10)])
+        timestamps, values = series.downsample(60)
+        assert_equals(list(timestamps), [0, 60, 120])
+        assert_equals(list(values), [25.0, 85.0, 145.0])
+        timestamps, values = series.downsample(60, 60, '', 'last')
+        assert_equals(list(values), [110.0, 170.0])
+        assert_equals(series.rollup('cpu:1m', 60, aggregation='min'), 3)
+        assert_equals(list(TimeSeries(self.client, 'cpu:1m').range()[1]),
+                      [0.0, 60.0, 120.0])
+
+    def test_retention(self):
+        series = TimeSeries(self.client, 'cpu', retention=100)
+        series.add_many([(ts, 1) for ts in range(0, 200, 10)])
+        assert_equals(list(series.range()[0]), list(range(90, 200, 10)))
+        assert_equals(series.trim(150), 6)
+        assert_equals(series.count(), 5)